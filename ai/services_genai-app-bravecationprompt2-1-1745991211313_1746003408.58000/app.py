@@ -1,8 +1,15 @@
 import os
-import base64
+import json
+import time
+import hashlib
+import threading
+import collections
 from google import genai
 from google.genai import types
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+
+from mission_cache import MissionCache, geohash, time_bucket
+from mission_schema import Mission, MISSION_RESPONSE_SCHEMA
 
 # Initialize GenAI client
 client = genai.Client(
@@ -11,14 +18,36 @@ client = genai.Client(
     location="us-central1",
 )
 
-def generate_mission(
+# Structured output: the schema-constrained mission needs a few hundred tokens at most
+MISSION_MAX_OUTPUT_TOKENS = int(os.environ.get("MISSION_MAX_OUTPUT_TOKENS", "1024"))
+# Google Search grounding cannot be combined with response_schema on gemini-2.0;
+# when enabled the JSON shape is requested in the prompt only (and still validated)
+MISSION_GROUNDING = os.environ.get("MISSION_GROUNDING", "false").lower() == "true"
+
+# Mission cache: nearby travellers at the same time of day on the same trip share a pool of variants
+MISSION_CACHE_ENABLED = os.environ.get("MISSION_CACHE_ENABLED", "true").lower() == "true"
+MISSION_CACHE_GEOHASH_PRECISION = int(os.environ.get("MISSION_CACHE_GEOHASH_PRECISION", "6"))
+MISSION_CACHE_TIME_BUCKET_HOURS = int(os.environ.get("MISSION_CACHE_TIME_BUCKET_HOURS", "1"))
+MISSION_CACHE_POOL_SIZE = int(os.environ.get("MISSION_CACHE_POOL_SIZE", "3"))
+MISSION_CACHE_TTL_SECONDS = int(os.environ.get("MISSION_CACHE_TTL_SECONDS", "3600"))
+MISSION_CACHE_MAX_KEYS = int(os.environ.get("MISSION_CACHE_MAX_KEYS", "2048"))
+MISSION_CACHE_PREFETCH_WORKERS = int(os.environ.get("MISSION_CACHE_PREFETCH_WORKERS", "2"))
+
+mission_cache = MissionCache(
+    pool_size=MISSION_CACHE_POOL_SIZE,
+    ttl_seconds=MISSION_CACHE_TTL_SECONDS,
+    max_keys=MISSION_CACHE_MAX_KEYS,
+    prefetch_workers=MISSION_CACHE_PREFETCH_WORKERS,
+) if MISSION_CACHE_ENABLED else None
+
+def build_generation_request(
     latitude,
     longitude,
     traveler_information,
     current_time,
     trip_information
 ):
-    """Generate mission content based on parameters."""
+    """Model name, contents and config shared by the blocking and streaming calls."""
     
     prompt_text = f"""{latitude}{longitude}{traveler_information}{current_time}{trip_information}
 
@@ -35,13 +64,13 @@ Your mission recommendation must:
 - Be either game-based (competition/cooperation) OR experience-based (cultural/social interaction)
 - Be safe and legal
 
-Present your ONE mission recommendation in this format:
-1. MISSION NAME: [Catchy title]
-2. TYPE: [Game OR Experience]
-3. DURATION: [Time needed]
-4. ITEMS NEEDED: [Simple items travelers likely have]
-5. HOW TO PLAY: [Brief, bullet-point instructions]
-6. PD'S TIP: [Short enthusiastic comment]
+Present your ONE mission recommendation as a JSON object with these fields:
+- name: catchy title
+- type: "Game" or "Experience"
+- duration_minutes: time needed, in minutes
+- items_needed: simple items travelers likely have
+- how_to_play: brief instructions, one short step per entry
+- pd_tip: short enthusiastic comment
 
 Keep explanations direct and concise. Respond in English only."""
 
@@ -53,11 +82,14 @@ Keep explanations direct and concise. Respond in English only."""
         ),
     ]
 
-    tools = [types.Tool(google_search=types.GoogleSearch())]
+    if MISSION_GROUNDING:
+        output_config = {"tools": [types.Tool(google_search=types.GoogleSearch())]}
+    else:
+        output_config = {"response_mime_type": "application/json", "response_schema": MISSION_RESPONSE_SCHEMA}
     generate_content_config = types.GenerateContentConfig(
         temperature=1,
         top_p=0.95,
-        max_output_tokens=8192,
+        max_output_tokens=MISSION_MAX_OUTPUT_TOKENS,
         response_modalities=["TEXT"],
         safety_settings=[
             types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
@@ -65,41 +97,157 @@ Keep explanations direct and concise. Respond in English only."""
             types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
             types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
         ],
-        tools=tools,
+        **output_config,
     )
+    return model, contents, generate_content_config
 
+def generate_mission(**mission_args):
+    """Generate a mission based on parameters; returns the validated mission as a dict."""
+    model, contents, generate_content_config = build_generation_request(**mission_args)
     response = client.models.generate_content(
         model=model,
         contents=contents,
         config=generate_content_config,
     )
     
-    return response.text
+    return Mission.from_model_output(response.text).to_dict()
+
+def generate_mission_stream(**mission_args):
+    """Yield raw JSON text chunks as the model produces them (validate the joined text afterwards)."""
+    model, contents, generate_content_config = build_generation_request(**mission_args)
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        if chunk.text:
+            yield chunk.text
+
+def mission_cache_key(latitude, longitude, current_time, trip_information, brave_scale):
+    """(geohash cell, time-of-day bucket, trip, brave level), or None if the location is unusable."""
+    try:
+        cell = geohash(float(latitude), float(longitude), MISSION_CACHE_GEOHASH_PRECISION)
+    except (TypeError, ValueError):
+        return None
+    return (cell, time_bucket(current_time, MISSION_CACHE_TIME_BUCKET_HOURS), trip_information, str(brave_scale))
+
+
+def mission_user_key(data):
+    """Who the no-repeat rule applies to: the caller's user_id, else a hash of the traveler details."""
+    user_id = data.get('user_id')
+    if user_id:
+        return f"user:{user_id}"
+    return "traveler:" + hashlib.sha256(str(data.get('traveler_information', '')).encode('utf-8')).hexdigest()
 
 # Create Flask app
 app = Flask(__name__)
 
+def mission_args(data):
+    return {
+        "latitude": data.get('latitude', ''),
+        "longitude": data.get('longitude', ''),
+        "traveler_information": data.get('traveler_information', ''),
+        "current_time": data.get('current_time', ''),
+        "trip_information": data.get('trip_information', ''),
+    }
+
+def request_cache_key(data):
+    if not mission_cache:
+        return None
+    return mission_cache_key(data.get('latitude', ''), data.get('longitude', ''), data.get('current_time', ''),
+                             data.get('trip_information', ''), data.get('brave_scale', ''))
+
+# Time-to-first-byte / total time of streamed generations
+_stream_metrics = collections.Counter()
+_stream_metrics_lock = threading.Lock()
+
+def record_stream_timing(ttfb_ms, total_ms, cache_hit):
+    with _stream_metrics_lock:
+        _stream_metrics["streams"] += 1
+        _stream_metrics["cache_hits"] += int(cache_hit)
+        _stream_metrics["ttfb_ms_total"] += ttfb_ms
+        _stream_metrics["ttfb_ms_max"] = max(_stream_metrics["ttfb_ms_max"], ttfb_ms)
+        _stream_metrics["total_ms_total"] += total_ms
+    print(f"Mission stream: ttfb={ttfb_ms} ms, total={total_ms} ms, cache_hit={cache_hit}")
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
 @app.route('/api/mission', methods=['POST'])
 def mission_api():
     data = request.json
     try:
-        latitude = data.get('latitude', '')
-        longitude = data.get('longitude', '')
-        traveler_information = data.get('traveler_information', '')
-        current_time = data.get('current_time', '')
-        trip_information = data.get('trip_information', '')
-        
-        mission_text = generate_mission(
-            latitude=latitude,
-            longitude=longitude,
-            traveler_information=traveler_information,
-            current_time=current_time,
-            trip_information=trip_information
-        )
-        return jsonify({"status": "success", "mission": mission_text})
+        args = mission_args(data)
+
+        def generate():
+            return generate_mission(**args)
+
+        cache_key = request_cache_key(data)
+        if cache_key is None:
+            mission, cache_status = generate(), "BYPASS"
+        else:
+            mission, hit = mission_cache.get_or_generate(cache_key, mission_user_key(data), generate)
+            cache_status = "HIT" if hit else "MISS"
+        response = jsonify({"status": "success", "mission": mission})
+        response.headers["X-Mission-Cache"] = cache_status
+        return response
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/mission/stream', methods=['POST'])
+def mission_stream_api():
+    """Server-sent events: `chunk` events with raw JSON text as it is generated, then `done` (validated mission + timings) or `error`."""
+    data = request.json or {}
+    args = mission_args(data)
+    user_key = mission_user_key(data)
+    cache_key = request_cache_key(data)
+    started = time.perf_counter()
+
+    def generate():
+        return generate_mission(**args)
+
+    cached = mission_cache.take(cache_key, user_key, generate) if cache_key is not None else None
+
+    def events():
+        ttfb_ms = None
+        parts = []
+        try:
+            chunks = [json.dumps(cached, ensure_ascii=False)] if cached is not None else generate_mission_stream(**args)
+            for text in chunks:
+                if ttfb_ms is None:
+                    ttfb_ms = int((time.perf_counter() - started) * 1000)
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
+            mission = cached if cached is not None else Mission.from_model_output("".join(parts)).to_dict()
+            total_ms = int((time.perf_counter() - started) * 1000)
+            if cache_key is not None and cached is None:
+                mission_cache.add(cache_key, user_key, mission, generate)
+            record_stream_timing(ttfb_ms if ttfb_ms is not None else total_ms, total_ms, cached is not None)
+            yield sse_event("done", {"status": "success", "mission": mission, "ttfb_ms": ttfb_ms, "total_ms": total_ms})
+        except Exception as e:
+            yield sse_event("error", {"status": "error", "message": str(e)})
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["X-Mission-Cache"] = "BYPASS" if cache_key is None else ("HIT" if cached is not None else "MISS")
+    return response
+
+@app.route('/api/mission/stream-stats', methods=['GET'])
+def mission_stream_stats():
+    with _stream_metrics_lock:
+        stats = dict(_stream_metrics)
+    streams = stats.get("streams", 0)
+    stats["avg_ttfb_ms"] = stats.get("ttfb_ms_total", 0) / streams if streams else 0.0
+    stats["avg_total_ms"] = stats.get("total_ms_total", 0) / streams if streams else 0.0
+    return jsonify({"status": "success", "stats": stats})
+
+@app.route('/api/mission/cache-stats', methods=['GET'])
+def mission_cache_stats():
+    if not mission_cache:
+        return jsonify({"status": "success", "enabled": False})
+    return jsonify({"status": "success", "enabled": True, "stats": mission_cache.stats()})
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Mission cache keyed by location cell, time-of-day bucket, trip and brave level.
+
+Travellers in the same neighbourhood, at the same time of day, on the same
+trip and brave level get missions from a small pool of pre-generated variants
+instead of a fresh grounded generate_content call. Each user is never served
+the same variant twice; once a user has seen every variant, a new one is
+generated for them and added to the pool. Pools that fall below their target
+size are topped up in the background. Whole pools expire after a TTL.
+"""
+import time
+import uuid
+import datetime
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude, longitude, precision=6):
+    """Standard geohash of a point (precision 6 is a ~1.2 km x 0.6 km cell)."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, value_range = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def time_bucket(current_time, bucket_hours=1):
+    """Local time-of-day bucket from the ISO timestamp the caller sends (already in the traveller's zone)."""
+    try:
+        hour = datetime.datetime.fromisoformat(str(current_time).replace("Z", "+00:00")).hour
+    except ValueError:
+        hour = datetime.datetime.utcnow().hour
+    return hour // bucket_hours
+
+
+class _Pool:
+    __slots__ = ("variants", "served", "created_at", "refilling")
+
+    def __init__(self, now):
+        self.variants = []  # [(variant_id, mission)]
+        self.served = collections.defaultdict(set)  # user_key -> {variant_id}
+        self.created_at = now
+        self.refilling = False
+
+
+class MissionCache:
+    """Per-key pools of mission variants with per-user no-repeat serving and TTL eviction."""
+
+    def __init__(self, pool_size=3, ttl_seconds=3600, max_keys=2048, prefetch_workers=2):
+        self.pool_size = pool_size
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._pools = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="mission-prefetch") if prefetch_workers else None
+
+    def get_or_generate(self, key, user_key, generate_fn):
+        """Serve an unseen cached variant for user_key, or call generate_fn() and cache its result.
+
+        Returns (mission, cache_hit).
+        """
+        mission = self.take(key, user_key, generate_fn)
+        if mission is not None:
+            return mission, True
+        mission = generate_fn()
+        self.add(key, user_key, mission, generate_fn)
+        return mission, False
+
+    def take(self, key, user_key, refill_fn=None):
+        """An unseen cached variant for user_key (marked as served), or None on a miss."""
+        with self._lock:
+            pool = self._live_pool(key, time.time())
+            seen = pool.served[user_key]
+            for variant_id, mission in pool.variants:
+                if variant_id not in seen:
+                    seen.add(variant_id)
+                    self._metrics["hits"] += 1
+                    self._schedule_refill(key, pool, refill_fn)
+                    return mission
+            self._metrics["misses"] += 1
+        return None
+
+    def add(self, key, user_key, mission, refill_fn=None):
+        """Cache a mission generated on a miss (already served to user_key)."""
+        variant_id = uuid.uuid4().hex
+        with self._lock:
+            pool = self._live_pool(key, time.time())
+            pool.variants.append((variant_id, mission))
+            if len(pool.variants) > self.pool_size:
+                # drop the oldest variant but remember it was served to this user
+                pool.variants.pop(0)
+            pool.served[user_key].add(variant_id)
+            self._schedule_refill(key, pool, refill_fn)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot.update(keys=len(self._pools),
+                            variants=sum(len(pool.variants) for pool in self._pools.values()))
+        lookups = snapshot.get("hits", 0) + snapshot.get("misses", 0)
+        snapshot["hit_ratio"] = snapshot.get("hits", 0) / lookups if lookups else 0.0
+        return snapshot
+
+    def _live_pool(self, key, now):
+        """Pool for key (created if missing or expired); caller holds the lock."""
+        pool = self._pools.get(key)
+        if pool is not None and now - pool.created_at >= self.ttl_seconds:
+            del self._pools[key]
+            self._metrics["expired"] += 1
+            pool = None
+        if pool is None:
+            pool = self._pools[key] = _Pool(now)
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+                self._metrics["evictions"] += 1
+        else:
+            self._pools.move_to_end(key)
+        return pool
+
+    def _schedule_refill(self, key, pool, generate_fn):
+        """Top the pool up to pool_size in the background (at most one refill per key); caller holds the lock."""
+        if self._executor is None or generate_fn is None or pool.refilling or len(pool.variants) >= self.pool_size:
+            return
+        pool.refilling = True
+        self._executor.submit(self._refill, key, pool, generate_fn)
+
+    def _refill(self, key, pool, generate_fn):
+        try:
+            while True:
+                with self._lock:
+                    if self._pools.get(key) is not pool or len(pool.variants) >= self.pool_size:
+                        return
+                mission = generate_fn()
+                with self._lock:
+                    pool.variants.append((uuid.uuid4().hex, mission))
+                    self._metrics["prefetched"] += 1
+        except Exception as e:
+            print(f"Mission cache prefetch failed for {key}: {e}")
+        finally:
+            with self._lock:
+                pool.refilling = False
@@ -0,0 +1,92 @@
+"""Mission response schema: what the model must return and the typed object callers receive.
+
+MISSION_RESPONSE_SCHEMA constrains generation (response_mime_type JSON +
+response_schema), so the model output is a single JSON object and
+Mission.from_model_output only has to json.loads and type-check it.
+"""
+import json
+from dataclasses import dataclass, asdict, field
+
+MISSION_TYPES = ("Game", "Experience")
+
+# OpenAPI-subset schema accepted by GenerateContentConfig.response_schema.
+# Field order matters for streaming: the name comes first so clients can show it early.
+MISSION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING", "description": "Catchy mission title, at most 8 words"},
+        "type": {"type": "STRING", "enum": list(MISSION_TYPES)},
+        "duration_minutes": {"type": "INTEGER", "description": "Time needed in minutes"},
+        "items_needed": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "Simple items travelers likely have"},
+        "how_to_play": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "2-5 short instructions"},
+        "pd_tip": {"type": "STRING", "description": "One short enthusiastic comment"},
+    },
+    "required": ["name", "type", "duration_minutes", "items_needed", "how_to_play", "pd_tip"],
+    "propertyOrdering": ["name", "type", "duration_minutes", "items_needed", "how_to_play", "pd_tip"],
+}
+
+
+class MissionValidationError(ValueError):
+    """The model output is not a valid mission object."""
+
+
+@dataclass
+class Mission:
+    name: str
+    type: str
+    duration_minutes: int
+    items_needed: list = field(default_factory=list)
+    how_to_play: list = field(default_factory=list)
+    pd_tip: str = ""
+
+    @classmethod
+    def from_model_output(cls, text):
+        text = (text or "").strip()
+        if text.startswith("```"):
+            # grounded calls cannot use response_schema and sometimes fence the JSON
+            text = text.strip("`").removeprefix("json").strip()
+        try:
+            data = json.loads(text)
+        except (TypeError, ValueError) as e:
+            raise MissionValidationError(f"Model output is not JSON: {e}")
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise MissionValidationError("Mission must be a JSON object")
+        name = _string(data, "name")
+        mission_type = _string(data, "type")
+        if mission_type not in MISSION_TYPES:
+            raise MissionValidationError(f"Mission type must be one of {MISSION_TYPES}, got {mission_type!r}")
+        duration = data.get("duration_minutes")
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration <= 0:
+            raise MissionValidationError("duration_minutes must be a positive number")
+        how_to_play = _string_list(data, "how_to_play")
+        if not how_to_play:
+            raise MissionValidationError("how_to_play must have at least one step")
+        return cls(
+            name=name,
+            type=mission_type,
+            duration_minutes=int(duration),
+            items_needed=_string_list(data, "items_needed"),
+            how_to_play=how_to_play,
+            pd_tip=str(data.get("pd_tip") or "").strip(),
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _string(data, key):
+    value = data.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise MissionValidationError(f"{key} must be a non-empty string")
+    return value.strip()
+
+
+def _string_list(data, key):
+    value = data.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise MissionValidationError(f"{key} must be a list of strings")
+    return [item.strip() for item in value if item.strip()]
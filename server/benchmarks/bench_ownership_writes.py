@@ -0,0 +1,82 @@
+"""Ownership-checked writes: SELECT-then-UPDATE (two round trips) vs. one conditional UPDATE.
+
+Runs the completion-image and travel-update write paths both ways against the
+database configured by the usual CLOUD_SQL_* variables. Every iteration is
+rolled back (outside the timed section), so the rows are left untouched; the
+mission and travel must belong to --user-id.
+
+    python server/benchmarks/bench_ownership_writes.py --user-id 1 --travel-id 10 --mission-id 42 [--runs 500]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common.db import connection  # noqa: E402
+
+
+def image_two_step(cursor, user_id, mission_id, travel_id):
+    cursor.execute("SELECT t.user_id FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s", (mission_id,))
+    owner = cursor.fetchone()
+    assert owner and owner['user_id'] == user_id
+    cursor.execute("UPDATE missions SET completion_image = %s, updated_at = NOW() WHERE id = %s", ("bench", mission_id))
+
+
+def image_single(cursor, user_id, mission_id, travel_id):
+    cursor.execute(
+        """UPDATE missions m JOIN travels t ON m.travel_id = t.id
+           SET m.completion_image = %s, m.updated_at = NOW() WHERE m.id = %s AND t.user_id = %s""",
+        ("bench", mission_id, user_id)
+    )
+    assert cursor.rowcount == 1
+
+
+def travel_two_step(cursor, user_id, mission_id, travel_id):
+    cursor.execute("SELECT user_id FROM travels WHERE id = %s", (travel_id,))
+    travel = cursor.fetchone()
+    assert travel and travel['user_id'] == user_id
+    cursor.execute("UPDATE travels SET title = %s, updated_at = NOW() WHERE id = %s AND user_id = %s", ("bench", travel_id, user_id))
+
+
+def travel_single(cursor, user_id, mission_id, travel_id):
+    cursor.execute("UPDATE travels SET title = %s, updated_at = NOW() WHERE id = %s AND user_id = %s", ("bench", travel_id, user_id))
+    assert cursor.rowcount == 1
+
+
+VARIANTS = [
+    ("completion-image", "SELECT + UPDATE", 2, image_two_step),
+    ("completion-image", "conditional UPDATE", 1, image_single),
+    ("update-travel", "SELECT + UPDATE", 2, travel_two_step),
+    ("update-travel", "conditional UPDATE", 1, travel_single),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--travel-id', type=int, required=True)
+    parser.add_argument('--mission-id', type=int, required=True)
+    parser.add_argument('--runs', type=int, default=500)
+    args = parser.parse_args()
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for path, label, round_trips, write in VARIANTS:
+                timings = []
+                for _ in range(args.runs):
+                    started = time.perf_counter()
+                    write(cursor, args.user_id, args.mission_id, args.travel_id)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    conn.rollback()
+                timings.sort()
+                print(f"{path:17} {label:19} ({round_trips} round trip{'s' if round_trips > 1 else ''}):"
+                      f" median {statistics.median(timings):6.3f} ms  p95 {timings[int(len(timings) * 0.95) - 1]:6.3f} ms")
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Microbenchmark: uncached TimezoneFinder + pytz lookups vs. TimezoneGridCache.lookup.
+
+Simulates travellers who stay roughly in place: points are drawn around a few
+city centres with a few km of jitter, the way repeated mission requests from
+the same trip look.
+
+    python server/benchmarks/bench_timezone_cache.py [--points 20000] [--cell 0.05]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mission-generator-api'))
+import pytz  # noqa: E402
+from timezonefinder import TimezoneFinder  # noqa: E402
+from timezone_cache import TimezoneGridCache  # noqa: E402
+
+CITIES = [
+    (37.5665, 126.9780),   # Seoul
+    (35.6762, 139.6503),   # Tokyo
+    (48.8566, 2.3522),     # Paris
+    (40.7128, -74.0060),   # New York
+    (-33.8688, 151.2093),  # Sydney
+    (41.8719, 12.5674),    # Rome
+    (42.3601, -71.0589),   # Boston
+    (49.0, -123.1),        # US/Canada border near Vancouver
+]
+
+
+def make_points(count, jitter_degrees, seed):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(count):
+        lat, lng = rng.choice(CITIES)
+        points.append((lat + rng.uniform(-jitter_degrees, jitter_degrees),
+                       lng + rng.uniform(-jitter_degrees, jitter_degrees)))
+    return points
+
+
+def run(label, fn, points):
+    started = time.perf_counter()
+    for lat, lng in points:
+        fn(lat, lng)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {len(points) / elapsed:>12,.0f} lookups/sec  ({elapsed * 1000:.1f} ms total)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--jitter', type=float, default=0.05, help="degrees around each city centre")
+    parser.add_argument('--cell', type=float, default=0.05, help="cache cell size in degrees")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    points = make_points(args.points, args.jitter, args.seed)
+    finder = TimezoneFinder()
+    cache = TimezoneGridCache(finder, cell_degrees=args.cell)
+
+    # results must agree before speed matters
+    mismatches = sum(1 for lat, lng in points[:2000]
+                     if cache.lookup(lat, lng)[0] != finder.timezone_at(lng=lng, lat=lat))
+    cache = TimezoneGridCache(finder, cell_degrees=args.cell)
+
+    # what _get_time_for_ai did before: polygon search + pytz.timezone() on every call
+    def uncached(lat, lng):
+        name = finder.timezone_at(lng=lng, lat=lat)
+        return name, pytz.timezone(name) if name else None
+
+    baseline = run("timezone_at + pytz.timezone", uncached, points)
+    cached = run("TimezoneGridCache.lookup", cache.lookup, points)
+    print(f"speedup: {baseline / cached:.1f}x, mismatches in first 2000 points: {mismatches}")
+    print(f"cache stats: {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
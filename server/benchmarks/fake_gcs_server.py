@@ -0,0 +1,370 @@
+"""Local fake of the GCS JSON upload API, plus a multipart-vs-streaming upload benchmark.
+
+Implements just what google-cloud-storage uses for uploads: simple / multipart
+media uploads, resumable sessions (POST to start, PUT chunks with Content-Range,
+308 until the last chunk, DELETE to terminate), object GET metadata, copyTo and
+DELETE (also inside /batch/storage/v1 multipart/mixed batch requests), and
+signed-URL PUTs to /<bucket>/<object> (signature not verified; expiry,
+Content-Type and x-goog-content-length-range are). With --notify URL every
+finished object is also POSTed there as a Pub/Sub push OBJECT_FINALIZE message.
+Object bodies are counted and crc32c-summed (the client verifies the checksum),
+not kept, so large uploads do not grow this process.
+
+    # serve and point services at it (STORAGE_EMULATOR_HOST=http://127.0.0.1:4443)
+    python server/benchmarks/fake_gcs_server.py --port 4443 [--notify http://127.0.0.1:8080/]
+
+    # multipart form upload (current path) vs. raw-body streaming upload
+    python server/benchmarks/fake_gcs_server.py --bench 1,5,10
+
+    # one DELETE per object vs. braves_common.gcs_deletion batch deletes, with simulated latency
+    python server/benchmarks/fake_gcs_server.py --bench-deletes 500 --latency-ms 30
+"""
+import io
+import os
+import base64
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import datetime
+import tracemalloc
+import urllib.request
+import google_crc32c
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mission-image-uploader'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streaming_upload import stream_to_blob  # noqa: E402
+from braves_common.gcs_deletion import delete_objects  # noqa: E402
+
+BUCKET = "braves-bench"
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class FakeGcs:
+    def __init__(self, notify_url=None, latency_ms=0):
+        self.latency_ms = latency_ms  # added to every HTTP request, like a round trip to the real API
+        self.requests = 0
+        self.objects = {}  # name -> (size, crc32c, content type)
+        self.sessions = {}  # upload id -> [object name, content type, bytes received, Checksum]
+        self.lock = threading.Lock()
+        self.notify_url = notify_url
+
+    def finish(self, name, size, crc32c, content_type):
+        with self.lock:
+            self.objects[name] = (size, crc32c, content_type)
+        if self.notify_url:
+            resource = {"bucket": BUCKET, "name": name, "size": str(size), "contentType": content_type}
+            message = {"message": {"data": base64.b64encode(json.dumps(resource).encode()).decode(),
+                                   "attributes": {"eventType": "OBJECT_FINALIZE", "bucketId": BUCKET, "objectId": name}}}
+            notify = urllib.request.Request(self.notify_url, json.dumps(message).encode(), {'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(notify, timeout=10).close()
+            except Exception as e:
+                print(f"notification for {name} failed: {e}")
+
+
+def make_handler(gcs):
+    class GcsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _drain(self, checksum=None):
+            remaining = int(self.headers.get('Content-Length') or 0)
+            received = 0
+            while remaining:
+                block = self.rfile.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                if checksum is not None:
+                    checksum.update(block)
+                received += len(block)
+                remaining -= len(block)
+            return received
+
+        def send_response(self, *args, **kwargs):
+            gcs.requests += 1
+            if gcs.latency_ms:
+                time.sleep(gcs.latency_ms / 1000)
+            super().send_response(*args, **kwargs)
+
+        def _reply(self, status, body=None, headers=None):
+            payload = json.dumps(body).encode() if body is not None else b''
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _object(self, name, size, crc32c, content_type="application/octet-stream"):
+            return {"kind": "storage#object", "bucket": BUCKET, "name": name, "size": str(size),
+                    "crc32c": base64.b64encode(crc32c).decode(),
+                    "contentType": content_type, "generation": "1", "id": f"{BUCKET}/{name}/1"}
+
+        def _batch(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+            boundary = re.search(r'boundary="?([^";]+)"?', self.headers['Content-Type']).group(1)
+            parts = []
+            for index, part in enumerate(body.split('--' + boundary)[1:-1]):
+                method, uri = part.split('\n\n', 1)[1].lstrip().split(' ', 2)[:2]
+                name = unquote(urlparse(uri).path.split('/o/', 1)[-1])
+                if method == 'DELETE':
+                    with gcs.lock:
+                        found = gcs.objects.pop(name, None) is not None
+                    status = "204 No Content" if found else "404 Not Found"
+                else:
+                    status = "501 Not Implemented"
+                parts.append(f"Content-Type: application/http\r\nContent-ID: <response-{index + 1}>\r\n\r\n"
+                             f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n")
+            reply_boundary = uuid.uuid4().hex
+            payload = ''.join(f"--{reply_boundary}\r\n{part}\r\n" for part in parts) + f"--{reply_boundary}--\r\n"
+            self.send_response(200)
+            self.send_header('Content-Type', f'multipart/mixed; boundary={reply_boundary}')
+            self.send_header('Content-Length', str(len(payload.encode())))
+            self.end_headers()
+            self.wfile.write(payload.encode())
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path == '/batch/storage/v1':
+                return self._batch()
+            if '/copyTo/' in url.path:
+                self._drain()
+                source, destination = (unquote(part.split('/o/', 1)[1]) for part in url.path.split('/copyTo/', 1))
+                with gcs.lock:
+                    found = gcs.objects.get(source)
+                    if found:
+                        gcs.objects[destination] = found
+                if not found:
+                    return self._reply(404, {"error": {"message": "Not Found"}})
+                return self._reply(200, self._object(destination, *found))
+            query = parse_qs(url.query)
+            upload_type = query.get('uploadType', [''])[0]
+            if upload_type == 'resumable':
+                meta = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                name = query.get('name', [meta.get('name')])[0]
+                upload_id = uuid.uuid4().hex
+                with gcs.lock:
+                    gcs.sessions[upload_id] = [name, self.headers.get('X-Upload-Content-Type', meta.get('contentType')), 0,
+                                               google_crc32c.Checksum()]
+                location = f"http://{self.headers['Host']}{url.path}?uploadType=resumable&upload_id={upload_id}"
+                return self._reply(200, {}, {'Location': location})
+            if upload_type in ('multipart', 'media'):
+                # small uploads only (the client switches to resumable above 8 MB or for unknown sizes)
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                name = query.get('name', [None])[0]
+                if upload_type == 'multipart':
+                    boundary = re.search(r'boundary="?([^";]+)"?', self.headers['Content-Type']).group(1).encode()
+                    meta_part, media_part = body.split(b'--' + boundary)[1:3]
+                    name = name or json.loads(meta_part.split(b'\r\n\r\n', 1)[1]).get('name')
+                    body = media_part.split(b'\r\n\r\n', 1)[1][:-2]
+                name = name or f"object-{uuid.uuid4().hex}"
+                crc32c = google_crc32c.value(body).to_bytes(4, 'big')
+                gcs.finish(name, len(body), crc32c, "application/octet-stream")
+                return self._reply(200, self._object(name, len(body), crc32c))
+            self._drain()
+            self._reply(400, {"error": {"message": f"unsupported uploadType {upload_type!r}"}})
+
+        def _signed_put(self, url):
+            query = parse_qs(url.query)
+            if 'X-Goog-Signature' not in query:
+                self._drain()
+                return self._reply(403, {"error": {"message": "missing signature"}})
+            signed_at = datetime.datetime.strptime(query['X-Goog-Date'][0], '%Y%m%dT%H%M%SZ')
+            if datetime.datetime.utcnow() > signed_at + datetime.timedelta(seconds=int(query['X-Goog-Expires'][0])):
+                self._drain()
+                return self._reply(400, {"error": {"message": "signed URL expired"}})
+            size = int(self.headers.get('Content-Length') or 0)
+            low, high = map(int, (self.headers.get('x-goog-content-length-range') or f"0,{size}").split(','))
+            if not low <= size <= high:
+                self._drain()
+                return self._reply(400, {"error": {"message": "EntityTooLarge / EntityTooSmall"}})
+            checksum = google_crc32c.Checksum()
+            self._drain(checksum)
+            name = unquote(url.path.split('/', 2)[2])
+            gcs.finish(name, size, checksum.digest(), self.headers.get('Content-Type', "application/octet-stream"))
+            self._reply(200, None)
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            if not url.path.startswith('/upload/'):
+                return self._signed_put(url)
+            upload_id = parse_qs(url.query).get('upload_id', [''])[0]
+            session = gcs.sessions.get(upload_id)
+            if session is None:
+                self._drain()
+                return self._reply(404, {"error": {"message": "no such upload"}})
+            session[2] += self._drain(session[3])
+            # "bytes 0-262143/*" while more chunks follow, "bytes x-y/total" (or "*/total") on the last one
+            match = re.match(r'bytes (?:\d+-\d+|\*)/(\d+|\*)', self.headers.get('Content-Range', ''))
+            total = match.group(1) if match else '*'
+            if total == '*' or int(total) > session[2]:
+                return self._reply(308, None, {'Range': f"bytes=0-{session[2] - 1}"} if session[2] else {})
+            crc32c = session[3].digest()
+            with gcs.lock:
+                del gcs.sessions[upload_id]
+            gcs.finish(session[0], session[2], crc32c, session[1] or "application/octet-stream")
+            self._reply(200, self._object(session[0], session[2], crc32c, session[1] or "application/octet-stream"))
+
+        def do_DELETE(self):
+            url = urlparse(self.path)
+            upload_id = parse_qs(url.query).get('upload_id', [''])[0]
+            with gcs.lock:
+                if upload_id:
+                    gcs.sessions.pop(upload_id, None)
+                    return self._reply(499, None)
+                name = unquote(url.path.split('/o/', 1)[-1])
+                found = gcs.objects.pop(name, None) is not None
+            self._reply(204 if found else 404, None)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if '/o/' not in path:
+                # bucket metadata, fetched in the background by the client's bucket metadata cache
+                return self._reply(200, {"kind": "storage#bucket", "name": BUCKET, "id": BUCKET, "location": "ASIA-NORTHEAST3"})
+            name = unquote(path.split('/o/', 1)[-1])
+            if name in gcs.objects:
+                return self._reply(200, self._object(name, *gcs.objects[name]))
+            self._reply(404, {"error": {"message": "Not Found"}})
+
+    return GcsHandler
+
+
+def start_fake(port, notify_url=None, latency_ms=0):
+    gcs = FakeGcs(notify_url, latency_ms)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(gcs))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, gcs
+
+
+class PatternStream(io.RawIOBase):
+    """A PNG-looking request body of `size` bytes generated on the fly, like a socket would deliver it."""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.head = PNG_HEADER
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining)
+        if n <= 0:
+            return 0
+        head, self.head = self.head[:n], self.head[n:]
+        buffer[:len(head)] = head
+        buffer[len(head):n] = b'\0' * (n - len(head))
+        self.remaining -= n
+        return n
+
+
+def multipart_upload(client, size, chunk_size):
+    """Current path: Werkzeug parses the form (spooling the file), then upload_from_file re-reads it."""
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+    body = PatternStream(size).read()
+    environ = EnvironBuilder(method='POST', data={'image_file': (io.BytesIO(body), 'photo.png', 'image/png')}).get_environ()
+    del body
+    file = Request(environ).files['image_file']
+    blob = client.bucket(BUCKET).blob(f"bench/{uuid.uuid4().hex}.png")
+    file.seek(0)
+    blob.upload_from_file(file.stream, content_type=file.content_type)
+
+
+def streamed_upload(client, size, chunk_size):
+    blob = client.bucket(BUCKET).blob(f"bench/{uuid.uuid4().hex}.png")
+    stream_to_blob(blob, io.BufferedReader(PatternStream(size)), 'image/png', chunk_size, size)
+
+
+def bench(sizes_mb, chunk_size, runs):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage
+    server, gcs = start_fake(0)
+    os.environ['STORAGE_EMULATOR_HOST'] = f"http://127.0.0.1:{server.server_address[1]}"
+    client = storage.Client(project="braves-bench", credentials=AnonymousCredentials())
+    print(f"chunk_size={chunk_size // 1024} KiB, best of {runs} runs; peak = tracemalloc peak of Python allocations during one upload")
+    for size_mb in sizes_mb:
+        size = int(size_mb * 1024 * 1024)
+        for label, upload in (("multipart form", multipart_upload), ("raw-body stream", streamed_upload)):
+            best = None
+            for _ in range(runs):
+                tracemalloc.start()
+                started = time.perf_counter()
+                upload(client, size, chunk_size)
+                seconds = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                best = min(best or (seconds, peak), (seconds, peak))
+            seconds, peak = best
+            print(f"  {size_mb:5g} MB {label:16}: {seconds * 1000:7.1f} ms  {size / seconds / 1024 / 1024:7.1f} MB/s"
+                  f"  peak {peak / 1024 / 1024:6.2f} MB")
+    server.shutdown()
+
+
+def bench_deletes(count, latency_ms):
+    """Inline blob.delete() per object (old handlers / sweep) vs. gcs_deletion.delete_objects() batches."""
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage
+    server, gcs = start_fake(0, latency_ms=latency_ms)
+    os.environ['STORAGE_EMULATOR_HOST'] = f"http://127.0.0.1:{server.server_address[1]}"
+    client = storage.Client(project="braves-bench", credentials=AnonymousCredentials())
+    bucket = client.bucket(BUCKET)
+    names = [f"missions/sha256/{uuid.uuid4().hex}.png" for _ in range(count)]
+
+    def one_by_one():
+        for name in names:
+            bucket.blob(name).delete()
+
+    def batched():
+        errors = delete_objects(bucket, names)
+        assert not errors, errors
+
+    print(f"{count} deletes, {latency_ms} ms simulated latency per HTTP request")
+    for label, delete in (("one DELETE each", one_by_one), ("batched", batched)):
+        with gcs.lock:
+            gcs.objects.update((name, (1, b'\0' * 4, "image/png")) for name in names)
+        gcs.requests = 0
+        started = time.perf_counter()
+        delete()
+        seconds = time.perf_counter() - started
+        assert not any(name in gcs.objects for name in names)
+        print(f"  {label:16}: {seconds * 1000:8.1f} ms  {gcs.requests:5d} HTTP requests")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=4443)
+    parser.add_argument('--bench', metavar='SIZES_MB', help="comma-separated upload sizes in MB, e.g. 1,5,10")
+    parser.add_argument('--chunk-size', type=int, default=1024 * 1024)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--notify', metavar='URL', help="POST a Pub/Sub push OBJECT_FINALIZE message here for every finished object")
+    parser.add_argument('--bench-deletes', metavar='COUNT', type=int, help="compare per-object and batched deletes of COUNT objects")
+    parser.add_argument('--latency-ms', type=int, default=0, help="simulated latency added to every HTTP request")
+    args = parser.parse_args()
+    if args.bench_deletes:
+        bench_deletes(args.bench_deletes, args.latency_ms)
+        return
+    if args.bench:
+        bench([float(s) for s in args.bench.split(',')], args.chunk_size, args.runs)
+        return
+    server, _ = start_fake(args.port, args.notify, args.latency_ms)
+    print(f"Fake GCS listening on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Time-to-first-byte vs. total time: blocking /api/mission vs. streaming /api/mission/stream.
+
+Sends the same payload to both endpoints of a running AI mission service and
+reports, per request, when the first byte (first SSE chunk for the stream)
+arrived and when the full mission was available.
+
+    python server/benchmarks/measure_mission_stream.py --url https://<ai-service>/api/mission [--runs 5]
+"""
+import time
+import uuid
+import argparse
+import statistics
+
+import requests
+
+PAYLOAD = {
+    "latitude": "37.5704",
+    "longitude": "126.9997",
+    "traveler_information": '{"username": "Brave Traveler", "party_size": 2}',
+    "current_time": "2025-05-01T15:00:00+09:00",
+    "trip_information": "Seoul food trip",
+    "brave_scale": "3",
+}
+
+
+def measure_blocking(url, payload):
+    started = time.perf_counter()
+    with requests.post(url, json=payload, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        first = None
+        for _ in response.iter_content(chunk_size=None):
+            if first is None:
+                first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+def measure_stream(url, payload):
+    started = time.perf_counter()
+    first = None
+    with requests.post(url, json=payload, stream=True, timeout=(5, 60)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if first is None and line.startswith("data:"):
+                first = time.perf_counter() - started
+            if line.startswith("event: done") or line.startswith("event: error"):
+                break
+    return first, time.perf_counter() - started
+
+
+def report(name, samples):
+    ttfb = [s[0] * 1000 for s in samples if s[0] is not None]
+    total = [s[1] * 1000 for s in samples]
+    print(f"{name:>9}: ttfb median {statistics.median(ttfb):7.0f} ms  max {max(ttfb):7.0f} ms | "
+          f"total median {statistics.median(total):7.0f} ms  max {max(total):7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", required=True, help="blocking endpoint, e.g. https://host/api/mission")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    blocking, streaming = [], []
+    for _ in range(args.runs):
+        # a unique trip per call so the mission cache never answers it
+        blocking.append(measure_blocking(args.url, dict(PAYLOAD, user_id=uuid.uuid4().hex, trip_information=uuid.uuid4().hex)))
+        streaming.append(measure_stream(args.url.rstrip('/') + '/stream', dict(PAYLOAD, user_id=uuid.uuid4().hex, trip_information=uuid.uuid4().hex)))
+    report("blocking", blocking)
+    report("streaming", streaming)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Local mock of the FCM HTTP v1 `messages:send` API, plus a dispatch benchmark against it.
+
+Tokens starting with "dead-" are answered 404 UNREGISTERED, a fraction of the
+others 503 UNAVAILABLE (--transient-rate), and every response is delayed by
+--latency-ms to stand in for the round trip to FCM.
+
+    # run the mock and point a service at it (FCM_TRANSPORT=http FCM_ENDPOINT=http://127.0.0.1:8089)
+    python server/benchmarks/mock_fcm_server.py --port 8089
+
+    # one message per blocking send vs. FcmDispatcher batches, both against the mock
+    python server/benchmarks/mock_fcm_server.py --bench 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common.fcm import FcmDispatcher, HttpV1Transport  # noqa: E402
+
+
+def make_handler(latency_ms, transient_rate, seed=7):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    received = []
+
+    class MockFcmHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like FCM
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            token = body.get('message', {}).get('token', '')
+            received.append(token)
+            time.sleep(latency_ms / 1000)
+            with rng_lock:
+                transient = rng.random() < transient_rate
+            if token.startswith('dead-'):
+                self._reply(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": "Requested entity was not found.",
+                                            "details": [{"errorCode": "UNREGISTERED"}]}})
+            elif transient:
+                self._reply(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "Service unavailable",
+                                            "details": [{"errorCode": "UNAVAILABLE"}]}})
+            else:
+                self._reply(200, {"name": f"projects/mock/messages/{len(received)}"})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return MockFcmHandler, received
+
+
+def start_mock(port, latency_ms, transient_rate):
+    handler, received = make_handler(latency_ms, transient_rate)
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+def bench(count, port, latency_ms, transient_rate):
+    server, received = start_mock(port, latency_ms, transient_rate)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    messages = [{"token": f"dead-{i}" if i % 50 == 0 else f"token-{i}",
+                 "data": {"type": "MISSION_PROPOSAL", "proposal_id": str(i)}} for i in range(count)]
+
+    sequential = HttpV1Transport(endpoint=endpoint, project_id="mock", concurrency=1)
+    started = time.perf_counter()
+    for message in messages:
+        sequential.send_batch([message])
+    sequential_seconds = time.perf_counter() - started
+
+    received.clear()
+    pruned = []
+    dispatcher = FcmDispatcher(HttpV1Transport(endpoint=endpoint, project_id="mock", concurrency=32),
+                               backoff_base_seconds=0.05, on_dead_tokens=pruned.extend)
+    started = time.perf_counter()
+    result = dispatcher.dispatch(messages)
+    batched_seconds = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"{count} messages, {latency_ms} ms mock latency, {transient_rate:.0%} transient failures")
+    print(f"  sequential send : {sequential_seconds:7.2f} s  ({count / sequential_seconds:8.0f} msg/s, no retries)")
+    print(f"  FcmDispatcher   : {batched_seconds:7.2f} s  ({count / batched_seconds:8.0f} msg/s)"
+          f"  sent={result['sent']} failed={result['failed']} dead={len(result['dead_tokens'])} pruned={len(pruned)}"
+          f" requests={len(received)} stats={dispatcher.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--transient-rate', type=float, default=0.05)
+    parser.add_argument('--bench', type=int, metavar='MESSAGES', help="run the dispatch benchmark instead of serving")
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.bench, 0, args.latency_ms, args.transient_rate)
+        return
+    server, _ = start_mock(args.port, args.latency_ms, args.transient_rate)
+    print(f"Mock FCM listening on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
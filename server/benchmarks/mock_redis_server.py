@@ -0,0 +1,156 @@
+"""Local stand-in for Redis (the RESP subset braves_common/cache.py uses), plus a list-cache benchmark.
+
+Supports PING, GET, SET [EX seconds], INCR / INCRBY, DEL, FLUSHALL and the HELLO /
+CLIENT handshake redis-py sends on connect (RESP2 and RESP3); everything
+lives in one dict in this process.
+
+    # run the stand-in and point services at it (CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6390/0)
+    python server/benchmarks/mock_redis_server.py --port 6390
+
+    # read-mostly traffic with periodic writes against none / memory / redis backends
+    python server/benchmarks/mock_redis_server.py --bench 5000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import socketserver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common.cache import ReadThroughCache, MemoryBackend, RedisBackend  # noqa: E402
+
+
+class RespStore:
+    def __init__(self):
+        self._data = {}  # key -> (bytes value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def execute(self, args, protocol=2):
+        command = args[0].upper()
+        with self._lock:
+            if command == b'PING':
+                return b'+PONG\r\n'
+            if command in (b'CLIENT', b'SELECT'):
+                return b'+OK\r\n'
+            if command == b'GET':
+                value = self._live(args[1])
+                if value is None:
+                    return b'_\r\n' if protocol == 3 else b'$-1\r\n'
+                return b'$%d\r\n%s\r\n' % (len(value), value)
+            if command == b'SET':
+                ttl = int(args[4]) if len(args) >= 5 and args[3].upper() == b'EX' else None
+                self._data[args[1]] = (args[2], time.time() + ttl if ttl else None)
+                return b'+OK\r\n'
+            if command in (b'INCR', b'INCRBY'):
+                value = int(self._live(args[1]) or 0) + (int(args[2]) if command == b'INCRBY' else 1)
+                self._data[args[1]] = (str(value).encode(), None)
+                return b':%d\r\n' % value
+            if command == b'DEL':
+                return b':%d\r\n' % sum(1 for key in args[1:] if self._data.pop(key, None) is not None)
+            if command == b'FLUSHALL':
+                self._data.clear()
+                return b'+OK\r\n'
+        return b'-ERR unknown command %s\r\n' % command
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.time() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+
+def make_handler(store):
+    class RespHandler(socketserver.StreamRequestHandler):
+        disable_nagle_algorithm = True
+
+        def handle(self):
+            protocol = 2
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                if not line.startswith(b'*'):
+                    args = line.split()  # inline command (e.g. from telnet / redis-cli PING)
+                else:
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                if args and args[0].upper() == b'HELLO':
+                    protocol = int(args[1]) if len(args) > 1 else protocol
+                    fields = [b'server', b'redis', b'version', b'7.0.0', b'proto', protocol]
+                    reply = b'%%%d\r\n' % (len(fields) // 2) if protocol == 3 else b'*%d\r\n' % len(fields)
+                    for field in fields:
+                        reply += b':%d\r\n' % field if isinstance(field, int) else b'$%d\r\n%s\r\n' % (len(field), field)
+                    self.wfile.write(reply)
+                elif args:
+                    self.wfile.write(store.execute(args, protocol))
+
+    return RespHandler
+
+
+def start_mock(port):
+    store = RespStore()
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), make_handler(store))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+
+def bench(lookups, port, load_ms, users, write_every):
+    server, _ = start_mock(port)
+    url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+    print(f"{lookups} list reads over {users} users, {load_ms} ms per MySQL load, a write every {write_every} reads")
+    for label, backend in (("none", None), ("memory", MemoryBackend()), ("redis stand-in", RedisBackend(url))):
+        cache = ReadThroughCache(backend, name="bench", ttl_seconds=60, verify_sample_rate=0.01)
+        rng = random.Random(7)
+        versions = [0] * users  # what "MySQL" would return for each user's list right now
+        started = time.perf_counter()
+        for i in range(lookups):
+            user = rng.randrange(users)
+            if write_every and i % write_every == 0:
+                versions[user] += 1
+                cache.invalidate(f"user:{user}")
+
+            def load(user=user):
+                time.sleep(load_ms / 1000)
+                return {"user": user, "version": versions[user]}
+
+            cache.get_or_load(f"user:{user}", "all", load)
+        seconds = time.perf_counter() - started
+        stats = cache.stats()
+        print(f"  {label:15}: {seconds:6.2f} s  ({seconds / lookups * 1000:6.3f} ms/read)"
+              f"  hit_ratio={stats['hit_ratio']:.2%} stale_hits={stats.get('stale_hits', 0)}"
+              f" avg_hit_age={stats['avg_hit_age_seconds']:.2f} s")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--load-ms', type=float, default=5, help="simulated MySQL time per listing load")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--write-every', type=int, default=20)
+    parser.add_argument('--bench', type=int, metavar='LOOKUPS', help="run the cache benchmark instead of serving")
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.bench, 0, args.load_ms, args.users, args.write_every)
+        return
+    server, _ = start_mock(args.port)
+    print(f"Redis stand-in listening on redis://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
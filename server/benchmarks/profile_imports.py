@@ -0,0 +1,71 @@
+"""Cold-start import profile for a Cloud Functions service.
+
+Imports the service's main.py in a fresh interpreter with `python -X importtime`
+and reports how much import time each top-level dependency costs, which is what
+every cold instance pays before serving its first request.
+
+    python server/benchmarks/profile_imports.py server/mission-generator-api [--top 15]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+
+def profile(service_dir):
+    """Return ([(dependency, cumulative_us)], main_cumulative_us, returncode, stderr lines that are not timings)."""
+    code = (
+        "import sys, os; "
+        f"sys.path.insert(0, {os.path.abspath(service_dir)!r}); "
+        f"os.chdir({os.path.abspath(service_dir)!r}); "
+        "import main"
+    )
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                               capture_output=True, text=True, env=dict(os.environ))
+    entries = []  # (depth, module, cumulative_us) in completion order: children before their parent
+    errors = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # header line
+        name_field = fields[2]
+        module = name_field.strip()
+        depth = (len(name_field) - len(name_field.lstrip(" ")) - 1) // 2
+        entries.append((depth, module, int(fields[1])))
+
+    main_index = next((i for i, entry in enumerate(entries) if entry[1] == "main"), None)
+    if main_index is None:
+        # main.py failed part-way: attribute everything imported at the top level of the failed import
+        depth = min((entry[0] for entry in entries), default=0)
+        return [(m, us) for d, m, us in entries if d == depth], None, completed.returncode, errors
+    main_depth = entries[main_index][0]
+    direct = []
+    for depth, module, cumulative in reversed(entries[:main_index]):
+        if depth <= main_depth:
+            break  # reached modules imported before main.py started
+        if depth == main_depth + 1:
+            direct.append((module, cumulative))
+    return direct[::-1], entries[main_index][2], completed.returncode, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("service_dir")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    dependencies, main_us, returncode, errors = profile(args.service_dir)
+    total = main_us if main_us is not None else sum(us for _, us in dependencies)
+    print(f"Import-time profile for {args.service_dir}: import main = {total / 1000:.1f} ms")
+    print(f"{'dependency (imported by main.py)':<36}{'ms':>10}{'share':>9}")
+    for module, us in sorted(dependencies, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{module:<36}{us / 1000:>10.1f}{us / total * 100 if total else 0:>8.1f}%")
+    if returncode != 0:
+        print(f"\nimport main failed (exit {returncode}); timings cover modules imported before the failure:")
+        print("\n".join(errors[-5:]))
+
+if __name__ == "__main__":
+    main()
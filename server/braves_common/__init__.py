@@ -0,0 +1,35 @@
+"""Code shared by the Braves Cloud Functions services under server/.
+
+Each function is deployed from its own directory, so copy this package next
+to the function's main.py before deploying (e.g. `cp -r ../braves_common .`).
+When running from the repository, main.py adds server/ to sys.path instead.
+
+Names are exported lazily: `from braves_common import token_required` only
+imports braves_common.auth, so a service never pays the import cost of the
+helpers it does not use.
+"""
+import importlib
+
+_EXPORTS = {
+    'get_db_connection': 'braves_common.db',
+    'connection': 'braves_common.db',
+    'pool_stats': 'braves_common.db',
+    'token_required': 'braves_common.auth',
+    'verify_access_token': 'braves_common.auth',
+    'token_cache_stats': 'braves_common.auth',
+    'scheduler_caller_error': 'braves_common.auth',
+    'json_response': 'braves_common.responses',
+    'error_response': 'braves_common.responses',
+    'make_entry_point': 'braves_common.entry',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'braves_common' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,157 @@
+"""Access-token verification shared by every service that accepts `Authorization: Bearer <token>`."""
+import os
+import time
+import threading
+import collections
+from functools import wraps
+
+import jwt
+from flask import request
+
+from braves_common.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_SECONDS, JWT_SECRET_PLACEHOLDER
+from braves_common.responses import error_response
+
+VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 4096))
+# Upper bound on how long a verified token is trusted without re-decoding (never past its exp)
+VERIFIED_TOKEN_CACHE_TTL_SECONDS = float(os.environ.get("JWT_CACHE_TTL_SECONDS", JWT_EXPIRATION_SECONDS))
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of token -> userId for tokens that already passed jwt.decode.
+
+    Entries expire at min(token exp, insert time + ttl), so a cached token is
+    never accepted after the moment jwt.decode would start rejecting it.
+    """
+
+    def __init__(self, max_size=VERIFIED_TOKEN_CACHE_SIZE, ttl=VERIFIED_TOKEN_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # token -> (user_id, expires_at)
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+
+    def get(self, token, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._metrics['misses'] += 1
+                return None
+            user_id, expires_at = entry
+            if now >= expires_at:
+                del self._entries[token]
+                self._metrics['expired'] += 1
+                self._metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(token)
+            self._metrics['hits'] += 1
+            return user_id
+
+    def put(self, token, user_id, exp=None, now=None):
+        now = time.time() if now is None else now
+        expires_at = now + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        if expires_at <= now or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (user_id, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot.update(size=len(self._entries), max_size=self.max_size)
+        lookups = snapshot.get('hits', 0) + snapshot.get('misses', 0)
+        snapshot['hit_ratio'] = snapshot.get('hits', 0) / lookups if lookups else 0.0
+        return snapshot
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def verify_access_token(token):
+    """Return the userId of a valid access token, raising jwt.InvalidTokenError otherwise.
+
+    Tokens that already passed verification are answered from verified_tokens
+    without repeating the HMAC check and claim validation.
+    """
+    user_id = verified_tokens.get(token)
+    if user_id is not None:
+        return user_id
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    user_id = payload['userId']
+    verified_tokens.put(token, user_id, payload.get('exp'))
+    return user_id
+
+
+def token_cache_stats():
+    return verified_tokens.stats()
+
+
+# --- JWT 인증 데코레이터 ---
+def token_required(f):
+    """액세스 토큰(google-login 에서 발급)을 검증하고 current_user_id 를 kwargs 로 전달하는 데코레이터"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+        if 'Authorization' in request.headers:
+            auth_header = request.headers['Authorization']
+            try: token = auth_header.split(" ")[1]
+            except IndexError: return error_response(401, "유효하지 않은 토큰 형식") # Invalid token format
+        if not token: return error_response(401, "인증 토큰 필요") # Authentication token required
+        if not JWT_SECRET or JWT_SECRET == JWT_SECRET_PLACEHOLDER:
+            print("CRITICAL: JWT_SECRET 환경 변수가 설정되지 않았거나 기본값을 사용 중입니다.")
+            return error_response(500, "서버 설정 오류 (JWT Secret)") # Server configuration error (JWT Secret)
+        try:
+            kwargs['current_user_id'] = verify_access_token(token)
+        except jwt.ExpiredSignatureError: return error_response(401, "토큰 만료") # Token expired
+        except jwt.InvalidTokenError as e: return error_response(401, f"유효하지 않은 토큰: {e}") # Invalid token
+        except Exception as e:
+            print(f"Token decoding error: {type(e).__name__} - {e}")
+            return error_response(401, "토큰 처리 오류") # Token processing error
+        return f(*args, **kwargs)
+    return decorated
+
+
+# --- Cloud Scheduler 전용 진입점 호출자 확인 ---
+# Cloud Scheduler 작업 / Pub/Sub push 구독 / Eventarc 트리거는 이 서비스 계정의 OIDC 토큰 (Authorization: Bearer) 을
+# 붙여 호출하도록 설정; 쉼표로 구분해 여러 계정 허용
+SCHEDULER_SERVICE_ACCOUNT = os.environ.get("SCHEDULER_SERVICE_ACCOUNT")
+SCHEDULER_SERVICE_ACCOUNTS = {email.strip() for email in (SCHEDULER_SERVICE_ACCOUNT or '').split(',') if email.strip()}
+# 토큰의 audience (스케줄러 작업 / push 엔드포인트의 대상 URL); 비우면 audience 는 확인하지 않음
+SCHEDULER_AUDIENCE = os.environ.get("SCHEDULER_AUDIENCE")
+
+
+def scheduler_caller_error(request_obj):
+    """Google 이 서명한 SCHEDULER_SERVICE_ACCOUNT 의 OIDC 토큰이면 None, 아니면 (응답, 상태 코드)
+
+    스케줄러 / Pub/Sub push 전용 진입점 (DDL, 삭제, AI 호출 등) 용. 함수를 --no-allow-unauthenticated 로 배포해도
+    토큰을 한 번 더 확인하며, SCHEDULER_SERVICE_ACCOUNT 가 없으면 실행하지 않음 (fail closed).
+    """
+    if not SCHEDULER_SERVICE_ACCOUNTS:
+        print("CRITICAL: SCHEDULER_SERVICE_ACCOUNT 환경 변수가 설정되지 않아 스케줄러 전용 호출을 거부합니다.")
+        return error_response(500, "서버 설정 오류 (Scheduler service account)") # Server configuration error
+    auth_header = request_obj.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '): return error_response(401, "인증 토큰 필요") # Authentication token required
+    import google.auth.exceptions
+    import google.auth.transport.requests
+    from google.oauth2 import id_token
+    try:
+        claims = id_token.verify_oauth2_token(auth_header[len('Bearer '):], google.auth.transport.requests.Request(), audience=SCHEDULER_AUDIENCE)
+    except google.auth.exceptions.TransportError as e:
+        # Google 공개 키를 받지 못함 - 스케줄러가 재시도하도록 503
+        print(f"Scheduler token verification unavailable: {e}")
+        return error_response(503, "토큰 확인 불가 (잠시 후 재시도)") # Token verification unavailable
+    except (ValueError, google.auth.exceptions.GoogleAuthError) as e:
+        return error_response(401, f"유효하지 않은 토큰: {e}") # Invalid token
+    if claims.get('email') not in SCHEDULER_SERVICE_ACCOUNTS or not claims.get('email_verified'):
+        return error_response(403, "허용되지 않은 호출자") # Caller not allowed
+    return None
@@ -0,0 +1,232 @@
+"""Read-through cache for per-user / per-travel listings, invalidated by the writers.
+
+    value, hit = list_cache.get().get_or_load(user_scope(user_id), variant, load_from_mysql)
+    ...
+    invalidate_lists(user_id)  # after the write commits
+
+A user's travel list and the mission lists of their travels all live under
+user_scope(user_id), so every writer can invalidate with the user id it
+already has from the token, without looking up the travel.
+
+Invalidation is generation based: every scope has a counter in the backend that is part of each
+cache key, and invalidate() bumps it, so all entries of that scope become
+unreachable at once and age out through TTL / LRU. Generation keys have no
+TTL and are read on every lookup, so under LRU eviction they always outlive
+the entries they guard.
+
+Backends (CACHE_BACKEND; defaults to redis when CACHE_REDIS_URL is set, else none):
+  - redis: any Redis-protocol server at CACHE_REDIS_URL (needs the `redis`
+    package), shared by every instance, so invalidation is global. For local
+    runs server/benchmarks/mock_redis_server.py can stand in for Redis.
+  - none: caching disabled (every lookup loads).
+  - memory: bounded in-process LRU, for single-process local runs only.
+    Invalidation only reaches the process that performed the write, and the
+    lists are also written by other services (mission generation, image
+    uploads), so a deployed reader would serve a user's stale list, and 304s
+    for it, for up to CACHE_TTL_SECONDS.
+
+stats() reports hits, misses and hit ratio, the age of the entries served,
+and stale_hits: with probability CACHE_VERIFY_SAMPLE_RATE a hit is re-loaded
+from the source and compared, which measures how often the cache served data
+that no longer matched MySQL.
+"""
+import os
+import json
+import time
+import random
+import threading
+import collections
+
+from braves_common.lazy import LazySingleton
+
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "redis" if CACHE_REDIS_URL else "none")  # redis | none | memory
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", 60))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 4096))
+CACHE_VERIFY_SAMPLE_RATE = float(os.environ.get("CACHE_VERIFY_SAMPLE_RATE", 0.01))
+
+
+class MemoryBackend:
+    """Bounded LRU of key -> (value, expires_at); expires_at None means no TTL."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl_seconds if ttl_seconds else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._entries.get(key, (0, None))[0]) + 1
+            self._entries[key] = (value, None)
+            self._entries.move_to_end(key)
+            return value
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """Redis-protocol server through redis-py; connection errors propagate to ReadThroughCache."""
+
+    def __init__(self, url=CACHE_REDIS_URL, timeout_seconds=0.5):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout_seconds, socket_connect_timeout=timeout_seconds)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl_seconds=None):
+        self._client.set(key, value, ex=ttl_seconds or None)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def size(self):
+        return None
+
+
+def create_backend(backend=None):
+    backend = backend or CACHE_BACKEND
+    if backend == 'memory':
+        return MemoryBackend()
+    if backend == 'redis':
+        if not CACHE_REDIS_URL:
+            raise ValueError("CACHE_BACKEND=redis needs CACHE_REDIS_URL")
+        return RedisBackend()
+    if backend == 'none':
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+class ReadThroughCache:
+    """JSON-serializable values per (scope, variant); a backend failure falls back to loading."""
+
+    def __init__(self, backend, name="cache", ttl_seconds=CACHE_TTL_SECONDS, verify_sample_rate=CACHE_VERIFY_SAMPLE_RATE):
+        self._backend = backend
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.verify_sample_rate = verify_sample_rate
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+        self._age_total = 0.0
+        self._age_max = 0.0
+
+    @classmethod
+    def from_env(cls, name):
+        return cls(create_backend(), name=name)
+
+    def _generation_key(self, scope):
+        return f"{self.name}:gen:{scope}"
+
+    def get_or_load(self, scope, variant, loader):
+        """Return (value, hit). loader() is called on a miss; a None result is neither cached nor compared."""
+        if self._backend is None:
+            return loader(), False
+        try:
+            generation = self._backend.get(self._generation_key(scope)) or 0
+            key = f"{self.name}:{scope}:{generation}:{variant}"
+            raw = self._backend.get(key)
+        except Exception as e:
+            self._count('errors')
+            print(f"[{self.name}] cache lookup failed, loading from source: {type(e).__name__} - {e}")
+            return loader(), False
+
+        if raw is not None:
+            entry = json.loads(raw)
+            age = max(0.0, time.time() - entry['cached_at'])
+            with self._lock:
+                self._metrics['hits'] += 1
+                self._age_total += age
+                self._age_max = max(self._age_max, age)
+            if self.verify_sample_rate and random.random() < self.verify_sample_rate:
+                fresh = loader()
+                if fresh is None:
+                    return None, False
+                self._count('verified')
+                if fresh != entry['value']:
+                    self._count('stale_hits')
+                    print(f"[{self.name}] stale entry for {scope!r} ({age:.1f} s old), replaced")
+                    self._store(key, fresh)
+                    return fresh, False
+            return entry['value'], True
+
+        self._count('misses')
+        value = loader()
+        if value is not None:
+            self._store(key, value)
+        return value, False
+
+    def _store(self, key, value):
+        try:
+            self._backend.set(key, json.dumps({"cached_at": time.time(), "value": value}, ensure_ascii=False, default=str),
+                              self.ttl_seconds)
+        except Exception as e:
+            self._count('errors')
+            print(f"[{self.name}] cache store failed: {type(e).__name__} - {e}")
+
+    def invalidate(self, *scopes):
+        """Drop every cached entry of the given scopes; call after the write has committed."""
+        if self._backend is None:
+            return
+        for scope in scopes:
+            try:
+                self._backend.incr(self._generation_key(scope))
+                self._count('invalidations')
+            except Exception as e:
+                self._count('errors')
+                print(f"[{self.name}] invalidation of {scope!r} failed: {type(e).__name__} - {e}")
+
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            age_total, age_max = self._age_total, self._age_max
+        hits = snapshot.get('hits', 0)
+        lookups = hits + snapshot.get('misses', 0)
+        verified = snapshot.get('verified', 0)
+        snapshot.update(
+            backend=type(self._backend).__name__ if self._backend else None,
+            size=self._backend.size() if self._backend else 0,
+            ttl_seconds=self.ttl_seconds,
+            hit_ratio=hits / lookups if lookups else 0.0,
+            avg_hit_age_seconds=age_total / hits if hits else 0.0,
+            max_hit_age_seconds=age_max,
+            stale_ratio=snapshot.get('stale_hits', 0) / verified if verified else 0.0,
+        )
+        return snapshot
+
+
+list_cache = LazySingleton(lambda: ReadThroughCache.from_env("lists"), name="list-cache")
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def invalidate_lists(user_id):
+    """Invalidate the travel list and every mission list of user_id."""
+    list_cache.get().invalidate(user_scope(user_id))
@@ -0,0 +1,18 @@
+"""Environment configuration shared by every service."""
+import os
+
+# --- Cloud SQL ---
+db_host = os.environ.get("CLOUD_SQL_HOST")
+db_user = os.environ.get("CLOUD_SQL_USER")
+db_password = os.environ.get("CLOUD_SQL_PASSWORD")
+db_name = os.environ.get("CLOUD_SQL_DATABASE")
+
+# --- JWT ---
+# Must be the same key in every service (google-login issues, the others verify)
+JWT_SECRET = os.environ.get("JWT_SECRET")
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRATION_SECONDS = 3600  # 1 hour (access token)
+# Refresh token expiration time (get from environment variable or use default 30 days)
+JWT_REFRESH_EXPIRATION_DAYS = int(os.environ.get("JWT_REFRESH_EXPIRATION_DAYS", 30))
+# Placeholder value some deployments were configured with; treated as "not set"
+JWT_SECRET_PLACEHOLDER = "change-this-in-prod"
@@ -0,0 +1,226 @@
+"""Process-wide pooled MySQL connections.
+
+Every Cloud Function instance keeps a small bounded pool instead of opening a
+new TCP + auth handshake per request. Handlers keep using the familiar
+`conn = get_db_connection() ... finally: conn.close()` pattern: `close()` on a
+pooled connection rolls back anything left uncommitted and returns the socket
+to the pool. New code can use `with connection() as conn:` instead.
+"""
+import os
+import time
+import threading
+import contextlib
+import collections
+
+import mysql.connector
+
+from braves_common.config import db_host, db_user, db_password, db_name
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", 5))
+DB_POOL_IDLE_SECONDS = float(os.environ.get("DB_POOL_IDLE_SECONDS", 300))
+# Connections used more recently than this are handed out without a ping
+DB_POOL_PING_AFTER_SECONDS = float(os.environ.get("DB_POOL_PING_AFTER_SECONDS", 30))
+
+
+class PoolTimeoutError(mysql.connector.errors.PoolError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class PooledConnection:
+    """Thin proxy around a checked-out connection; close() returns it to the pool."""
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._conn = raw_conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Pooled connection already returned to the pool.")
+        return getattr(self._conn, name)
+
+    def is_connected(self):
+        # Health is checked on checkout; avoid the extra ping the handlers' finally blocks would cost
+        return self._conn is not None
+
+    def close(self):
+        raw_conn, self._conn = self._conn, None
+        if raw_conn is not None:
+            self._pool.release(raw_conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded MySQL connection pool with checkout health checks and idle reaping."""
+
+    def __init__(self, connect_kwargs, size=DB_POOL_SIZE, checkout_timeout=DB_POOL_TIMEOUT_SECONDS,
+                 idle_timeout=DB_POOL_IDLE_SECONDS, ping_after=DB_POOL_PING_AFTER_SECONDS,
+                 connect=mysql.connector.connect):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self._connect_kwargs = connect_kwargs
+        self._connect = connect
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = collections.deque()  # (raw_conn, last_used); right end is most recently used
+        self._open = 0
+        self._metrics = collections.Counter()
+
+    def acquire(self, timeout=None):
+        """Check out a healthy connection, waiting up to `timeout` seconds for a free slot."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            raw_conn, last_used, stale = self._reserve(deadline)
+            self._close_quietly(stale)
+            if raw_conn is None:
+                raw_conn = self._create()
+            elif time.monotonic() - last_used > self.ping_after and not self._healthy(raw_conn):
+                self._discard(raw_conn, 'health_check_failures')
+                continue
+            with self._cond:
+                self._metrics['checkouts'] += 1
+                self._metrics['wait_ms_total'] += int((time.monotonic() - started) * 1000)
+            return PooledConnection(self, raw_conn)
+
+    def release(self, raw_conn):
+        """Return a connection to the pool, discarding it if it cannot be reset."""
+        try:
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+        except Exception as e:
+            print(f"Discarding pooled connection that failed to reset: {e}")
+            self._discard(raw_conn)
+            return
+        with self._cond:
+            self._idle.append((raw_conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        """Snapshot of pool counters (checkouts, waits, timeouts, ...) and current gauges."""
+        with self._cond:
+            snapshot = dict(self._metrics)
+            snapshot.update(size=self.size, open=self._open, idle=len(self._idle),
+                            in_use=self._open - len(self._idle))
+        return snapshot
+
+    def close_all(self):
+        with self._cond:
+            idle = [raw_conn for raw_conn, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        self._close_quietly(idle)
+
+    def _reserve(self, deadline):
+        """Pick an idle connection or claim a slot for a new one; returns (conn, last_used, reaped)."""
+        waited = False
+        with self._cond:
+            while True:
+                stale = self._reap_locked()
+                if self._idle:
+                    raw_conn, last_used = self._idle.pop()
+                    return raw_conn, last_used, stale
+                if self._open < self.size:
+                    self._open += 1
+                    return None, None, stale
+                if not waited:
+                    self._metrics['waits'] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(f"No pooled DB connection available within {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+
+    def _reap_locked(self):
+        stale = []
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < cutoff:
+            stale.append(self._idle.popleft()[0])
+        if stale:
+            self._open -= len(stale)
+            self._metrics['reaped'] += len(stale)
+        return stale
+
+    def _create(self):
+        try:
+            raw_conn = self._connect(**self._connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._metrics['created'] += 1
+        return raw_conn
+
+    def _discard(self, raw_conn, reason='discarded'):
+        with self._cond:
+            self._open -= 1
+            self._metrics[reason] += 1
+            self._cond.notify()
+        self._close_quietly([raw_conn])
+
+    @staticmethod
+    def _healthy(raw_conn):
+        try:
+            raw_conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(raw_conns):
+        for raw_conn in raw_conns:
+            try: raw_conn.close()
+            except Exception as e: print(f"Pooled connection closing error: {e}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(dict(
+                    host=db_host, user=db_user, password=db_password,
+                    database=db_name, port=3306
+                ))
+    return _pool
+
+
+def get_db_connection():
+    """Check out a pooled connection (None on failure, like the old per-request connect)."""
+    try:
+        return get_pool().acquire()
+    except mysql.connector.Error as err:
+        print(f"MySQL connection error: {err}")
+        return None
+
+
+@contextlib.contextmanager
+def connection(timeout=None):
+    """Context-manager API: `with connection() as conn:`; raises instead of returning None."""
+    conn = get_pool().acquire(timeout)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    return get_pool().stats()
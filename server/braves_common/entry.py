@@ -0,0 +1,10 @@
+"""Cloud Functions HTTP entry points."""
+
+
+def make_entry_point(app):
+    """Build the `main(request)` function Cloud Functions calls; forwards the request to the Flask app."""
+    def main(request_obj):
+        with app.request_context(request_obj.environ):
+            return app.full_dispatch_request()
+    main.__doc__ = f"Cloud Functions HTTP 트리거 진입점 ({app.import_name})."
+    return main
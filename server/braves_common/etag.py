@@ -0,0 +1,42 @@
+"""Strong ETags and If-None-Match handling for listing endpoints.
+
+A listing's ETag is a hash of the payload it returns, so it changes exactly
+when a returned value does (updated_at alone has second precision and misses
+a second edit within the same second) and costs nothing beyond the bounded
+listing query itself - no aggregate over all of the user's rows. The ETag is
+cached next to the payload, so a cache hit answers 304 without touching MySQL
+or hashing again:
+
+    payload = load_listing()                  # or the cached {"etag", "payload"}
+    etag = compute_etag("travels", payload)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    return tag(json_response(payload), etag), 200
+"""
+import json
+import hashlib
+
+from flask import Response, request
+
+# responses are per-user: let the client cache them, but revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(*parts):
+    """Opaque (unquoted) strong ETag for the given version parts."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def tag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def not_modified(etag):
+    """304 response if the request's If-None-Match matches etag, else None."""
+    if etag not in request.if_none_match:
+        return None
+    return tag(Response(status=304), etag)
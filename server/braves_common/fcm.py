@@ -0,0 +1,225 @@
+"""Batched FCM delivery with retries and dead-token pruning.
+
+Messages are plain dicts ({"token": ..., "data": {...}, "notification": {...}})
+so callers do not need firebase_admin. FcmDispatcher.dispatch() sends them in
+batches of up to FCM_BATCH_SIZE (the provider's send_each limit is 500),
+retries transiently failing messages with exponential backoff, and reports
+tokens FCM says are gone so they can be cleared from users.fcm_token.
+SENDER_ID_MISMATCH means the credentials belong to another project, not that
+the token is dead: it is logged as a configuration error and never pruned,
+so a misconfigured deploy cannot wipe every user's token.
+FcmDispatcher.enqueue() puts messages in a WriteBehindBuffer instead, so
+messages produced by many workers within FCM_BATCH_WINDOW_MS share batches.
+
+Transports:
+  - FirebaseAdminTransport: firebase_admin.messaging.send_each (production).
+  - HttpV1Transport: the FCM HTTP v1 `messages:send` API at a configurable
+    endpoint, e.g. a local mock (see server/benchmarks/mock_fcm_server.py).
+"""
+import os
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from braves_common.write_behind import WriteBehindBuffer
+
+FCM_BATCH_SIZE = int(os.environ.get("FCM_BATCH_SIZE", 500))
+FCM_MAX_RETRIES = int(os.environ.get("FCM_MAX_RETRIES", 3))
+FCM_BACKOFF_BASE_SECONDS = float(os.environ.get("FCM_BACKOFF_BASE_SECONDS", 0.5))
+FCM_BATCH_WINDOW_MS = int(os.environ.get("FCM_BATCH_WINDOW_MS", 250))
+FCM_TRANSPORT = os.environ.get("FCM_TRANSPORT", "firebase-admin")  # firebase-admin | http
+FCM_ENDPOINT = os.environ.get("FCM_ENDPOINT", "https://fcm.googleapis.com")
+FCM_PROJECT_ID = os.environ.get("FCM_PROJECT_ID") or os.environ.get("GOOGLE_CLOUD_PROJECT", "")
+
+SENT = 'sent'
+TRANSIENT = 'transient'  # worth retrying (quota, unavailable, internal)
+DEAD_TOKEN = 'dead_token'  # token unregistered / invalid: clear it
+MISCONFIGURED = 'misconfigured'  # sender / project mismatch: not retryable, token kept
+FAILED = 'failed'  # permanent for this message only
+
+SendResult = collections.namedtuple('SendResult', 'status error')
+
+
+class FirebaseAdminTransport:
+    """send_each through the Firebase Admin SDK; `messaging` is firebase_admin.messaging."""
+
+    max_batch_size = 500
+
+    def __init__(self, messaging):
+        self._messaging = messaging
+
+    def send_batch(self, messages):
+        built = [self._messaging.Message(
+            token=message['token'],
+            data=message.get('data'),
+            notification=self._messaging.Notification(**message['notification']) if message.get('notification') else None,
+        ) for message in messages]
+        try:
+            response = self._messaging.send_each(built)
+        except Exception as e:
+            # the whole batch call failed (network, auth refresh): retry all of it
+            return [SendResult(TRANSIENT, f"{type(e).__name__}: {e}")] * len(messages)
+        return [SendResult(SENT, None) if item.success else self._classify(item.exception) for item in response.responses]
+
+    def _classify(self, exception):
+        messaging = self._messaging
+        error = f"{type(exception).__name__}: {exception}"
+        if isinstance(exception, messaging.SenderIdMismatchError):
+            return SendResult(MISCONFIGURED, error)
+        if isinstance(exception, messaging.UnregisteredError):
+            return SendResult(DEAD_TOKEN, error)
+        if getattr(exception, 'code', None) == 'INVALID_ARGUMENT' and 'token' in str(exception).lower():
+            return SendResult(DEAD_TOKEN, error)
+        if isinstance(exception, messaging.QuotaExceededError) or getattr(exception, 'code', None) in ('UNAVAILABLE', 'INTERNAL', 'UNKNOWN'):
+            return SendResult(TRANSIENT, error)
+        return SendResult(FAILED, error)
+
+
+class HttpV1Transport:
+    """FCM HTTP v1 (one request per message, sent concurrently); `access_token_fn` returns an OAuth token or None."""
+
+    def __init__(self, endpoint=FCM_ENDPOINT, project_id=FCM_PROJECT_ID, access_token_fn=None, concurrency=16, timeout=10,
+                 max_batch_size=500):
+        import requests
+        self._session = requests.Session()
+        # one pooled keep-alive connection per concurrent sender
+        self._session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+        self._session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+        self._url = f"{endpoint.rstrip('/')}/v1/projects/{project_id}/messages:send"
+        self._access_token_fn = access_token_fn
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fcm-http")
+        self.timeout = timeout
+        self.max_batch_size = max_batch_size
+
+    def send_batch(self, messages):
+        headers = {"Content-Type": "application/json"}
+        token = self._access_token_fn() if self._access_token_fn else None
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return list(self._executor.map(lambda message: self._send_one(message, headers), messages))
+
+    def _send_one(self, message, headers):
+        try:
+            response = self._session.post(self._url, json={"message": message}, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            return SendResult(TRANSIENT, f"{type(e).__name__}: {e}")
+        if response.status_code == 200:
+            return SendResult(SENT, None)
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            error = {}
+        details = [detail.get('errorCode') for detail in error.get('details', []) if isinstance(detail, dict)]
+        text = f"HTTP {response.status_code}: {error.get('status')} {details or ''} {error.get('message', '')}".strip()
+        # only the error details blame the token: a bare 404 (wrong FCM_PROJECT_ID / endpoint) fails every message alike
+        if 'SENDER_ID_MISMATCH' in details:
+            return SendResult(MISCONFIGURED, text)
+        if 'UNREGISTERED' in details:
+            return SendResult(DEAD_TOKEN, text)
+        if response.status_code == 400 and 'INVALID_ARGUMENT' in details and 'token' in error.get('message', '').lower():
+            return SendResult(DEAD_TOKEN, text)
+        if response.status_code == 429 or response.status_code >= 500:
+            return SendResult(TRANSIENT, text)
+        return SendResult(FAILED, text)
+
+
+class FcmDispatcher:
+    """Sends message dicts in batches with retry/backoff; dead tokens go to on_dead_tokens(tokens)."""
+
+    def __init__(self, transport, batch_size=FCM_BATCH_SIZE, max_retries=FCM_MAX_RETRIES,
+                 backoff_base_seconds=FCM_BACKOFF_BASE_SECONDS, on_dead_tokens=None, sleep=time.sleep):
+        self._transport = transport
+        self.batch_size = min(batch_size, getattr(transport, 'max_batch_size', batch_size))
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self._on_dead_tokens = on_dead_tokens
+        self._sleep = sleep
+        self._buffer = None
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+
+    def dispatch(self, messages):
+        """Send now; returns {'sent', 'failed', 'dead_tokens': [...]}."""
+        pending = list(messages)
+        sent = failed = misconfigured = 0
+        dead_tokens = set()
+        attempt = 0
+        batches = retries = 0
+        while pending:
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                batches += 1
+                for message, result in zip(batch, self._transport.send_batch(batch)):
+                    if result.status == SENT:
+                        sent += 1
+                    elif result.status == DEAD_TOKEN:
+                        dead_tokens.add(message['token'])
+                    elif result.status == MISCONFIGURED:
+                        failed += 1
+                        misconfigured += 1
+                        print(f"CRITICAL: FCM sender/project mismatch, check FCM credentials / FCM_PROJECT_ID (token kept): {result.error}")
+                    elif result.status == TRANSIENT and attempt < self.max_retries:
+                        retry.append(message)
+                    else:
+                        failed += 1
+                        print(f"FCM send failed ({result.status}): {result.error}")
+            pending = retry
+            if pending:
+                attempt += 1
+                retries += len(pending)
+                self._sleep(self.backoff_base_seconds * (2 ** (attempt - 1)))
+        with self._lock:
+            self._metrics.update(batches=batches, retries=retries, sent=sent, failed=failed, misconfigured=misconfigured,
+                                 dead_tokens=len(dead_tokens))
+        if dead_tokens and self._on_dead_tokens:
+            try:
+                self._on_dead_tokens(sorted(dead_tokens))
+            except Exception as e:
+                print(f"FCM dead token pruning failed: {type(e).__name__} - {e}")
+        return {'sent': sent, 'failed': failed, 'dead_tokens': sorted(dead_tokens)}
+
+    def enqueue(self, message):
+        """Send in the next batch window; falls back to an immediate send when the buffer is full."""
+        if self._buffer is None or not self._buffer.add(message['token'], message):
+            self.dispatch([message])
+
+    def start_batching(self, window_seconds, max_pending=10000):
+        """Route enqueue() through a write-behind buffer flushed every window_seconds."""
+        self._buffer = WriteBehindBuffer(
+            lambda batch: self.dispatch([message for messages in batch.values() for message in messages]),
+            window_seconds, max_pending=max_pending, flush_threshold=self.batch_size, name="fcm-dispatch")
+        self._buffer.install_shutdown_hooks()
+        return self
+
+    def flush(self):
+        return self._buffer.flush() if self._buffer else 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+        if self._buffer:
+            snapshot['buffer'] = self._buffer.stats()
+        return snapshot
+
+
+def prune_dead_tokens(cursor, tokens):
+    """Clear tokens FCM reported as unregistered/invalid; the caller commits."""
+    if not tokens:
+        return 0
+    cursor.execute(
+        f"UPDATE users SET fcm_token = NULL, updated_at = NOW() WHERE fcm_token IN ({', '.join(['%s'] * len(tokens))})",
+        tuple(tokens)
+    )
+    return cursor.rowcount
+
+
+def create_transport(transport=None, messaging_factory=None):
+    """Transport from FCM_TRANSPORT; `messaging_factory` returns firebase_admin.messaging (initialised)."""
+    transport = transport or FCM_TRANSPORT
+    if transport == 'http':
+        return HttpV1Transport()
+    if transport == 'firebase-admin':
+        return FirebaseAdminTransport(messaging_factory())
+    raise ValueError(f"Unknown FCM_TRANSPORT: {transport}")
@@ -0,0 +1,134 @@
+"""Durable, batched deletion of GCS objects (gcs_deletions table).
+
+Request handlers never delete from the bucket themselves. They enqueue the
+object in the same transaction that stops using it, and sweep() later deletes
+queued objects with GCS JSON API batch requests, one HTTP call per
+GCS_DELETE_BATCH_SIZE objects:
+
+    gcs_deletion.enqueue(cursor, [name], "staging")        # caller commits
+    gcs_deletion.sweep(db.connection, bucket, deadline_seconds=240)
+
+An entry can name a guard: an image_objects row that must still be
+unreferenced when the sweep runs. The sweep locks the guard rows while it
+deletes, so a concurrent image_objects.acquire() waits for it. Entries whose
+guard has references again are dropped without deleting, and a guard row is
+forgotten once none of its entries are left.
+Rows live in gcs_deletions (migrations/010_gcs_deletions.sql).
+"""
+import os
+import time
+
+from braves_common import image_objects
+
+# the JSON API accepts at most 100 calls per batch request
+GCS_DELETE_BATCH_SIZE = min(int(os.environ.get("GCS_DELETE_BATCH_SIZE", 100)), 100)
+GCS_DELETE_MAX_ATTEMPTS = int(os.environ.get("GCS_DELETE_MAX_ATTEMPTS", 5))
+GCS_DELETE_RETRY_BASE_SECONDS = int(os.environ.get("GCS_DELETE_RETRY_BASE_SECONDS", 60))
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def enqueue(cursor, object_names, reason, guard_object_name=None):
+    """Queue objects for deletion; queuing an object again makes it due now. The caller commits."""
+    if not object_names:
+        return
+    cursor.executemany(
+        """INSERT INTO gcs_deletions (object_name, guard_object_name, reason, attempts, run_after, created_at)
+           VALUES (%s, %s, %s, 0, NOW(), NOW())
+           ON DUPLICATE KEY UPDATE guard_object_name = VALUES(guard_object_name), reason = VALUES(reason),
+                                   attempts = 0, run_after = NOW(), last_error = NULL""",
+        [(object_name, guard_object_name, reason) for object_name in object_names]
+    )
+
+
+def delete_objects(bucket, object_names):
+    """Delete objects with one batch request per GCS_DELETE_BATCH_SIZE names.
+
+    Returns {object name: error} for the deletes that failed; a 404 counts as deleted.
+    """
+    errors = {}
+    for start in range(0, len(object_names), GCS_DELETE_BATCH_SIZE):
+        chunk = object_names[start:start + GCS_DELETE_BATCH_SIZE]
+        batch = bucket.client.batch(raise_exception=False)
+        try:
+            with batch:
+                for object_name in chunk:
+                    bucket.delete_blob(object_name)
+        except Exception as e:
+            errors.update((object_name, f"{type(e).__name__}: {e}") for object_name in chunk)
+            continue
+        # Batch.finish() keeps one response per deferred call, in call order
+        for object_name, response in zip(chunk, batch._responses):
+            if not (200 <= response.status_code < 300 or response.status_code == 404):
+                errors[object_name] = f"HTTP {response.status_code}: {response.text[:200]}"
+    return errors
+
+
+def _sweep_batch(conn, bucket, batch_size, max_attempts):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """SELECT object_name, guard_object_name, attempts FROM gcs_deletions
+               WHERE run_after <= NOW() AND attempts < %s
+               ORDER BY run_after
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (max_attempts, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0, 0, 0, 0
+
+        guards = sorted({row['guard_object_name'] for row in rows if row['guard_object_name']})
+        referenced = image_objects.lock_referenced(cursor, guards)
+        kept = [row['object_name'] for row in rows if row['guard_object_name'] in referenced]
+        due = [row for row in rows if row['guard_object_name'] not in referenced]
+        errors = delete_objects(bucket, [row['object_name'] for row in due])
+
+        finished = kept + [row['object_name'] for row in due if row['object_name'] not in errors]
+        if finished:
+            cursor.execute(f"DELETE FROM gcs_deletions WHERE object_name IN ({_placeholders(finished)})", tuple(finished))
+        if errors:
+            cursor.executemany(
+                """UPDATE gcs_deletions SET attempts = attempts + 1, last_error = %s,
+                          run_after = NOW() + INTERVAL %s SECOND
+                   WHERE object_name = %s""",
+                [(errors[row['object_name']][:1000], GCS_DELETE_RETRY_BASE_SECONDS * 2 ** row['attempts'], row['object_name'])
+                 for row in due if row['object_name'] in errors]
+            )
+
+        unreferenced = [guard for guard in guards if guard not in referenced]
+        if unreferenced:
+            cursor.execute(
+                f"SELECT DISTINCT guard_object_name FROM gcs_deletions WHERE guard_object_name IN ({_placeholders(unreferenced)})",
+                tuple(unreferenced)
+            )
+            pending = {row['guard_object_name'] for row in cursor.fetchall()}
+            image_objects.forget(cursor, [guard for guard in unreferenced if guard not in pending])
+        conn.commit()
+    finally:
+        cursor.close()
+    return len(rows), len(due) - len(errors), len(kept), len(errors)
+
+
+def sweep(connect, bucket, deadline_seconds, batch_size=GCS_DELETE_BATCH_SIZE, max_attempts=GCS_DELETE_MAX_ATTEMPTS):
+    """Delete due queued objects until the queue is drained or deadline_seconds pass.
+
+    `connect` is a zero-argument context manager factory (db.connection). Each
+    batch is claimed, deleted and settled in one transaction, so several
+    sweeps can run at once. Returns {'deleted', 'kept', 'failed'} counts.
+    """
+    started = time.monotonic()
+    totals = {"deleted": 0, "kept": 0, "failed": 0}
+    while time.monotonic() - started < deadline_seconds:
+        with connect() as conn:
+            claimed, deleted, kept, failed = _sweep_batch(conn, bucket, batch_size, max_attempts)
+        totals["deleted"] += deleted
+        totals["kept"] += kept
+        totals["failed"] += failed
+        if claimed < batch_size:
+            break
+    return totals
@@ -0,0 +1,75 @@
+"""Idempotency-Key support: store the response of a request so client retries replay it.
+
+    state = idempotency.begin(cursor, user_id, key, endpoint, fingerprint)
+    # commit, then:
+    #   None                        -> first time: do the work, then complete() (or abandon() on 5xx)
+    #   state['status'] == 'completed' -> return state['response_code'], state['response_body']
+    #   state['status'] == 'in_progress' -> another attempt is still running (409)
+    #   state['fingerprint'] differs -> the key was reused for a different request (422)
+
+Rows live in idempotency_keys (migrations/004_idempotency_keys.sql) and expire
+after IDEMPOTENCY_TTL_HOURS; purge_expired() removes them.
+"""
+import os
+import json
+import hashlib
+import datetime
+
+import mysql.connector
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", 24))
+MAX_KEY_LENGTH = 128
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+
+def fingerprint(*parts):
+    """Stable hash of the request parameters a key is bound to."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def begin(cursor, user_id, key, endpoint, request_fingerprint):
+    """Claim the key for this request; returns None if claimed, else the existing row (dict)."""
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    try:
+        cursor.execute(
+            """INSERT INTO idempotency_keys (user_id, idem_key, endpoint, fingerprint, status, created_at, expires_at)
+               VALUES (%s, %s, %s, %s, %s, UTC_TIMESTAMP(), %s)""",
+            (user_id, key, endpoint, request_fingerprint, IN_PROGRESS, expires_at)
+        )
+        return None
+    except mysql.connector.IntegrityError:
+        pass
+    cursor.execute(
+        """SELECT endpoint, fingerprint, status, response_code, response_body, expires_at FROM idempotency_keys
+           WHERE user_id = %s AND idem_key = %s""",
+        (user_id, key)
+    )
+    row = cursor.fetchone()
+    if row is None or row['expires_at'] <= datetime.datetime.utcnow():
+        # expired (or purged between the two statements): take the key over
+        cursor.execute("DELETE FROM idempotency_keys WHERE user_id = %s AND idem_key = %s", (user_id, key))
+        return begin(cursor, user_id, key, endpoint, request_fingerprint)
+    if row['response_body'] is not None and isinstance(row['response_body'], (str, bytes, bytearray)):
+        row['response_body'] = json.loads(row['response_body'])
+    return row
+
+
+def complete(cursor, user_id, key, response_code, response_body):
+    cursor.execute(
+        """UPDATE idempotency_keys SET status = %s, response_code = %s, response_body = %s
+           WHERE user_id = %s AND idem_key = %s""",
+        (COMPLETED, response_code, json.dumps(response_body, ensure_ascii=False, default=str), user_id, key)
+    )
+
+
+def abandon(cursor, user_id, key):
+    """Release the key after a failure worth retrying (5xx), so the retry runs again."""
+    cursor.execute("DELETE FROM idempotency_keys WHERE user_id = %s AND idem_key = %s AND status = %s",
+                   (user_id, key, IN_PROGRESS))
+
+
+def purge_expired(cursor):
+    cursor.execute("DELETE FROM idempotency_keys WHERE expires_at < UTC_TIMESTAMP()")
+    return cursor.rowcount
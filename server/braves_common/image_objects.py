@@ -0,0 +1,152 @@
+"""Reference-counted, content-addressed completion image objects (image_objects table).
+
+Uploads are stored once per content, under CONTENT_PREFIX + sha256 + extension,
+and every mission whose completion_image points at an object holds one
+reference. Re-uploading bytes that are already stored (client retries, the same
+photo on two missions) only takes a reference instead of uploading again.
+
+    stored = image_objects.acquire(cursor, name, sha256, size, content_type)
+    # commit; upload only if not stored, then mark_stored() with the mission update
+    image_objects.release(cursor, old_name)   # same transaction as the mission update
+
+Nothing here touches the bucket. Objects that have been unreferenced for a
+grace period are queued for deletion by the uploader's sweep_image_objects
+entry point and marked with mark_deleting(); braves_common.gcs_deletion
+deletes them and forgets the row. An acquire() in between finds stored = FALSE
+and uploads again, and the queued delete is dropped because the row has a
+reference again.
+Rows live in image_objects (migrations/009_image_objects.sql).
+"""
+
+CONTENT_PREFIX = "missions/sha256/"
+
+
+def content_object_name(sha256_hex, extension):
+    return f"{CONTENT_PREFIX}{sha256_hex}{extension}"
+
+
+def _first_column(row):
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def acquire(cursor, object_name, sha256=None, size=None, content_type=None, stored=False):
+    """Take a reference, creating the row if needed; returns True if the object is already in the bucket. The caller commits."""
+    cursor.execute(
+        """INSERT INTO image_objects (object_name, sha256, size, content_type, ref_count, stored, created_at, updated_at)
+           VALUES (%s, %s, %s, %s, 1, %s, NOW(), NOW())
+           ON DUPLICATE KEY UPDATE ref_count = ref_count + 1, zero_since = NULL, stored = stored OR %s, updated_at = NOW()""",
+        (object_name, sha256, size, content_type, stored, stored)
+    )
+    cursor.execute("SELECT stored FROM image_objects WHERE object_name = %s", (object_name,))
+    return bool(_first_column(cursor.fetchone()))
+
+
+def mark_stored(cursor, object_name):
+    """Record that the upload for an acquired object finished. The caller commits."""
+    cursor.execute("UPDATE image_objects SET stored = TRUE, updated_at = NOW() WHERE object_name = %s", (object_name,))
+
+
+def release(cursor, object_name):
+    """Drop a reference. The caller commits.
+
+    An object uploaded before this table existed has no row; it is adopted
+    with zero references, so the sweep collects it like any other.
+    """
+    # assignments run left to right: zero_since looks at the count before the decrement
+    cursor.execute(
+        """INSERT INTO image_objects (object_name, ref_count, stored, zero_since, created_at, updated_at)
+           VALUES (%s, 0, TRUE, NOW(), NOW(), NOW())
+           ON DUPLICATE KEY UPDATE zero_since = IF(ref_count <= 1, NOW(), NULL),
+                                   ref_count = GREATEST(ref_count - 1, 0), updated_at = NOW()""",
+        (object_name,)
+    )
+
+
+def adopt(cursor, object_names):
+    """Track objects found in the bucket without a row, with zero references. The caller commits.
+
+    reconcile() recounts them before they can become garbage, so adopting an
+    object that a mission still uses is safe.
+    """
+    cursor.executemany(
+        """INSERT INTO image_objects (object_name, ref_count, stored, zero_since, created_at, updated_at)
+           VALUES (%s, 0, TRUE, NOW(), NOW(), NOW())
+           ON DUPLICATE KEY UPDATE object_name = object_name""",
+        [(object_name,) for object_name in object_names]
+    )
+
+
+def lock_garbage(cursor, grace_seconds, limit):
+    """Lock up to `limit` objects unreferenced for longer than grace_seconds; returns their names.
+
+    Queue them for deletion, then mark_deleting() them and commit.
+    """
+    cursor.execute(
+        """SELECT object_name FROM image_objects
+           WHERE ref_count = 0 AND zero_since < NOW() - INTERVAL %s SECOND
+           ORDER BY zero_since
+           LIMIT %s
+           FOR UPDATE SKIP LOCKED""",
+        (grace_seconds, limit)
+    )
+    return [_first_column(row) for row in cursor.fetchall()]
+
+
+def mark_deleting(cursor, object_names):
+    """Flag unreferenced objects whose deletion is queued: no longer stored, and out of lock_garbage()'s reach."""
+    if not object_names:
+        return 0
+    cursor.execute(
+        f"""UPDATE image_objects SET stored = FALSE, zero_since = NULL, updated_at = NOW()
+            WHERE ref_count = 0 AND object_name IN ({', '.join(['%s'] * len(object_names))})""",
+        tuple(object_names)
+    )
+    return cursor.rowcount
+
+
+def lock_referenced(cursor, object_names):
+    """Lock the rows of object_names until commit; returns the names that have references."""
+    if not object_names:
+        return set()
+    cursor.execute(
+        f"SELECT object_name, ref_count FROM image_objects WHERE object_name IN ({', '.join(['%s'] * len(object_names))}) FOR UPDATE",
+        tuple(object_names)
+    )
+    referenced = set()
+    for row in cursor.fetchall():
+        object_name, ref_count = row.values() if isinstance(row, dict) else row
+        if ref_count > 0:
+            referenced.add(object_name)
+    return referenced
+
+
+def forget(cursor, object_names):
+    if not object_names:
+        return 0
+    cursor.execute(
+        f"DELETE FROM image_objects WHERE ref_count = 0 AND object_name IN ({', '.join(['%s'] * len(object_names))})",
+        tuple(object_names)
+    )
+    return cursor.rowcount
+
+
+def reconcile(cursor, url_prefix, settled_seconds):
+    """Recount references from missions.completion_image; returns the number of rows that had drifted. The caller commits.
+
+    Only rows untouched for settled_seconds are recounted. An upload between
+    acquire() and its mission update holds a reference that no mission shows yet.
+    """
+    cursor.execute(
+        """UPDATE image_objects o
+           LEFT JOIN (
+               SELECT completion_image, COUNT(*) AS refs
+               FROM missions
+               WHERE completion_image LIKE CONCAT(%s, '%%')
+               GROUP BY completion_image
+           ) m ON m.completion_image = CONCAT(%s, o.object_name)
+           SET o.zero_since = IF(COALESCE(m.refs, 0) = 0, COALESCE(o.zero_since, NOW()), NULL),
+               o.ref_count = COALESCE(m.refs, 0)
+           WHERE o.updated_at < NOW() - INTERVAL %s SECOND""",
+        (url_prefix, url_prefix, settled_seconds)
+    )
+    return cursor.rowcount
@@ -0,0 +1,392 @@
+"""Durable job queue for work that should not run inside the request (AI generation, push).
+
+Handlers enqueue a job and answer right away; a JobWorkerPool claims jobs and
+runs the registered handler for each kind with bounded concurrency. A job that
+raises is retried with exponential backoff until `max_attempts`, then marked
+failed. Claimed jobs carry a lease: if a worker dies mid-job the lease runs out
+and another worker picks the job up again, so handlers must be idempotent. A
+lease that runs out after the last attempt marks the job failed instead, so a
+job that keeps crashing its worker is not reclaimed forever.
+
+Two backends share the same interface:
+  - MySQLJobQueue: the `jobs` table (migrations/002_job_queue.sql), claimed
+    with SELECT ... FOR UPDATE SKIP LOCKED so several instances can drain it.
+  - SQLiteJobQueue: a local file-backed stand-in for development and tests.
+create_job_queue() picks one from JOB_QUEUE_BACKEND.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+import collections
+
+JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "mysql")  # mysql | sqlite
+JOB_QUEUE_SQLITE_PATH = os.environ.get("JOB_QUEUE_SQLITE_PATH", "/tmp/braves_jobs.sqlite3")
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", 5))
+LEASE_EXPIRED_ERROR = "Lease expired on the last attempt"
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+Job = collections.namedtuple('Job', 'id kind payload attempts')
+
+
+def _utcnow():
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+def retry_delay_seconds(attempts):
+    """Exponential backoff after the n-th failed attempt (5s, 10s, 20s, ...)."""
+    return JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1))
+
+
+class MySQLJobQueue:
+    """Job queue on the `jobs` table; `connect` is a zero-argument context manager factory (db.connection)."""
+
+    def __init__(self, connect, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self._connect = connect
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, kind, payload, job_id=None):
+        job_id = job_id or str(uuid.uuid4())
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    """INSERT INTO jobs (id, kind, payload, status, attempts, run_after, created_at, updated_at)
+                       VALUES (%s, %s, %s, %s, 0, UTC_TIMESTAMP(), UTC_TIMESTAMP(), UTC_TIMESTAMP())""",
+                    (job_id, kind, json.dumps(payload, ensure_ascii=False), PENDING)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+        return job_id
+
+    def claim(self, worker_id, limit=1):
+        """Lease up to `limit` runnable jobs (pending, or running with an expired lease and attempts left)."""
+        with self._connect() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    """UPDATE jobs SET status = %s, last_error = %s, locked_by = NULL, lease_expires_at = NULL,
+                              updated_at = UTC_TIMESTAMP()
+                       WHERE status = %s AND lease_expires_at < UTC_TIMESTAMP() AND attempts >= %s""",
+                    (FAILED, LEASE_EXPIRED_ERROR, RUNNING, self.max_attempts)
+                )
+                cursor.execute(
+                    """SELECT id, kind, payload, attempts FROM jobs
+                       WHERE (status = %s AND run_after <= UTC_TIMESTAMP())
+                          OR (status = %s AND lease_expires_at < UTC_TIMESTAMP())
+                       ORDER BY run_after
+                       LIMIT %s
+                       FOR UPDATE SKIP LOCKED""",
+                    (PENDING, RUNNING, limit)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    conn.commit()
+                    return []
+                ids = [row['id'] for row in rows]
+                cursor.execute(
+                    f"""UPDATE jobs SET status = %s, attempts = attempts + 1, locked_by = %s,
+                               lease_expires_at = UTC_TIMESTAMP() + INTERVAL %s SECOND, updated_at = UTC_TIMESTAMP()
+                        WHERE id IN ({', '.join(['%s'] * len(ids))})""",
+                    (RUNNING, worker_id, self.lease_seconds, *ids)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+        return [Job(row['id'], row['kind'], json.loads(row['payload']), row['attempts'] + 1) for row in rows]
+
+    def complete(self, job_id):
+        self._finish(job_id, DONE, None, None)
+
+    def fail(self, job, error):
+        """Reschedule with backoff, or mark failed once max_attempts is reached. Returns the new status."""
+        if job.attempts >= self.max_attempts:
+            self._finish(job.id, FAILED, error, None)
+            return FAILED
+        self._finish(job.id, PENDING, error, retry_delay_seconds(job.attempts))
+        return PENDING
+
+    def get(self, job_id):
+        """{'status', 'attempts', 'last_error'} of a job, or None."""
+        with self._connect() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT status, attempts, last_error FROM jobs WHERE id = %s", (job_id,))
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+
+    def purge(self, older_than_days=7):
+        """Delete finished jobs older than the given age."""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "DELETE FROM jobs WHERE status IN (%s, %s) AND updated_at < UTC_TIMESTAMP() - INTERVAL %s DAY",
+                    (DONE, FAILED, older_than_days)
+                )
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    def _finish(self, job_id, status, error, retry_in_seconds):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    """UPDATE jobs SET status = %s, last_error = %s, locked_by = NULL, lease_expires_at = NULL,
+                              run_after = UTC_TIMESTAMP() + INTERVAL %s SECOND, updated_at = UTC_TIMESTAMP()
+                       WHERE id = %s""",
+                    (status, error[:1000] if error else None, int(retry_in_seconds or 0), job_id)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+
+class SQLiteJobQueue:
+    """File-backed stand-in with the same interface as MySQLJobQueue (single host only)."""
+
+    def __init__(self, path=JOB_QUEUE_SQLITE_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                   id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,
+                   status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+                   run_after TEXT NOT NULL, lease_expires_at TEXT, locked_by TEXT, last_error TEXT,
+                   created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)")
+
+    def enqueue(self, kind, payload, job_id=None):
+        job_id = job_id or str(uuid.uuid4())
+        now = _utcnow().isoformat()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, payload, status, attempts, run_after, created_at, updated_at) VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), PENDING, now, now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id, limit=1):
+        now = _utcnow()
+        lease_until = (now + datetime.timedelta(seconds=self.lease_seconds)).isoformat()
+        now = now.isoformat()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    """UPDATE jobs SET status = ?, last_error = ?, locked_by = NULL, lease_expires_at = NULL, updated_at = ?
+                       WHERE status = ? AND lease_expires_at < ? AND attempts >= ?""",
+                    (FAILED, LEASE_EXPIRED_ERROR, now, RUNNING, now, self.max_attempts)
+                )
+                rows = self._db.execute(
+                    """SELECT id, kind, payload, attempts FROM jobs
+                       WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_expires_at < ?)
+                       ORDER BY run_after LIMIT ?""",
+                    (PENDING, now, RUNNING, now, limit)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_by = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    [(RUNNING, worker_id, lease_until, now, row[0]) for row in rows]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [Job(row[0], row[1], json.loads(row[2]), row[3] + 1) for row in rows]
+
+    def complete(self, job_id):
+        self._finish(job_id, DONE, None, None)
+
+    def fail(self, job, error):
+        if job.attempts >= self.max_attempts:
+            self._finish(job.id, FAILED, error, None)
+            return FAILED
+        self._finish(job.id, PENDING, error, retry_delay_seconds(job.attempts))
+        return PENDING
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT status, attempts, last_error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return {'status': row[0], 'attempts': row[1], 'last_error': row[2]} if row else None
+
+    def purge(self, older_than_days=7):
+        cutoff = (_utcnow() - datetime.timedelta(days=older_than_days)).isoformat()
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff)
+            ).rowcount
+
+    def _finish(self, job_id, status, error, retry_in_seconds):
+        now = _utcnow()
+        run_after = (now + datetime.timedelta(seconds=retry_in_seconds or 0)).isoformat()
+        with self._lock:
+            self._db.execute(
+                """UPDATE jobs SET status = ?, last_error = ?, locked_by = NULL, lease_expires_at = NULL,
+                          run_after = ?, updated_at = ? WHERE id = ?""",
+                (status, error[:1000] if error else None, run_after, now.isoformat(), job_id)
+            )
+
+
+def create_job_queue(backend=None):
+    backend = backend or JOB_QUEUE_BACKEND
+    if backend == 'sqlite':
+        return SQLiteJobQueue()
+    if backend == 'mysql':
+        from braves_common.db import connection
+        return MySQLJobQueue(connection)
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+
+
+class JobWorkerPool:
+    """Runs handlers[job.kind](payload) for claimed jobs on up to `concurrency` threads."""
+
+    def __init__(self, queue, handlers, concurrency=4, poll_interval=1.0, name="job-worker"):
+        self.queue = queue
+        self.handlers = dict(handlers)
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+
+    def start(self):
+        """Start the background workers (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.concurrency):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after an enqueue instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def drain(self, max_jobs=None, deadline_seconds=None):
+        """Process runnable jobs on the calling thread plus concurrency - 1 helpers until none are left.
+
+        For scheduler/push-triggered entry points that own the instance only for
+        the duration of a request. A worker whose claim fails stops; the others
+        finish and are joined before returning. Returns the number of jobs processed.
+        """
+        started = time.monotonic()
+        processed = collections.Counter()
+
+        def work(worker_id):
+            while True:
+                if deadline_seconds is not None and time.monotonic() - started >= deadline_seconds:
+                    return
+                with self._lock:
+                    if max_jobs is not None and processed['claimed'] >= max_jobs:
+                        return
+                    processed['claimed'] += 1
+                try:
+                    jobs = self.queue.claim(worker_id, limit=1)
+                except Exception as e:
+                    print(f"[{self.name}] {worker_id} claim failed, stopping this worker: {type(e).__name__} - {e}")
+                    with self._lock:
+                        self._metrics['errors'] += 1
+                    return
+                if not jobs:
+                    return
+                self._execute(jobs[0])
+                with self._lock:
+                    processed['done'] += 1
+
+        helpers = [threading.Thread(target=work, args=(f"{self.name}-drain-{index}",), daemon=True)
+                   for index in range(1, self.concurrency)]
+        for thread in helpers:
+            thread.start()
+        try:
+            work(f"{self.name}-drain-0")
+        finally:
+            for thread in helpers:
+                thread.join()
+        return processed['done']
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def _run(self):
+        worker_id = f"{threading.current_thread().name}-{uuid.uuid4().hex[:8]}"
+        while not self._stop.is_set():
+            try:
+                jobs = self.queue.claim(worker_id, limit=1)
+            except Exception as e:
+                print(f"[{self.name}] claim failed: {type(e).__name__} - {e}")
+                with self._lock:
+                    self._metrics['errors'] += 1
+                jobs = []
+            if not jobs:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(jobs[0])
+
+    def _execute(self, job):
+        """Run one claimed job and record the outcome; never raises, so a worker thread survives queue errors.
+
+        If recording the outcome fails, the job stays leased and is claimed
+        again once the lease runs out (its attempt was counted by claim()).
+        """
+        handler = self.handlers.get(job.kind)
+        started = time.monotonic()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{job.kind}'")
+            handler(job.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            try:
+                status = self.queue.fail(job, error)
+            except Exception as settle_err:
+                self._settle_failed(job, settle_err)
+                return
+            print(f"[{self.name}] job {job.id} ({job.kind}) attempt {job.attempts} failed -> {status}: {error}")
+            with self._lock:
+                self._metrics['failed' if status == FAILED else 'retried'] += 1
+            return
+        try:
+            self.queue.complete(job.id)
+        except Exception as settle_err:
+            self._settle_failed(job, settle_err)
+            return
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        with self._lock:
+            self._metrics['completed'] += 1
+            self._metrics['run_ms_total'] += elapsed_ms
+
+    def _settle_failed(self, job, error):
+        print(f"[{self.name}] job {job.id} ({job.kind}) could not be settled, retried after its lease: {type(error).__name__} - {error}")
+        with self._lock:
+            self._metrics['errors'] += 1
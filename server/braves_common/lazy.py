@@ -0,0 +1,35 @@
+"""Thread-safe lazy singletons for heavy clients (polygon data, SDK apps, ...).
+
+Module-level `LazySingleton(factory)` costs nothing at import time; the factory
+runs on the first get() and every later caller, on any thread, receives the
+same object. A factory that raises is retried on the next get(), so a
+transient start-up failure does not poison the instance.
+"""
+import time
+import threading
+
+
+class LazySingleton:
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self.name = name or getattr(factory, '__name__', 'lazy')
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+        self.init_seconds = None
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                started = time.perf_counter()
+                self._value = self._factory()
+                self.init_seconds = time.perf_counter() - started
+                self._ready = True
+                print(f"[{self.name}] initialized lazily in {self.init_seconds * 1000:.1f} ms")
+        return self._value
+
+    @property
+    def initialized(self):
+        return self._ready
@@ -0,0 +1,188 @@
+"""Append-only location history (location_history) and the latest-position view over it.
+
+Every fix is appended to the day-partitioned location_history table with a
+multi-row INSERT. location_logs keeps one row per user and acts as a
+materialized "latest position" view: it is refreshed in the same transaction
+as the append and only ever moves forward in time, so late or out-of-order
+uploads cannot overwrite a newer position. rebuild_latest() recomputes it
+from history if the two ever drift.
+
+Fixes are (latitude, longitude, accuracy, recorded_at) tuples. recorded_at
+may be timezone-aware (converted to UTC) or naive (taken as UTC); it is stored
+as naive UTC, the same clock as location_logs.updated_at, so the "only moves
+forward" guard compares like with like.
+"""
+import datetime
+
+PARTITION_PREFIX = 'p'
+FUTURE_PARTITION = 'p_future'
+
+# updated_at is compared by the other assignments, so it must be assigned last
+_UPSERT_LATEST_SQL = """
+    INSERT INTO location_logs (user_id, latitude, longitude, accuracy, updated_at)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE
+        latitude = IF(VALUES(updated_at) >= updated_at, VALUES(latitude), latitude),
+        longitude = IF(VALUES(updated_at) >= updated_at, VALUES(longitude), longitude),
+        accuracy = IF(VALUES(updated_at) >= updated_at, VALUES(accuracy), accuracy),
+        updated_at = GREATEST(updated_at, VALUES(updated_at))
+"""
+
+
+def to_utc(recorded_at):
+    """recorded_at as a naive UTC datetime (aware values are converted, naive ones are taken as UTC)."""
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return recorded_at
+
+
+def append_fixes(cursor, user_fixes):
+    """Append fixes for one or more users and refresh their latest position.
+
+    `user_fixes` is an iterable of (user_id, latitude, longitude, accuracy, recorded_at).
+    Issues one multi-row INSERT into location_history and one multi-row UPSERT
+    into location_logs; the caller commits.
+    """
+    rows = [tuple(row[:4]) + (to_utc(row[4]),) for row in user_fixes]
+    if not rows:
+        return 0
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    cursor.execute(
+        "INSERT INTO location_history (user_id, latitude, longitude, accuracy, recorded_at) VALUES " + placeholders,
+        tuple(value for row in rows for value in row)
+    )
+    refresh_latest(cursor, rows)
+    return len(rows)
+
+
+def append_user_fixes(cursor, user_id, fixes):
+    """append_fixes() for a single user's (latitude, longitude, accuracy, recorded_at) fixes."""
+    return append_fixes(cursor, ((user_id,) + tuple(fix) for fix in fixes))
+
+
+def refresh_latest(cursor, user_fixes):
+    """UPSERT the newest of the given fixes per user into location_logs."""
+    latest = {}
+    for row in user_fixes:
+        row = tuple(row[:4]) + (to_utc(row[4]),)
+        current = latest.get(row[0])
+        if current is None or row[4] >= current[4]:
+            latest[row[0]] = row
+    if not latest:
+        return
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s)"] * len(latest))
+    cursor.execute(
+        _UPSERT_LATEST_SQL.format(values=placeholders),
+        tuple(value for row in latest.values() for value in row)
+    )
+
+
+def get_track(cursor, user_id, since, until, limit=5000):
+    """Fixes of one user between `since` and `until` (oldest first), for replaying a trip."""
+    cursor.execute(
+        """SELECT latitude, longitude, accuracy, recorded_at
+           FROM location_history
+           WHERE user_id = %s AND recorded_at >= %s AND recorded_at < %s
+           ORDER BY recorded_at ASC
+           LIMIT %s""",
+        (user_id, since, until, limit)
+    )
+    return cursor.fetchall()
+
+
+def rebuild_latest(cursor, since):
+    """Recompute location_logs from history for users with fixes at or after `since`."""
+    cursor.execute(
+        """INSERT INTO location_logs (user_id, latitude, longitude, accuracy, updated_at)
+           SELECT h.user_id, h.latitude, h.longitude, h.accuracy, h.recorded_at
+           FROM location_history h
+           JOIN (SELECT user_id, MAX(recorded_at) AS recorded_at
+                 FROM location_history WHERE recorded_at >= %s GROUP BY user_id) newest
+             ON h.user_id = newest.user_id AND h.recorded_at = newest.recorded_at
+           ON DUPLICATE KEY UPDATE
+               latitude = IF(h.recorded_at >= location_logs.updated_at, h.latitude, location_logs.latitude),
+               longitude = IF(h.recorded_at >= location_logs.updated_at, h.longitude, location_logs.longitude),
+               accuracy = IF(h.recorded_at >= location_logs.updated_at, h.accuracy, location_logs.accuracy),
+               updated_at = GREATEST(location_logs.updated_at, h.recorded_at)""",
+        (since,)
+    )
+    return cursor.rowcount
+
+
+# --- Partition maintenance (DDL: each statement commits implicitly) ---
+
+def partition_name(day):
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def list_day_partitions(cursor):
+    """Existing daily partitions as {date: partition_name}."""
+    cursor.execute(
+        """SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+           WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'location_history'
+             AND PARTITION_NAME IS NOT NULL"""
+    )
+    partitions = {}
+    for row in cursor.fetchall():
+        name = row['PARTITION_NAME'] if isinstance(row, dict) else row[0]
+        if name == FUTURE_PARTITION:
+            continue
+        partitions[datetime.datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date()] = name
+    return partitions
+
+
+def ensure_partitions(cursor, today, days_ahead=3):
+    """Split p_future so that every day from `today` to today + days_ahead has its own partition."""
+    existing = list_day_partitions(cursor)
+    start = max(existing) + datetime.timedelta(days=1) if existing else today
+    last = today + datetime.timedelta(days=days_ahead)
+    days = []
+    day = start
+    while day <= last:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    if not days:
+        return []
+    definitions = ", ".join(
+        f"PARTITION {partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + datetime.timedelta(days=1):%Y-%m-%d}'))"
+        for day in days
+    )
+    cursor.execute(
+        f"ALTER TABLE location_history REORGANIZE PARTITION {FUTURE_PARTITION} INTO "
+        f"({definitions}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)"
+    )
+    return [partition_name(day) for day in days]
+
+
+def drop_expired_partitions(cursor, today, retention_days):
+    """Drop whole days older than the retention window (instant, unlike DELETE)."""
+    cutoff = today - datetime.timedelta(days=retention_days)
+    expired = [name for day, name in sorted(list_day_partitions(cursor).items()) if day < cutoff]
+    if expired:
+        cursor.execute(f"ALTER TABLE location_history DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def compact_day(cursor, day, interval_seconds):
+    """Thin one day's partition to at most one fix per user per `interval_seconds`.
+
+    Keeps the fix with the latest recorded_at in each bucket (ties broken by
+    id), not the last one inserted: batched and offline uploads arrive out of
+    order. Buckets are seconds since midnight of the (UTC) day, independent of
+    the session time zone.
+    """
+    name = list_day_partitions(cursor).get(day)
+    if name is None:
+        return 0
+    cursor.execute(
+        f"""DELETE h FROM location_history PARTITION ({name}) h
+            JOIN (SELECT id, recorded_at FROM (
+                      SELECT id, recorded_at,
+                             ROW_NUMBER() OVER (PARTITION BY user_id, FLOOR(TIME_TO_SEC(recorded_at) / %s)
+                                                ORDER BY recorded_at DESC, id DESC) AS bucket_rank
+                      FROM location_history PARTITION ({name})) ranked
+                  WHERE bucket_rank > 1) dropped
+              ON h.id = dropped.id AND h.recorded_at = dropped.recorded_at""",
+        (interval_seconds,)
+    )
+    return cursor.rowcount
@@ -0,0 +1,79 @@
+"""Mission counters kept on travels (total_missions, completed_missions).
+
+The travel list and the per-travel mission summary read these columns instead
+of aggregating missions on every request. Every write that changes a travel's
+missions goes through this module, in the same transaction as the mission
+change, so the counters move together with the rows they count. reconcile()
+recomputes them from missions if the two ever drift (manual edits, a writer
+that bypassed these helpers).
+"""
+
+_INSERT_MISSION_SQL = "INSERT INTO missions (travel_id, title, content, created_at, updated_at) VALUES (%s, %s, %s, NOW(), NOW())"
+
+
+def insert_mission(cursor, travel_id, title, content):
+    """Insert a mission and bump the travel's total_missions; returns the new mission id. The caller commits."""
+    cursor.execute(_INSERT_MISSION_SQL, (travel_id, title, content))
+    mission_id = cursor.lastrowid
+    cursor.execute("UPDATE travels SET total_missions = total_missions + 1 WHERE id = %s", (travel_id,))
+    return mission_id
+
+
+def mark_completed(cursor, mission_id, user_id):
+    """Mark a mission of user_id completed and bump completed_missions in one statement. The caller commits.
+
+    Returns False when nothing changed (no such mission, another user's
+    mission, or already completed - probe to tell which). The is_completed
+    guard makes concurrent completions of the same mission count once.
+    """
+    cursor.execute(
+        """UPDATE missions m JOIN travels t ON m.travel_id = t.id
+           SET m.is_completed = TRUE, m.updated_at = NOW(),
+               t.completed_missions = t.completed_missions + 1
+           WHERE m.id = %s AND t.user_id = %s AND m.is_completed = FALSE""",
+        (mission_id, user_id)
+    )
+    return cursor.rowcount > 0
+
+
+def reconcile(cursor, travel_ids=None):
+    """Recompute the counters from missions; returns the ids of the users whose travels had drifted. The caller commits.
+
+    Drifted travels are found and locked first, so only their rows are
+    rewritten and the caller can invalidate those users' cached lists.
+    """
+    where = ""
+    params = ()
+    if travel_ids is not None:
+        travel_ids = list(travel_ids)
+        if not travel_ids:
+            return set()
+        where = f"AND t.id IN ({', '.join(['%s'] * len(travel_ids))})"
+        params = tuple(travel_ids)
+    cursor.execute(
+        f"""SELECT t.id, t.user_id FROM travels t
+            LEFT JOIN (
+                SELECT travel_id, COUNT(*) AS total_missions,
+                       COALESCE(SUM(CASE WHEN is_completed = TRUE THEN 1 ELSE 0 END), 0) AS completed_missions
+                FROM missions
+                GROUP BY travel_id
+            ) m ON m.travel_id = t.id
+            WHERE (t.total_missions <> COALESCE(m.total_missions, 0)
+                   OR t.completed_missions <> COALESCE(m.completed_missions, 0))
+            {where}
+            FOR UPDATE OF t""",
+        params
+    )
+    drifted = cursor.fetchall()
+    if not drifted:
+        return set()
+    drifted_ids = [row[0] for row in drifted]
+    # recount under the row locks, so a mission written since the SELECT is included
+    cursor.execute(
+        f"""UPDATE travels t
+            SET t.total_missions = (SELECT COUNT(*) FROM missions WHERE travel_id = t.id),
+                t.completed_missions = (SELECT COUNT(*) FROM missions WHERE travel_id = t.id AND is_completed = TRUE)
+            WHERE t.id IN ({', '.join(['%s'] * len(drifted_ids))})""",
+        tuple(drifted_ids)
+    )
+    return {row[1] for row in drifted}
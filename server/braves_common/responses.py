@@ -0,0 +1,27 @@
+"""Fast JSON responses for the {"code", "success", "msg", ...} envelope."""
+import json
+import datetime
+import decimal
+import uuid
+
+from flask import Response
+
+def _json_default(o):
+    if isinstance(o, (datetime.datetime, datetime.date)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def json_response(payload, status=None):
+    """Drop-in replacement for jsonify(payload): one encoder pass, no key sorting or app context lookups."""
+    return Response(_encoder.encode(payload), status=status, mimetype='application/json')
+
+
+def error_response(code, msg):
+    """(response, status) tuple for a failed request in the standard envelope."""
+    return json_response({"code": code, "success": False, "msg": msg}), code
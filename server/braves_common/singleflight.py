@@ -0,0 +1,62 @@
+"""Single-flight de-duplication of concurrent identical work within one instance.
+
+The first caller for a key runs the function; callers arriving while it is
+still running wait for it and receive the same result (or exception) instead
+of repeating the work. Once the call finishes the key is forgotten, so later
+calls run again. Retries across instances are handled by idempotency keys
+(braves_common/idempotency.py), not here.
+"""
+import threading
+import collections
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per key at a time; returns (result, shared) where shared is True for followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._metrics['calls'] += 1
+            else:
+                call.waiters += 1
+                self._metrics['shared'] += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"[{self.name}] timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot['in_flight'] = len(self._calls)
+        return snapshot
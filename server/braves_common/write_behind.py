@@ -0,0 +1,161 @@
+"""In-process write-behind buffer that coalesces writes per key and flushes them in batches.
+
+Requests call add(key, item) and return immediately; a background thread hands
+everything collected during the flush window to `flush_fn` in one call. The
+buffer is bounded: when it is full add() returns False and the caller should
+write synchronously instead, so back-pressure never turns into data loss.
+Pending items are flushed on close(), which runs at interpreter exit and on
+SIGTERM (Cloud Run / Cloud Functions gen2 shutdown).
+
+If flush_fn raises, the whole batch is put back and retried on the next flush,
+which suits transient errors (lost connection). Errors caused by individual
+items would then block every later flush, so flush_fn should handle those
+itself, e.g. by retrying smaller groups and dropping what still fails.
+
+Background flushing only makes progress between requests when the instance
+keeps its CPU allocated; without that, items wait until the next request.
+"""
+import time
+import atexit
+import signal
+import threading
+import collections
+
+
+class WriteBehindBuffer:
+    """Collects (key, item) pairs and flushes them every `window_seconds` via flush_fn(dict key -> [items])."""
+
+    def __init__(self, flush_fn, window_seconds, max_pending=10000, flush_threshold=None, name="write-behind"):
+        self._flush_fn = flush_fn
+        self.window_seconds = window_seconds
+        self.max_pending = max_pending
+        self.flush_threshold = flush_threshold or max(1, max_pending // 2)
+        self.name = name
+        self._pending = collections.OrderedDict()  # key -> [items], in first-seen order
+        self._pending_count = 0
+        self._first_pending_at = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._metrics = collections.Counter()
+        self._max_flush_ms = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, key, item):
+        """Queue an item; returns False (caller writes synchronously) when the buffer is full or closed."""
+        with self._cond:
+            if self._closed or self._pending_count >= self.max_pending:
+                self._metrics['rejected'] += 1
+                return False
+            items = self._pending.get(key)
+            if items is None:
+                self._pending[key] = items = []
+            items.append(item)
+            self._pending_count += 1
+            self._metrics['received'] += 1
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            if self._pending_count >= self.flush_threshold:
+                self._cond.notify()
+        return True
+
+    def flush(self):
+        """Flush everything pending now, on the calling thread."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, collections.OrderedDict()
+                count, self._pending_count = self._pending_count, 0
+                self._first_pending_at = None
+            if not batch:
+                return 0
+            started = time.monotonic()
+            try:
+                self._flush_fn(batch)
+            except Exception as e:
+                print(f"[{self.name}] flush of {count} items failed: {type(e).__name__} - {e}")
+                self._requeue(batch, count)
+                return 0
+            elapsed_ms = int((time.monotonic() - started) * 1000)
+            with self._cond:
+                self._metrics['flushes'] += 1
+                self._metrics['flushed_items'] += count
+                self._metrics['flushed_keys'] += len(batch)
+                self._metrics['flush_ms_total'] += elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            return count
+
+    def close(self):
+        """Stop the background thread and flush whatever is still pending."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=self.window_seconds + 5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._metrics)
+            snapshot.update(pending=self._pending_count, pending_keys=len(self._pending),
+                            max_flush_ms=self._max_flush_ms)
+        flushes = snapshot.get('flushes', 0)
+        # items received per row written: 1.0 means nothing was coalesced
+        snapshot['coalesce_ratio'] = (snapshot.get('flushed_items', 0) / snapshot['flushed_keys']
+                                      if snapshot.get('flushed_keys') else 0.0)
+        snapshot['avg_flush_ms'] = snapshot.get('flush_ms_total', 0) / flushes if flushes else 0.0
+        return snapshot
+
+    def install_shutdown_hooks(self):
+        """Flush on interpreter exit and on SIGTERM (chaining to any previous handler)."""
+        atexit.register(self.close)
+        try:
+            previous = signal.getsignal(signal.SIGTERM)
+
+            def _on_sigterm(signum, frame):
+                self.close()
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous == signal.SIG_DFL:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    signal.raise_signal(signal.SIGTERM)
+
+            signal.signal(signal.SIGTERM, _on_sigterm)
+        except ValueError:
+            # signal handlers can only be installed from the main thread; atexit still applies
+            print(f"[{self.name}] SIGTERM flush hook not installed (not on main thread).")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._first_pending_at is not None:
+                        remaining = self._first_pending_at + self.window_seconds - time.monotonic()
+                        if remaining <= 0 or self._pending_count >= self.flush_threshold:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def _requeue(self, batch, count):
+        """Put a failed batch back in front of newer items, dropping what no longer fits."""
+        with self._cond:
+            self._metrics['flush_failures'] += 1
+            merged = collections.OrderedDict()
+            kept = 0
+            for key, items in list(batch.items()) + list(self._pending.items()):
+                room = self.max_pending - kept
+                if room <= 0:
+                    break
+                items = items[:room]
+                merged.setdefault(key, []).extend(items)
+                kept += len(items)
+            self._metrics['dropped'] += count + self._pending_count - kept
+            self._pending = merged
+            self._pending_count = kept
+            if kept and self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
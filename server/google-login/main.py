@@ -1,47 +1,25 @@
 import os
+import sys
 import json
 import jwt
 import datetime
 import mysql.connector
 import secrets
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from google.oauth2 import id_token as google_id_token
 from google.auth.transport import requests as google_requests
 
+# Shared library (server/braves_common) - copied next to main.py on deploy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, json_response, make_entry_point
+from braves_common.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_SECONDS, JWT_REFRESH_EXPIRATION_DAYS
+
 app = Flask(__name__)
 
 # --- Environment Variable Setup ---
-db_host = os.environ.get("CLOUD_SQL_HOST")
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD")
-db_name = os.environ.get("CLOUD_SQL_DATABASE") 
-
-# JWT Settings
-JWT_SECRET = os.environ.get("JWT_SECRET") 
-JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_SECONDS = 3600  # 1 hour (access token)
-# Refresh token expiration time (get from environment variable or use default 30 days)
-JWT_REFRESH_EXPIRATION_DAYS = int(os.environ.get("JWT_REFRESH_EXPIRATION_DAYS", 30))
-
 # Google OAuth 2.0 Web Client ID (Required)
 GOOGLE_WEB_CLIENT_ID = os.environ.get("GOOGLE_WEB_CLIENT_ID")
 
-# --- Database Connection ---
-def get_db_connection():
-    """Function to connect to Cloud SQL or local DB"""
-    try:
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-            port=3306 
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL connection error: {err}")
-        return None
-
 # --- Token Generation ---
 def generate_access_token(user_id):
     """Generate JWT access token based on user ID"""
@@ -50,10 +28,9 @@ def generate_access_token(user_id):
         'type': 'access', 
         'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=JWT_EXPIRATION_SECONDS)
     }
-    secret = os.environ.get("JWT_SECRET")
-    if not secret:
+    if not JWT_SECRET:
         raise ValueError("JWT_SECRET environment variable is not set.")
-    return jwt.encode(payload, secret, JWT_ALGORITHM)
+    return jwt.encode(payload, JWT_SECRET, JWT_ALGORITHM)
 
 def generate_refresh_token():
     """Generate refresh token with a secure random string"""
@@ -66,11 +43,11 @@ def google_login_handler():
     """Handle Google social login and issue tokens (Access + Refresh)"""
     received_id_token = request.json.get('idToken')
     if not received_id_token:
-        return jsonify({"code": 400, "success": False, "msg": "ID token is missing."}), 400
+        return json_response({"code": 400, "success": False, "msg": "ID token is missing."}), 400
 
     if not GOOGLE_WEB_CLIENT_ID or GOOGLE_WEB_CLIENT_ID == "YOUR_WEB_CLIENT_ID.apps.googleusercontent.com":
          print("CRITICAL: GOOGLE_WEB_CLIENT_ID environment variable is not set correctly.")
-         return jsonify({"code": 500, "success": False, "msg": "Server configuration error. (Client ID missing)"}), 500
+         return json_response({"code": 500, "success": False, "msg": "Server configuration error. (Client ID missing)"}), 500
 
     conn = None
     cursor = None
@@ -101,7 +78,7 @@ def google_login_handler():
 
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Failed to connect to the database."}), 500
+            return json_response({"code": 500, "success": False, "msg": "Failed to connect to the database."}), 500
 
         cursor = conn.cursor(dictionary=True)
 
@@ -175,20 +152,20 @@ def google_login_handler():
                 "user": final_user_info # Use final user info
             }
         }
-        return jsonify(response_data), 200
+        return json_response(response_data), 200
 
     except ValueError as e:
         print(f"Value Error or Token Verification Failed: {e}")
-        return jsonify({"code": 401, "success": False, "msg": f"An error occurred during authentication processing."}), 401
+        return json_response({"code": 401, "success": False, "msg": f"An error occurred during authentication processing."}), 401
     except mysql.connector.Error as db_err:
         print(f"DB processing error: {db_err}")
         if conn and conn.is_connected():
              try: conn.rollback() 
              except Exception as roll_err: print(f"Rollback failed: {roll_err}")
-        return jsonify({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
+        return json_response({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
     except Exception as e:
         print(f"Unexpected error during Google login processing: {type(e).__name__} - {e}")
-        return jsonify({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
+        return json_response({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
     finally:
         # Close cursor and connection
         if cursor:
@@ -206,14 +183,14 @@ def refresh_token_handler():
     """Issue new access token using refresh token (applying Refresh Token Rotation)"""
     received_refresh_token = request.json.get('refreshToken')
     if not received_refresh_token:
-        return jsonify({"code": 400, "success": False, "msg": "Refresh token is missing."}), 400
+        return json_response({"code": 400, "success": False, "msg": "Refresh token is missing."}), 400
 
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Database connection failed"}), 500
+            return json_response({"code": 500, "success": False, "msg": "Database connection failed"}), 500
 
         cursor = conn.cursor(dictionary=True)
 
@@ -238,7 +215,7 @@ def refresh_token_handler():
             print(f"Refresh token expired: {token_info['id']}")
 
         if validation_error_msg:
-            return jsonify({"code": 401, "success": False, "msg": validation_error_msg}), 401
+            return json_response({"code": 401, "success": False, "msg": validation_error_msg}), 401
 
         user_id = token_info['user_id']
         old_token_id = token_info['id']
@@ -275,20 +252,20 @@ def refresh_token_handler():
                 }
             }
         }
-        return jsonify(response_data), 200
+        return json_response(response_data), 200
 
     except mysql.connector.Error as db_err:
         print(f"DB processing error (refresh): {db_err}")
         if conn and conn.is_connected():
             try: conn.rollback()
             except Exception as roll_err: print(f"Rollback failed: {roll_err}")
-        return jsonify({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
+        return json_response({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
     except ValueError as e: 
         print(f"Value Error during token generation (refresh): {e}")
-        return jsonify({"code": 500, "success": False, "msg": f"Server configuration error during token generation."}), 500
+        return json_response({"code": 500, "success": False, "msg": f"Server configuration error during token generation."}), 500
     except Exception as e:
         print(f"Unexpected error during token refresh processing: {type(e).__name__} - {e}")
-        return jsonify({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
+        return json_response({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
     finally:
         if cursor:
             try: cursor.close()
@@ -305,14 +282,14 @@ def logout_handler():
     """Invalidate refresh token to handle logout"""
     received_refresh_token = request.json.get('refreshToken')
     if not received_refresh_token:
-        return jsonify({"code": 400, "success": False, "msg": "Refresh token is missing."}), 400
+        return json_response({"code": 400, "success": False, "msg": "Refresh token is missing."}), 400
 
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Database connection failed"}), 500
+            return json_response({"code": 500, "success": False, "msg": "Database connection failed"}), 500
 
         cursor = conn.cursor()
 
@@ -331,17 +308,17 @@ def logout_handler():
         else:
              print(f"Logout attempt: Refresh token not found or already revoked: {received_refresh_token[:10]}...")
 
-        return jsonify({"code": 200, "success": True, "msg": "Logout processed."}), 200
+        return json_response({"code": 200, "success": True, "msg": "Logout processed."}), 200
 
     except mysql.connector.Error as db_err:
         print(f"DB processing error (logout): {db_err}")
         if conn and conn.is_connected():
              try: conn.rollback()
              except Exception as roll_err: print(f"Rollback failed: {roll_err}")
-        return jsonify({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
+        return json_response({"code": 500, "success": False, "msg": f"Error during database processing"}), 500
     except Exception as e:
         print(f"Unexpected error during logout processing: {type(e).__name__} - {e}")
-        return jsonify({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
+        return json_response({"code": 500, "success": False, "msg": f"An internal server error occurred."}), 500
     finally:
         if cursor:
             try: cursor.close()
@@ -353,6 +330,4 @@ def logout_handler():
             except Exception as conn_err: print(f"DB connection closing error: {conn_err}")
 
 # --- Cloud Functions Entry Point Function ---
-def main(request):
-     with app.request_context(request.environ):
-          return app.full_dispatch_request() 
\ No newline at end of file
+main = make_entry_point(app)
@@ -1,61 +1,114 @@
 import os
+import sys
 import json
-import jwt
 import datetime # JWT 검증 시 사용될 수 있음
 # import uuid # 이 코드에서는 필요 없음
 import mysql.connector
-from flask import Flask, request, jsonify
-from functools import wraps
+from flask import Flask, request
+
+# 공용 라이브러리 (server/braves_common) - 배포 시 함수 디렉터리에 함께 복사
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, connection, token_required, scheduler_caller_error, json_response, make_entry_point
+from braves_common import location_history
+from braves_common.write_behind import WriteBehindBuffer
 
 app = Flask(__name__)
 
-# --- 환경 변수 설정 ---
-# Cloud Functions 환경 변수에서 설정 필요
-db_host = os.environ.get("CLOUD_SQL_HOST") # 예: 172.19.112.3 (내부 IP 사용 시)
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD") # Secret Manager 권장
-db_name = os.environ.get("CLOUD_SQL_DATABASE") # 예: braves
-JWT_SECRET = os.environ.get("JWT_SECRET", "change-this-in-prod") # 중요: 다른 서비스와 동일한 키 사용
-JWT_ALGORITHM = "HS256"
-
-# --- 데이터베이스 연결 ---
-def get_db_connection():
-    """Cloud SQL에 연결하는 함수"""
-    conn = None
-    try:
-        conn = mysql.connector.connect(
-            host=db_host, user=db_user, password=db_password,
-            database=db_name, port=3306
-        )
-        # autocommit은 기본값이 False 이므로 명시적 commit 필요
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL 연결 오류: {err}")
-        return None
-
-# --- JWT 인증 데코레이터 ---
-def token_required(f):
-    """액세스 토큰(다른 서비스에서 발급)을 검증하는 데코레이터"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try: token = auth_header.split(" ")[1]
-            except IndexError: return jsonify({"code": 401, "success": False, "msg": "유효하지 않은 토큰 형식"}), 401
-        if not token: return jsonify({"code": 401, "success": False, "msg": "인증 토큰 필요"}), 401
-        if not JWT_SECRET or JWT_SECRET == "change-this-in-prod":
-             print("CRITICAL: JWT_SECRET 환경 변수가 설정되지 않았거나 기본값을 사용 중입니다.")
-             return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (JWT Secret)"}), 500
+# --- 위치 배치 업로드 설정 ---
+MAX_LOCATION_BATCH_SIZE = int(os.environ.get("MAX_LOCATION_BATCH_SIZE", 500))
+# 단말 시계 오차 허용 범위 (이보다 미래 시각의 fix 는 거부)
+MAX_FIX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+# --- 위치 이력 (location_history) 보관/압축 설정 ---
+LOCATION_HISTORY_RETENTION_DAYS = int(os.environ.get("LOCATION_HISTORY_RETENTION_DAYS", 90))
+LOCATION_HISTORY_PARTITIONS_AHEAD = int(os.environ.get("LOCATION_HISTORY_PARTITIONS_AHEAD", 3))
+# 이 일수보다 오래된 날짜는 사용자별로 COMPACT_INTERVAL 초당 fix 1개만 남김
+LOCATION_HISTORY_COMPACT_AFTER_DAYS = int(os.environ.get("LOCATION_HISTORY_COMPACT_AFTER_DAYS", 7))
+LOCATION_HISTORY_COMPACT_INTERVAL_SECONDS = int(os.environ.get("LOCATION_HISTORY_COMPACT_INTERVAL_SECONDS", 60))
+MAX_LOCATION_HISTORY_RANGE = datetime.timedelta(days=31)
+
+# --- 위치 쓰기 지연 (write-behind) 설정 ---
+# 0 이면 비활성화 (요청마다 동기 저장). 활성화 시 CPU 상시 할당 인스턴스로 배포 필요
+LOCATION_WRITE_BEHIND_WINDOW_MS = int(os.environ.get("LOCATION_WRITE_BEHIND_WINDOW_MS", 0))
+LOCATION_WRITE_BEHIND_MAX_PENDING = int(os.environ.get("LOCATION_WRITE_BEHIND_MAX_PENDING", 10000))
+
+# --- 함수 ---
+def _parse_fix_timestamp(value):
+    """fix 의 timestamp (ISO-8601 문자열 또는 epoch 밀리초) 를 UTC naive datetime 으로 변환"""
+    if value is None:
+        raise ValueError("timestamp 누락")
+    if isinstance(value, bool):
+        raise TypeError("timestamp 형식 오류")
+    if isinstance(value, (int, float)):
+        recorded_at = datetime.datetime.fromtimestamp(value / 1000.0, tz=datetime.timezone.utc)
+    else:
+        recorded_at = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if recorded_at.tzinfo is None:
+            recorded_at = recorded_at.replace(tzinfo=datetime.timezone.utc)
+    recorded_at = recorded_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if recorded_at > datetime.datetime.utcnow() + MAX_FIX_CLOCK_SKEW:
+        raise ValueError("timestamp 가 미래 시각임")
+    return recorded_at
+
+def _parse_location_fix(fix):
+    """배치 내 fix 하나를 검증하여 (lat, lon, acc, recorded_at) 튜플로 반환"""
+    if not isinstance(fix, dict):
+        raise TypeError("각 항목은 JSON 객체여야 합니다")
+    latitude = fix.get('latitude')
+    longitude = fix.get('longitude')
+    accuracy = fix.get('accuracy')
+    if latitude is None or longitude is None:
+        raise ValueError("필수 필드 누락: latitude, longitude")
+    lat_f = float(latitude)
+    lon_f = float(longitude)
+    acc_f = float(accuracy) if accuracy is not None else None
+    if not (-90 <= lat_f <= 90): raise ValueError("latitude 범위 초과 (-90 ~ 90)")
+    if not (-180 <= lon_f <= 180): raise ValueError("longitude 범위 초과 (-180 ~ 180)")
+    if acc_f is not None and acc_f < 0: raise ValueError("accuracy는 음수일 수 없음")
+    return lat_f, lon_f, acc_f, _parse_fix_timestamp(fix.get('timestamp'))
+
+# 재시도해도 같은 결과인 행 단위 오류 (존재하지 않는 사용자, 범위를 넘는 값 등)만 행 단위로 격리
+# 연결 오류, 없는 테이블 / 컬럼, 권한, SQL 오류 (ProgrammingError) 등은 버퍼가 배치를 다시 넣어 재시도
+ROW_DATA_ERRORS = (mysql.connector.IntegrityError, mysql.connector.DataError)
+
+def _flush_location_buffer(batch):
+    """write-behind 버퍼 flush: 모든 fix 를 history 에 한 번에 추가, 사용자별 최신 위치는 multi-row UPSERT 한 번"""
+    rows = [(user_id,) + fix for user_id, fixes in batch.items() for fix in fixes]
+    with connection() as conn:
+        cursor = conn.cursor()
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            # 사용자 ID를 kwargs에 추가하여 전달
-            kwargs['current_user_id'] = payload['userId']
-        except jwt.ExpiredSignatureError: return jsonify({"code": 401, "success": False, "msg": "토큰 만료"}), 401
-        except jwt.InvalidTokenError as e: return jsonify({"code": 401, "success": False, "msg": f"유효하지 않은 토큰: {e}"}), 401
-        except Exception as e: return jsonify({"code": 401, "success": False, "msg": "토큰 처리 오류"}), 401
-        return f(*args, **kwargs)
-    return decorated
+            location_history.append_fixes(cursor, rows)
+            conn.commit()
+        except ROW_DATA_ERRORS as row_err:
+            # 일부 행 때문에 배치 전체가 실패 (매 flush 마다 재시도) 하지 않도록 사용자 단위, 다시 실패하면 행 단위로 저장
+            print(f"Location buffer bulk flush 실패, 사용자별로 재시도: {row_err}")
+            conn.rollback()
+            for user_id, fixes in batch.items():
+                try:
+                    location_history.append_user_fixes(cursor, user_id, fixes)
+                    conn.commit()
+                except ROW_DATA_ERRORS as user_err:
+                    conn.rollback()
+                    print(f"User {user_id} 위치 {len(fixes)}건 일괄 저장 실패, 건별로 재시도: {user_err}")
+                    for fix in fixes:
+                        try:
+                            location_history.append_user_fixes(cursor, user_id, [fix])
+                            conn.commit()
+                        except ROW_DATA_ERRORS as fix_err:
+                            conn.rollback()
+                            print(f"User {user_id} 위치 {fix} 저장 실패 (폐기): {fix_err}")
+        finally:
+            cursor.close()
+
+location_buffer = None
+if LOCATION_WRITE_BEHIND_WINDOW_MS > 0:
+    location_buffer = WriteBehindBuffer(
+        _flush_location_buffer,
+        window_seconds=LOCATION_WRITE_BEHIND_WINDOW_MS / 1000.0,
+        max_pending=LOCATION_WRITE_BEHIND_MAX_PENDING,
+        name="location-write-behind"
+    )
+    location_buffer.install_shutdown_hooks()
 
 # --- API 라우트 ---
 
@@ -67,12 +120,12 @@ def upsert_location_log(current_user_id):
     user_id = current_user_id
 
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+        return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
 
     # 이제 배열이 아닌 단일 객체를 받음
     location_data = request.get_json()
     if not isinstance(location_data, dict):
-         return jsonify({"code": 400, "success": False, "msg": "요청 본문은 JSON 객체여야 합니다."}), 400
+         return json_response({"code": 400, "success": False, "msg": "요청 본문은 JSON 객체여야 합니다."}), 400
 
     latitude = location_data.get('latitude')
     longitude = location_data.get('longitude')
@@ -80,7 +133,7 @@ def upsert_location_log(current_user_id):
 
     # 필수 필드 및 유효성 검증
     if latitude is None or longitude is None:
-        return jsonify({"code": 400, "success": False, "msg": "필수 필드 누락: latitude, longitude"}), 400
+        return json_response({"code": 400, "success": False, "msg": "필수 필드 누락: latitude, longitude"}), 400
 
     try:
         lat_f = float(latitude)
@@ -91,51 +144,43 @@ def upsert_location_log(current_user_id):
         if not (-180 <= lon_f <= 180): raise ValueError("longitude 범위 초과 (-180 ~ 180)")
         if acc_f is not None and acc_f < 0: raise ValueError("accuracy는 음수일 수 없음")
 
-        # DB 저장을 위한 데이터 준비
-        data_tuple = (user_id, lat_f, lon_f, acc_f, lat_f, lon_f, acc_f) # INSERT용 + UPDATE용
-
     except (ValueError, TypeError) as ve:
-        return jsonify({"code": 400, "success": False, "msg": f"입력값 오류: {ve}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"입력값 오류: {ve}"}), 400
+
+    recorded_at = datetime.datetime.now(datetime.timezone.utc) # 서버 시각 (UTC, 저장 시 naive UTC 로 변환)
+    success_body = {
+        "code": 200, # 생성 또는 업데이트 모두 OK
+        "success": True,
+        "msg": f"사용자 {user_id}의 위치 정보가 성공적으로 저장/업데이트되었습니다."
+    }
+
+    # write-behind 활성화 시 버퍼에 넣고 바로 응답 (버퍼가 가득 찬 경우에만 아래 동기 저장)
+    if location_buffer is not None and location_buffer.add(user_id, (lat_f, lon_f, acc_f, recorded_at)):
+        return json_response(success_body), 200
 
     # 데이터베이스에 저장 또는 업데이트 (UPSERT)
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
         cursor = conn.cursor()
 
-        # MySQL의 INSERT ... ON DUPLICATE KEY UPDATE 구문 사용
-        # user_id (기본 키)가 이미 존재하면 UPDATE 실행, 없으면 INSERT 실행
-        # updated_at 컬럼은 ON UPDATE CURRENT_TIMESTAMP 옵션으로 자동 갱신됨
-        sql = """
-            INSERT INTO location_logs (user_id, latitude, longitude, accuracy)
-            VALUES (%s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                latitude = VALUES(latitude),
-                longitude = VALUES(longitude),
-                accuracy = VALUES(accuracy)
-                -- updated_at 컬럼은 자동으로 갱신됨
-        """
-        cursor.execute(sql, (user_id, lat_f, lon_f, acc_f)) # INSERT 부분의 값만 전달
+        # location_history 에 추가하고 location_logs (최신 위치) 를 함께 갱신
+        location_history.append_user_fixes(cursor, user_id, [(lat_f, lon_f, acc_f, recorded_at)])
         conn.commit() # 변경사항 최종 저장
 
-        return jsonify({
-            "code": 200, # 생성 또는 업데이트 모두 OK
-            "success": True,
-            "msg": f"사용자 {user_id}의 위치 정보가 성공적으로 저장/업데이트되었습니다."
-            # "affectedRows": rowcount # 참고용으로 추가 가능
-        }), 200
+        return json_response(success_body), 200
 
     except mysql.connector.Error as db_err:
         print(f"MySQL UPSERT 오류 [POST /location-logs]: {db_err}")
         # Foreign Key 오류 등 발생 가능 (users 테이블에 해당 user_id가 없는 경우)
         if db_err.errno == 1452:
-             return jsonify({"code": 400, "success": False, "msg": "유효하지 않은 사용자 ID 입니다."}), 400
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+             return json_response({"code": 400, "success": False, "msg": "유효하지 않은 사용자 ID 입니다."}), 400
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
     except Exception as e:
         print(f"Upsert location log 오류: {e}")
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor:
             try: cursor.close()
@@ -144,9 +189,154 @@ def upsert_location_log(current_user_id):
             try: conn.close(); print("DB connection (location log) closed.")
             except Exception as e: print(f"DB 연결(location log) 닫기 오류: {e}")
 
+# === 위치 정보 배치 업로드 API ===
+@app.route('/api/location-logs:batch', methods=['POST'])
+@token_required
+def upsert_location_log_batch(current_user_id):
+    """타임스탬프가 있는 위치 fix 배열을 한 번에 검증하고, location_history 에 한 번에 추가 (최신 fix 로 location_logs 갱신)"""
+    user_id = current_user_id
+
+    if not request.is_json:
+        return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+
+    # 배열 자체 또는 {"fixes": [...]} 형태 모두 허용
+    body = request.get_json()
+    fixes = body.get('fixes') if isinstance(body, dict) else body
+    if not isinstance(fixes, list) or not fixes:
+        return json_response({"code": 400, "success": False, "msg": "요청 본문은 비어있지 않은 fix 배열이어야 합니다."}), 400
+    if len(fixes) > MAX_LOCATION_BATCH_SIZE:
+        return json_response({"code": 413, "success": False, "msg": f"배치 크기 제한 초과 (최대 {MAX_LOCATION_BATCH_SIZE}개)"}), 413
+
+    # 전체 fix 를 먼저 검증하고, 오류는 인덱스와 함께 한 번에 반환
+    parsed_fixes = []
+    errors = []
+    for index, fix in enumerate(fixes):
+        try:
+            parsed_fixes.append(_parse_location_fix(fix))
+        except (ValueError, TypeError, OverflowError) as ve:
+            errors.append({"index": index, "msg": str(ve)})
+    if errors:
+        return json_response({"code": 400, "success": False, "msg": f"입력값 오류 ({len(errors)}건)", "errors": errors[:20]}), 400
+
+    recorded_at = max(parsed[3] for parsed in parsed_fixes)
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        cursor = conn.cursor()
+
+        # 전체 fix 는 multi-row INSERT 한 번으로 history 에 추가, location_logs 는 최신 fix 로만 갱신
+        # (이미 더 최신 위치가 저장되어 있으면 늦게 도착한 배치가 덮어쓰지 않음)
+        location_history.append_user_fixes(cursor, user_id, parsed_fixes)
+        conn.commit()
+
+        return json_response({
+            "code": 200,
+            "success": True,
+            "msg": f"사용자 {user_id}의 위치 정보 {len(parsed_fixes)}건이 처리되었습니다.",
+            "acceptedCount": len(parsed_fixes),
+            "latestRecordedAt": recorded_at.isoformat() + 'Z'
+        }), 200
+
+    except mysql.connector.Error as db_err:
+        print(f"MySQL UPSERT 오류 [POST /location-logs:batch]: {db_err}")
+        if db_err.errno == 1452:
+             return json_response({"code": 400, "success": False, "msg": "유효하지 않은 사용자 ID 입니다."}), 400
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e:
+        print(f"Upsert location log batch 오류: {e}")
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+    finally:
+        if cursor:
+            try: cursor.close()
+            except Exception as e: print(f"Location log batch 커서 닫기 오류: {e}")
+        if conn and conn.is_connected():
+            try: conn.close()
+            except Exception as e: print(f"DB 연결(location log batch) 닫기 오류: {e}")
+
+# === 위치 이력 조회 API (여행 경로 재생용) ===
+@app.route('/api/location-logs/history', methods=['GET'])
+@token_required
+def get_location_history(current_user_id):
+    """from ~ to 구간의 위치 이력을 시간순으로 조회 (기본: 최근 24시간)"""
+    user_id = current_user_id
+    try:
+        until = _parse_fix_timestamp(request.args['to']) if 'to' in request.args else datetime.datetime.utcnow()
+        since = _parse_fix_timestamp(request.args['from']) if 'from' in request.args else until - datetime.timedelta(days=1)
+        limit = min(int(request.args.get('limit', 5000)), 5000)
+        if since >= until: raise ValueError("from 은 to 보다 이전이어야 함")
+        if until - since > MAX_LOCATION_HISTORY_RANGE: raise ValueError("조회 구간은 최대 31일")
+        if limit <= 0: raise ValueError("limit 은 1 이상이어야 함")
+    except (ValueError, TypeError) as ve:
+        return json_response({"code": 400, "success": False, "msg": f"입력값 오류: {ve}"}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        cursor = conn.cursor(dictionary=True)
+        rows = location_history.get_track(cursor, user_id, since, until, limit)
+        return json_response({
+            "code": 200,
+            "success": True,
+            "msg": "위치 이력 조회 성공",
+            "locations": [{
+                "latitude": row['latitude'],
+                "longitude": row['longitude'],
+                "accuracy": row['accuracy'],
+                "timestamp": row['recorded_at'].isoformat() + 'Z'
+            } for row in rows]
+        }), 200
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 조회 오류 [GET /location-logs/history]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    finally:
+        if cursor:
+            try: cursor.close()
+            except Exception as e: print(f"Location history 커서 닫기 오류: {e}")
+        if conn and conn.is_connected():
+            try: conn.close()
+            except Exception as e: print(f"DB 연결(location history) 닫기 오류: {e}")
+
 # --- Cloud Functions 진입점 함수 ---
-def main(request_obj): # Flask의 request와 구분하기 위해 request_obj로 변경
-    """Cloud Functions HTTP 트리거를 위한 진입점 함수."""
-    with app.request_context(request_obj.environ):
-        # 정의된 유일한 라우트인 '/api/location-logs' (POST) 요청 처리
-        return app.full_dispatch_request()
\ No newline at end of file
+main = make_entry_point(app)
+
+def location_history_maintenance(request_obj):
+    """Cloud Scheduler 용 진입점 (--entry-point=location_history_maintenance).
+
+    다음 날짜 파티션 생성 → 보관 기간이 지난 파티션 삭제 → 오래된 날짜 압축 순서로 실행.
+    파티션 DDL 을 실행하므로 --no-allow-unauthenticated 로 배포하고, 스케줄러 작업은
+    SCHEDULER_SERVICE_ACCOUNT 의 OIDC 토큰을 붙여 호출 (토큰은 여기서도 확인, braves_common/auth.py).
+    """
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    today = datetime.datetime.utcnow().date()
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        cursor = conn.cursor(dictionary=True)
+        created = location_history.ensure_partitions(cursor, today, LOCATION_HISTORY_PARTITIONS_AHEAD)
+        dropped = location_history.drop_expired_partitions(cursor, today, LOCATION_HISTORY_RETENTION_DAYS)
+        compact_day = today - datetime.timedelta(days=LOCATION_HISTORY_COMPACT_AFTER_DAYS)
+        compacted = location_history.compact_day(cursor, compact_day, LOCATION_HISTORY_COMPACT_INTERVAL_SECONDS)
+        conn.commit()
+        print(f"Location history maintenance: created={created}, dropped={dropped}, compacted {compact_day}={compacted} rows")
+        return json_response({
+            "code": 200, "success": True, "msg": "위치 이력 유지보수 완료",
+            "createdPartitions": created, "droppedPartitions": dropped, "compactedRows": compacted
+        }), 200
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [location_history_maintenance]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    finally:
+        if cursor:
+            try: cursor.close()
+            except Exception as e: print(f"Maintenance 커서 닫기 오류: {e}")
+        if conn and conn.is_connected():
+            try: conn.close()
+            except Exception as e: print(f"DB 연결(maintenance) 닫기 오류: {e}")
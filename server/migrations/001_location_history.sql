@@ -0,0 +1,23 @@
+-- Append-only location history, one RANGE partition per UTC day.
+-- location_logs stays as the "latest position per user" table and is refreshed
+-- from the same writes (see braves_common/location_history.py).
+--
+-- Daily partitions are added ahead of time (and expired ones dropped) by the
+-- location-api `location_history_maintenance` entry point; p_future only
+-- catches rows that arrive before their day's partition exists.
+-- Partitioned InnoDB tables cannot carry foreign keys, so user_id is not
+-- constrained to users(id) here.
+
+CREATE TABLE IF NOT EXISTS location_history (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    user_id INT NOT NULL,
+    latitude DOUBLE NOT NULL,
+    longitude DOUBLE NOT NULL,
+    accuracy DOUBLE NULL,
+    recorded_at DATETIME(3) NOT NULL,
+    PRIMARY KEY (id, recorded_at),
+    KEY idx_location_history_user_time (user_id, recorded_at)
+)
+PARTITION BY RANGE (TO_DAYS(recorded_at)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
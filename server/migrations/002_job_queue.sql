@@ -0,0 +1,21 @@
+-- Durable job queue for background work (see braves_common/job_queue.py).
+-- Workers claim runnable rows with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0+)
+-- and hold them under a lease; a row whose lease expires is picked up again.
+-- Finished rows are purged by JobQueue.purge().
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR(36) NOT NULL,
+    kind VARCHAR(64) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    run_after DATETIME NOT NULL,
+    lease_expires_at DATETIME NULL,
+    locked_by VARCHAR(128) NULL,
+    last_error VARCHAR(1000) NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    KEY idx_jobs_status_run_after (status, run_after),
+    KEY idx_jobs_status_lease (status, lease_expires_at)
+);
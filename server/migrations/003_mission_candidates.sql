@@ -0,0 +1,24 @@
+-- Speculatively pre-generated missions, one row per candidate.
+-- Filled off-peak by the mission-generator `pregenerate_missions` entry point for
+-- active/upcoming travels and the cells their traveller has recently been in;
+-- consumed by generate-direct-ai-mission / mission proposals when the request's
+-- cell matches and the current time falls inside [valid_from, valid_until).
+-- cell is a geohash (braves_common/geo.py); times are UTC.
+
+CREATE TABLE IF NOT EXISTS mission_candidates (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    travel_id INT NOT NULL,
+    user_id INT NOT NULL,
+    cell VARCHAR(12) NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    raw_ai_response JSON NULL,
+    valid_from DATETIME NOT NULL,
+    valid_until DATETIME NOT NULL,
+    consumed_at DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    KEY idx_mission_candidates_lookup (travel_id, cell, consumed_at, valid_until),
+    KEY idx_mission_candidates_valid_until (valid_until),
+    CONSTRAINT fk_mission_candidates_travel FOREIGN KEY (travel_id) REFERENCES travels (id) ON DELETE CASCADE
+);
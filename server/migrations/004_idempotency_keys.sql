@@ -0,0 +1,17 @@
+-- Stored responses for requests sent with an Idempotency-Key header
+-- (see braves_common/idempotency.py). A key is scoped to its user; the
+-- fingerprint binds it to the request parameters it was first used with.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INT NOT NULL,
+    idem_key VARCHAR(128) NOT NULL,
+    endpoint VARCHAR(128) NOT NULL,
+    fingerprint CHAR(64) NOT NULL,
+    status ENUM('in_progress', 'completed') NOT NULL,
+    response_code SMALLINT NULL,
+    response_body JSON NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    PRIMARY KEY (user_id, idem_key),
+    KEY idx_idempotency_keys_expires_at (expires_at)
+);
@@ -0,0 +1,5 @@
+-- Keyset pagination of GET /api/travels walks (start_date DESC, id DESC) for one
+-- user; this index serves both the WHERE and the ORDER BY, so each page is a
+-- single range scan no matter how deep the cursor is.
+
+CREATE INDEX idx_travels_user_start_date_id ON travels (user_id, start_date, id);
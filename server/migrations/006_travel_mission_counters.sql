@@ -0,0 +1,18 @@
+-- Mission counters denormalized onto travels so the travel list and the mission
+-- summary are single-table reads. Writers keep them in step in the same
+-- transaction as the mission change (braves_common/mission_counters.py); the
+-- mission-api `reconcile_mission_counters` entry point repairs any drift.
+
+ALTER TABLE travels
+    ADD COLUMN total_missions INT NOT NULL DEFAULT 0,
+    ADD COLUMN completed_missions INT NOT NULL DEFAULT 0;
+
+-- backfill from the existing missions
+UPDATE travels t
+JOIN (
+    SELECT travel_id, COUNT(*) AS total_missions,
+           COALESCE(SUM(CASE WHEN is_completed = TRUE THEN 1 ELSE 0 END), 0) AS completed_missions
+    FROM missions
+    GROUP BY travel_id
+) m ON m.travel_id = t.id
+SET t.total_missions = m.total_missions, t.completed_missions = m.completed_missions;
@@ -0,0 +1,20 @@
+-- Direct-to-GCS completion image uploads (signed PUT URLs).
+-- One row per URL issued by mission-image-uploader's
+-- POST /api/missions/<id>/completion-image:upload-url. The object is recorded as
+-- the mission's completion_image when the client calls ...:finalize or when the
+-- bucket's OBJECT_FINALIZE notification reaches `completion_image_finalized`,
+-- whichever comes first; finalized_at makes the second one a no-op.
+-- Object names are only ever accepted from this table, so a notification for an
+-- object written any other way is ignored.
+
+CREATE TABLE IF NOT EXISTS mission_image_uploads (
+    object_name VARCHAR(255) NOT NULL,
+    mission_id INT NOT NULL,
+    user_id INT NOT NULL,
+    content_type VARCHAR(32) NOT NULL,
+    expires_at DATETIME NOT NULL,
+    finalized_at DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (object_name),
+    KEY idx_mission_image_uploads_mission (mission_id)
+);
@@ -0,0 +1,8 @@
+-- Resized WebP/AVIF renditions of missions.completion_image.
+-- Written by mission-image-uploader's rendition worker after each upload
+-- (see mission-image-uploader/renditions.py) as {"small": {"webp": url, ...}, "large": {...}};
+-- NULL until the worker has run, and reset to NULL whenever completion_image changes.
+-- mission-api list endpoints return the small rendition by default (imageSize=small|large|original).
+
+ALTER TABLE missions
+    ADD COLUMN completion_image_renditions JSON NULL AFTER completion_image;
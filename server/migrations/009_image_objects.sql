@@ -0,0 +1,26 @@
+-- Content-addressed completion images with a reference count per object
+-- (see braves_common/image_objects.py).
+-- mission-image-uploader stores uploads under missions/sha256/<sha256>.<ext>;
+-- ref_count is the number of missions whose completion_image points at the
+-- object. Objects at zero references since zero_since are deleted by the
+-- uploader's `sweep_image_objects` entry point after IMAGE_GC_GRACE_SECONDS,
+-- together with their renditions. The sweep also recounts ref_count from missions.
+-- stored stays FALSE until the first upload of the content has finished.
+--
+-- Raw-body uploads are staged under missions/staging/ and copied to their
+-- content name once the hash is verified; add a bucket lifecycle
+-- rule deleting missions/staging/ objects older than 1 day to catch crashes.
+
+CREATE TABLE IF NOT EXISTS image_objects (
+    object_name VARCHAR(255) NOT NULL,
+    sha256 CHAR(64) NULL,
+    size INT NULL,
+    content_type VARCHAR(32) NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    stored BOOLEAN NOT NULL DEFAULT FALSE,
+    zero_since DATETIME NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (object_name),
+    KEY idx_image_objects_garbage (ref_count, zero_since)
+);
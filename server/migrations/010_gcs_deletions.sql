@@ -0,0 +1,22 @@
+-- Durable queue of GCS objects to delete (see braves_common/gcs_deletion.py).
+-- Request handlers only insert rows here, in the transaction that makes the
+-- object unnecessary; mission-image-uploader's `sweep_gcs_deletions` and
+-- `sweep_image_objects` entry points delete them with GCS JSON API batch
+-- requests (up to 100 deletes per HTTP call) and remove the finished rows.
+-- A row with guard_object_name is skipped (and dropped) while that
+-- image_objects row has references again, so a queued unreferenced image that
+-- is uploaded again before the sweep is kept. Failed deletes are retried with
+-- backoff through run_after; rows at GCS_DELETE_MAX_ATTEMPTS stay for inspection.
+
+CREATE TABLE IF NOT EXISTS gcs_deletions (
+    object_name VARCHAR(255) NOT NULL,
+    guard_object_name VARCHAR(255) NULL,
+    reason VARCHAR(32) NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    run_after DATETIME NOT NULL,
+    last_error VARCHAR(1000) NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (object_name),
+    KEY idx_gcs_deletions_run_after (run_after),
+    KEY idx_gcs_deletions_guard (guard_object_name)
+);
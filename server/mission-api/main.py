@@ -1,56 +1,33 @@
 import os
+import sys
 import json
-import jwt
-import datetime
 import mysql.connector
-from flask import Flask, request, jsonify
-from functools import wraps
+from flask import Flask, request
+
+# Shared library (server/braves_common) - copied next to main.py on deploy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, token_required, json_response, make_entry_point, scheduler_caller_error
+from braves_common import connection, mission_counters
+from braves_common.etag import compute_etag, not_modified, tag
+from braves_common.cache import list_cache, user_scope, invalidate_lists
 
 app = Flask(__name__)
 
-# --- Environment Variable Configuration ---
-db_host = os.environ.get("CLOUD_SQL_HOST")
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD")
-db_name = os.environ.get("CLOUD_SQL_DATABASE")
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = "HS256"
-
-# --- Database Connection ---
-def get_db_connection():
-    """Function to connect to Cloud SQL"""
-    conn = None
-    try:
-        conn = mysql.connector.connect(
-            host=db_host, user=db_user, password=db_password,
-            database=db_name, port=3306
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL connection error: {err}")
-        return None
-
-# --- JWT Authentication Decorator ---
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try: token = auth_header.split(" ")[1]
-            except IndexError: return jsonify({"code": 401, "success": False, "msg": "유효하지 않은 토큰 형식"}), 401 # Invalid token format
-        if not token: return jsonify({"code": 401, "success": False, "msg": "인증 토큰 필요"}), 401 # Authentication token required
-        if not JWT_SECRET:
-            print("CRITICAL: JWT_SECRET environment variable is not set.")
-            return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (JWT Secret)"}), 500 # Server configuration error (JWT Secret)
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            kwargs['current_user_id'] = payload['userId']
-        except jwt.ExpiredSignatureError: return jsonify({"code": 401, "success": False, "msg": "토큰 만료"}), 401 # Token expired
-        except jwt.InvalidTokenError as e: return jsonify({"code": 401, "success": False, "msg": f"유효하지 않은 토큰: {e}"}), 401 # Invalid token
-        except Exception as e: return jsonify({"code": 401, "success": False, "msg": "토큰 처리 오류"}), 401 # Token processing error
-        return f(*args, **kwargs)
-    return decorated
+# completionImage in mission lists: resized rendition (see mission-image-uploader/renditions.py) or the original
+IMAGE_SIZES = ("small", "large", "original")
+DEFAULT_IMAGE_SIZE = "small"
+RENDITION_FORMAT = "webp"
+# Bucket of mission-image-uploader: its objects are reference counted (braves_common/image_objects.py),
+# so URLs into it can only be set through the uploader
+GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME")
+
+def _completion_image_url(original_url, renditions, image_size):
+    """URL for the requested size; the original until the rendition worker has run"""
+    if not original_url or image_size == "original" or not renditions:
+        return original_url
+    if not isinstance(renditions, dict):
+        renditions = json.loads(renditions)
+    return renditions.get(image_size, {}).get(RENDITION_FORMAT) or original_url
 
 # --- API Routes ---
 
@@ -60,42 +37,40 @@ def token_required(f):
 @token_required
 def get_missions_for_travel(current_user_id, travel_id):
     """Retrieve mission list and summary (total/completed counts) belonging to a specific travel (includes ownership check)""" # 설명 수정
+    # Supports If-None-Match: 304 when the list has not changed since the client's ETag
+    # ?imageSize=small (default) | large | original selects the completionImage rendition
     user_id = current_user_id
+    image_size = request.args.get('imageSize', DEFAULT_IMAGE_SIZE)
+    if image_size not in IMAGE_SIZES:
+        return json_response({"code": 400, "success": False, "msg": f"imageSize 는 {', '.join(IMAGE_SIZES)} 중 하나"}), 400 # imageSize must be one of ...
     conn = None
     cursor = None
-    try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500 # DB connection failed
 
-        cursor = conn.cursor(dictionary=True)
+    def load_mission_list():
+        """Load from MySQL on a cache miss; the ETag is a hash of the returned payload"""
+        nonlocal conn, cursor
+        if conn is None:
+            conn = get_db_connection()
+            if not conn: raise mysql.connector.errors.InterfaceError("DB 연결 실패") # DB connection failed
+            cursor = conn.cursor(dictionary=True)
 
-        # 1. Check if the requesting user is the owner of the travel
-        cursor.execute("SELECT user_id FROM travels WHERE id = %s", (travel_id,))
+        # 1. Check if the requesting user is the owner of the travel (counters are kept on travels)
+        cursor.execute("SELECT user_id, total_missions, completed_missions FROM travels WHERE id = %s", (travel_id,))
         travel = cursor.fetchone()
 
         if not travel:
-            return jsonify({"code": 404, "success": False, "msg": f"Travel ID {travel_id} 없음"}), 404 # Travel ID not found
+            raise LookupError(f"Travel ID {travel_id} 없음") # Travel ID not found
         if travel['user_id'] != user_id:
-            return jsonify({"code": 403, "success": False, "msg": "해당 여행의 미션 조회 권한 없음"}), 403 # No permission to view missions for this travel
+            raise PermissionError("해당 여행의 미션 조회 권한 없음") # No permission to view missions for this travel
 
-        # 2. Retrieve total and completed mission counts
-        sql_counts = """
-            SELECT
-                COUNT(*) AS total_missions,
-                COALESCE(SUM(CASE WHEN is_completed = TRUE THEN 1 ELSE 0 END), 0) AS completed_missions
-            FROM missions
-            WHERE travel_id = %s
-        """
-        cursor.execute(sql_counts, (travel_id,))
-        mission_counts = cursor.fetchone()
-
-        total_missions = int(mission_counts['total_missions'])
-        completed_missions = int(mission_counts['completed_missions'])
+        # 2. Total and completed mission counts
+        total_missions = int(travel['total_missions'])
+        completed_missions = int(travel['completed_missions'])
 
         # 3. Retrieve mission list with the corresponding travel ID
         cursor.execute("""
             SELECT id, travel_id, title, content, is_completed,
-                   completion_image, created_at, updated_at
+                   completion_image, completion_image_renditions, created_at, updated_at
             FROM missions
             WHERE travel_id = %s
             ORDER BY created_at ASC
@@ -111,12 +86,13 @@ def get_missions_for_travel(current_user_id, travel_id):
                 "title": mission['title'],
                 "content": mission['content'],
                 "isCompleted": mission['is_completed'],
-                "completionImage": mission['completion_image'],
+                "completionImage": _completion_image_url(mission['completion_image'], mission['completion_image_renditions'], image_size),
+                "completionImageOriginal": mission['completion_image'],
                 "createdAt": mission['created_at'].isoformat() if mission['created_at'] else None,
                 "updatedAt": mission['updated_at'].isoformat() if mission['updated_at'] else None
             })
 
-        return jsonify({
+        payload = {
             "code": 200,
             "success": True,
             "msg": "미션 리스트 및 요약 정보 조회 성공",
@@ -125,14 +101,28 @@ def get_missions_for_travel(current_user_id, travel_id):
                 "completedMissions": completed_missions
             },
             "missionList": mission_list
-        }), 200
+        }
+        # Hash of the rows actually returned: no extra aggregate query over the travel's missions
+        return {"etag": compute_etag("missions", travel_id, payload), "payload": payload}
 
+    try:
+        # Per-user list cache (stored only after the ownership check passed); writers invalidate it
+        listing, _ = list_cache.get().get_or_load(user_scope(user_id), f"missions:{travel_id}:{image_size}", load_mission_list)
+        cached = not_modified(listing['etag'])
+        if cached:
+            return cached
+        return tag(json_response(listing['payload']), listing['etag']), 200
+
+    except LookupError as le:
+        return json_response({"code": 404, "success": False, "msg": str(le)}), 404
+    except PermissionError as pe:
+        return json_response({"code": 403, "success": False, "msg": str(pe)}), 403
     except mysql.connector.Error as err:
         print(f"MySQL query error [GET /travels/{travel_id}/missions with summary]: {err}") # 로그 메시지 수정
-        return jsonify({"code": 500, "success": False, "msg": "DB 쿼리 오류"}), 500 # DB query error
+        return json_response({"code": 500, "success": False, "msg": "DB 쿼리 오류"}), 500 # DB query error
     except Exception as e:
         print(f"Get missions error [with summary]: {e}")
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
     finally:
         if cursor:
             try: cursor.close()
@@ -141,63 +131,67 @@ def get_missions_for_travel(current_user_id, travel_id):
             try: conn.close()
             except Exception as conn_err: print(f"DB connection closing error for get_missions (with summary): {conn_err}") # 로그 메시지 수정
 
+def _probe_mission(cursor, mission_id):
+    """Owner of a mission, only used after a conditional write changed nothing (404 vs 403)"""
+    cursor.execute("SELECT t.user_id FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s", (mission_id,))
+    return cursor.fetchone()
+
 @app.route('/api/missions/<int:mission_id>/completion-image', methods=['POST'])
 @token_required
 def save_completion_image(current_user_id, mission_id):
     """Save/Update completion image URL for a specific mission (includes ownership check)"""
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400 # JSON format required
+        return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400 # JSON format required
     data = request.get_json()
     user_id = current_user_id
 
     completion_image_url = data.get('completionImageUrl')
     if not completion_image_url:
-        return jsonify({"code": 400, "success": False, "msg": "필수 필드 누락: completionImageUrl"}), 400 # Missing required field: completionImageUrl
+        return json_response({"code": 400, "success": False, "msg": "필수 필드 누락: completionImageUrl"}), 400 # Missing required field: completionImageUrl
     if not isinstance(completion_image_url, str) or len(completion_image_url) > 500:
-        return jsonify({"code": 400, "success": False, "msg": "completionImageUrl 형식이 잘못되었거나 너무 깁니다."}), 400 # completionImageUrl format is incorrect or too long
+        return json_response({"code": 400, "success": False, "msg": "completionImageUrl 형식이 잘못되었거나 너무 깁니다."}), 400 # completionImageUrl format is incorrect or too long
+    bucket_prefix = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"
+    if GCS_BUCKET_NAME and completion_image_url.startswith(bucket_prefix):
+        # Bucket images must be uploaded through mission-image-uploader, which takes their reference
+        return json_response({"code": 400, "success": False, "msg": "버킷 이미지는 업로드 API (/api/missions/<id>/completion-image, mission-image-uploader) 로 등록"}), 400 # Use the image upload API for bucket images
 
     conn = None
-    cursor_check = None
-    cursor_update = None
+    cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500 # DB connection failed
-        cursor_check = conn.cursor(dictionary=True)
-
-        # 1. Check mission existence and ownership (using JOIN)
-        sql_check = "SELECT t.user_id FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s"
-        cursor_check.execute(sql_check, (mission_id,))
-        mission_owner = cursor_check.fetchone()
-        try: cursor_check.close()
-        except Exception as cursor_err: print(f"Check cursor (image) closing error: {cursor_err}")
-        cursor_check = None 
-
-        if not mission_owner:
-            return jsonify({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404 # Mission ID not found
-        if mission_owner['user_id'] != user_id:
-            return jsonify({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403 # No permission to access this mission
-
-        # 2. Update image URL (schema column name: completion_image)
-        sql_update = "UPDATE missions SET completion_image = %s, updated_at = NOW() WHERE id = %s"
-        cursor_update = conn.cursor()
-        cursor_update.execute(sql_update, (completion_image_url, mission_id))
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500 # DB connection failed
+        cursor = conn.cursor(dictionary=True)
+
+        # 1. Update image URL, ownership checked in the same statement (schema column name: completion_image)
+        # A replaced bucket image keeps its reference until the uploader's sweep_image_objects recounts it from missions
+        cursor.execute(
+            """UPDATE missions SET completion_image = %s, completion_image_renditions = NULL, updated_at = NOW()
+               WHERE id = %s AND travel_id IN (SELECT id FROM travels WHERE user_id = %s)""",
+            (completion_image_url, mission_id, user_id)
+        )
+        if cursor.rowcount == 0:
+            # 2. Nothing changed: probe only to tell 404 / 403 (or the same URL saved again within the second)
+            mission_owner = _probe_mission(cursor, mission_id)
+            if not mission_owner:
+                return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404 # Mission ID not found
+            if mission_owner['user_id'] != user_id:
+                return json_response({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403 # No permission to access this mission
         conn.commit()
+        invalidate_lists(user_id)
 
-        return jsonify({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 저장 성공"}), 200 # Mission (ID: {mission_id}) image saved successfully
+        return json_response({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 저장 성공"}), 200 # Mission (ID: {mission_id}) image saved successfully
 
     except mysql.connector.Error as err:
+        if conn: conn.rollback()
         print(f"MySQL UPDATE error [POST /missions/{mission_id}/completion-image]: {err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500 # DB processing error
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500 # DB processing error
     except Exception as e:
         print(f"Save completion image error: {e}")
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
     finally:
-        if cursor_check: 
-             try: cursor_check.close()
-             except Exception as cursor_err: print(f"Check cursor (image) finally closing error: {cursor_err}")
-        if cursor_update:
-            try: cursor_update.close()
-            except Exception as cursor_err: print(f"Update cursor (image) closing error: {cursor_err}")
+        if cursor:
+            try: cursor.close()
+            except Exception as cursor_err: print(f"Cursor (image) finally closing error: {cursor_err}")
         if conn and conn.is_connected():
             try: conn.close()
             except Exception as conn_err: print(f"DB connection closing error: {conn_err}")
@@ -209,61 +203,71 @@ def complete_mission_status(current_user_id, mission_id):
     """Change the status of a specific mission to completed (includes ownership check)"""
     user_id = current_user_id
     conn = None
-    cursor_check = None
-    cursor_update = None
+    cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500 # DB connection failed
-        cursor_check = conn.cursor(dictionary=True)
-
-        # 1. Check mission existence and ownership (using JOIN)
-        sql_check = "SELECT t.user_id, m.is_completed FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s"
-        cursor_check.execute(sql_check, (mission_id,))
-        mission_info = cursor_check.fetchone()
-        try: cursor_check.close()
-        except Exception as cursor_err: print(f"Check cursor (complete) closing error: {cursor_err}")
-        cursor_check = None 
-
-        if not mission_info:
-            return jsonify({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404 # Mission ID not found
-        if mission_info['user_id'] != user_id:
-            return jsonify({"code": 403, "success": False, "msg": "미션 완료 권한 없음"}), 403 # No permission to complete mission
-
-        if mission_info['is_completed']:
-            return jsonify({"code": 200, "success": True, "msg": f"미션(ID: {mission_id})은 이미 완료 상태입니다."}), 200 # Mission (ID: {mission_id}) is already completed.
-
-        # 2. Update mission status
-        sql_update = """
-            UPDATE missions SET
-                is_completed = TRUE,
-                updated_at = NOW()
-            WHERE id = %s
-        """
-        cursor_update = conn.cursor()
-        cursor_update.execute(sql_update, (mission_id,))
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500 # DB connection failed
+        cursor = conn.cursor(dictionary=True)
+
+        # 1. Complete the mission and bump the travel's counter, ownership checked in the same statement
+        if not mission_counters.mark_completed(cursor, mission_id, user_id):
+            # 2. Nothing changed: probe only to tell 404 / 403 / already completed
+            mission_info = _probe_mission(cursor, mission_id)
+            if not mission_info:
+                return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404 # Mission ID not found
+            if mission_info['user_id'] != user_id:
+                return json_response({"code": 403, "success": False, "msg": "미션 완료 권한 없음"}), 403 # No permission to complete mission
+            return json_response({"code": 200, "success": True, "msg": f"미션(ID: {mission_id})은 이미 완료 상태입니다."}), 200 # Mission (ID: {mission_id}) is already completed.
         conn.commit()
+        invalidate_lists(user_id)
 
-        return jsonify({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 완료 처리 성공"}), 200 # Mission (ID: {mission_id}) marked as completed successfully
+        return json_response({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 완료 처리 성공"}), 200 # Mission (ID: {mission_id}) marked as completed successfully
 
     except mysql.connector.Error as err:
+        if conn: conn.rollback()
         print(f"MySQL UPDATE error [PUT /missions/{mission_id}/complete]: {err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500 # DB processing error
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500 # DB processing error
     except Exception as e:
         print(f"Complete mission status error: {e}")
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # Internal server error
     finally:
-        if cursor_check:
-            try: cursor_check.close()
-            except Exception as cursor_err: print(f"Check cursor (complete) finally closing error: {cursor_err}")
-        if cursor_update:
-            try: cursor_update.close()
-            except Exception as cursor_err: print(f"Update cursor (complete) closing error: {cursor_err}")
+        if cursor:
+            try: cursor.close()
+            except Exception as cursor_err: print(f"Cursor (complete) finally closing error: {cursor_err}")
         if conn and conn.is_connected():
             try: conn.close()
             except Exception as conn_err: print(f"DB connection closing error: {conn_err}")
 
+# Read-through cache statistics (hit ratio, age of served entries, sampled staleness)
+@app.route('/api/cache-stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user_id):
+    return json_response({"code": 200, "success": True, "listCache": list_cache.get().stats()}), 200
+
 # --- Cloud Functions Entry Point Function ---
-def main(request):
-    """Entry point function for Cloud Functions HTTP trigger."""
-    with app.request_context(request.environ):
-        return app.full_dispatch_request()
\ No newline at end of file
+main = make_entry_point(app)
+
+def reconcile_mission_counters(request_obj):
+    """Cloud Scheduler entry point: recompute travels.total_missions / completed_missions from missions
+
+    Requires an OIDC token from SCHEDULER_SERVICE_ACCOUNT (braves_common/auth.py).
+    Cached lists of the users whose counters were repaired are invalidated.
+    """
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                repaired_user_ids = mission_counters.reconcile(cursor)
+                conn.commit()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err:
+        print(f"MySQL error [reconcile_mission_counters]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    for user_id in repaired_user_ids:
+        invalidate_lists(user_id) # travel / mission list caches still hold the drifted counters
+    if repaired_user_ids:
+        print(f"reconcile_mission_counters: repaired drifted counters for {len(repaired_user_ids)} user(s)")
+    return json_response({"code": 200, "success": True, "repaired": len(repaired_user_ids)}), 200
@@ -1,75 +1,122 @@
 import os
+import sys
 import json
-import jwt
 import datetime
 import uuid
+import time
 import mysql.connector
 import requests
-from flask import Flask, request, jsonify
-from functools import wraps
-
-from timezonefinder import TimezoneFinder
-import pytz
+from flask import Flask, Response, request, stream_with_context
+
+# 공용 라이브러리 (server/braves_common) - 배포 시 함수 디렉터리에 함께 복사
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, token_required, json_response, make_entry_point, scheduler_caller_error
+from braves_common import location_history, connection
+from braves_common.lazy import LazySingleton
+from braves_common.job_queue import create_job_queue, JobWorkerPool
+from braves_common.geo import geohash, cell_center
+from braves_common.singleflight import SingleFlight
+from braves_common import idempotency, mission_counters
+from braves_common.cache import invalidate_lists
+from braves_common.fcm import FcmDispatcher, create_transport, prune_dead_tokens, FCM_BATCH_WINDOW_MS
+from pregeneration import RateBudget, top_cells, upcoming_slots, slot_target
 
 app = Flask(__name__)
 
 # --- 환경 변수 설정 ---
-db_host = os.environ.get("CLOUD_SQL_HOST")
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD")
-db_name = os.environ.get("CLOUD_SQL_DATABASE")
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = "HS256"
 AI_MISSION_SERVICE_URL = os.environ.get("AI_MISSION_SERVICE_URL")
-
-# --- TimezoneFinder 초기화 ---
-tf = TimezoneFinder()
-
-# --- Firebase Admin SDK 초기화 ---
-import firebase_admin
-from firebase_admin import credentials, messaging
-try:
+# 스트리밍 엔드포인트 (기본: AI_MISSION_SERVICE_URL + "/stream")
+AI_MISSION_STREAM_URL = os.environ.get("AI_MISSION_STREAM_URL") or (AI_MISSION_SERVICE_URL.rstrip('/') + "/stream" if AI_MISSION_SERVICE_URL else None)
+AI_MISSION_STREAM_TIMEOUT = (5, float(os.environ.get("AI_MISSION_STREAM_READ_TIMEOUT", 60))) # (connect, 청크 사이 read)
+
+# --- TimezoneFinder 초기화 (지연 로딩) ---
+# 격자 셀 단위로 시간대를 캐시하고, 경계 셀에서만 TimezoneFinder 로 정확히 조회
+TZ_CELL_DEGREES = float(os.environ.get("TZ_CELL_DEGREES", 0.05))
+TZ_CACHE_MAX_CELLS = int(os.environ.get("TZ_CACHE_MAX_CELLS", 4096))
+# false(기본): 폴리곤 데이터를 파일에서 필요한 부분만 읽음 (콜드 스타트 최소화), true: 전부 메모리에 적재
+TZ_IN_MEMORY = os.environ.get("TZ_IN_MEMORY", "false").lower() == "true"
+
+def _create_timezone_cache():
+    # timezonefinder/pytz 는 시간대 조회가 처음 필요할 때만 import
+    from timezonefinder import TimezoneFinder
+    from timezone_cache import TimezoneGridCache
+    return TimezoneGridCache(TimezoneFinder(in_memory=TZ_IN_MEMORY), cell_degrees=TZ_CELL_DEGREES, max_cells=TZ_CACHE_MAX_CELLS)
+
+tz_cache = LazySingleton(_create_timezone_cache, name="timezone-cache")
+
+# --- Firebase Admin SDK 초기화 (지연 로딩) ---
+def _init_firebase_messaging():
+    """Firebase Admin SDK 를 초기화하고 messaging 모듈 반환 (FCM 발송이 처음 필요할 때 호출)"""
+    import firebase_admin
+    from firebase_admin import messaging
     if not firebase_admin._apps:
         firebase_admin.initialize_app()
     print("Firebase Admin SDK initialized.")
-except Exception as e:
-    print(f"Error initializing Firebase Admin SDK: {e}")
+    return messaging
 
+firebase_messaging = LazySingleton(_init_firebase_messaging, name="firebase-admin")
 
-# --- 데이터베이스 연결 ---
-def get_db_connection():
-    conn = None
-    try:
-        conn = mysql.connector.connect(
-            host=db_host, user=db_user, password=db_password,
-            database=db_name, port=3306
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL 연결 오류: {err}")
-        return None
-
-# --- JWT 인증 데코레이터 ---
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try: token = auth_header.split(" ")[1]
-            except IndexError: return jsonify({"code": 401, "success": False, "msg": "유효하지 않은 토큰 형식"}), 401
-        if not token: return jsonify({"code": 401, "success": False, "msg": "인증 토큰 필요"}), 401
-        if not JWT_SECRET or JWT_SECRET == "change-this-in-prod":
-             print("CRITICAL: JWT_SECRET 환경 변수가 설정되지 않았거나 기본값을 사용 중입니다.")
-             return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (JWT Secret)"}), 500
+# --- FCM 발송 (배치 + 재시도 + 만료 토큰 정리) ---
+# FCM_BATCH_WINDOW_MS 동안 모인 메시지를 send_each 로 한 번에 발송 (0 이면 즉시 발송)
+def _prune_fcm_tokens(tokens):
+    """FCM 이 등록 해제/무효로 응답한 토큰을 users.fcm_token 에서 제거"""
+    with connection() as conn:
+        cursor = conn.cursor()
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            kwargs['current_user_id'] = payload['userId']
-        except jwt.ExpiredSignatureError: return jsonify({"code": 401, "success": False, "msg": "토큰 만료"}), 401
-        except jwt.InvalidTokenError as e: return jsonify({"code": 401, "success": False, "msg": f"유효하지 않은 토큰: {e}"}), 401
-        except Exception as e: return jsonify({"code": 401, "success": False, "msg": "토큰 처리 오류"}), 401
-        return f(*args, **kwargs)
-    return decorated
+            pruned = prune_dead_tokens(cursor, tokens)
+            conn.commit()
+        finally:
+            cursor.close()
+    print(f"Pruned {pruned} dead FCM token(s).")
+
+def _create_fcm_dispatcher():
+    dispatcher = FcmDispatcher(create_transport(messaging_factory=firebase_messaging.get), on_dead_tokens=_prune_fcm_tokens)
+    if FCM_BATCH_WINDOW_MS > 0:
+        dispatcher.start_batching(FCM_BATCH_WINDOW_MS / 1000)
+    return dispatcher
+
+fcm_dispatcher = LazySingleton(_create_fcm_dispatcher, name="fcm-dispatcher")
+
+# --- 미션 제안 작업 큐 ---
+# propose_ai_mission 은 작업만 등록하고 202 반환, 워커 풀이 AI 호출 / 제안 저장 / FCM 발송 처리
+PROPOSAL_JOB_KIND = "mission_proposal"
+PROPOSAL_WORKER_CONCURRENCY = int(os.environ.get("PROPOSAL_WORKER_CONCURRENCY", 4))
+# true(기본): 인스턴스 내부 워커가 즉시 처리 (CPU 상시 할당 권장), false: process_mission_jobs 진입점만 처리
+PROPOSAL_WORKERS_IN_PROCESS = os.environ.get("PROPOSAL_WORKERS_IN_PROCESS", "true").lower() == "true"
+PROPOSAL_DRAIN_DEADLINE_SECONDS = float(os.environ.get("PROPOSAL_DRAIN_DEADLINE_SECONDS", 240))
+PROPOSAL_EXPIRES_HOURS = 24
+
+job_queue = LazySingleton(create_job_queue, name="job-queue")
+
+def _start_proposal_workers():
+    pool = JobWorkerPool(job_queue.get(), {PROPOSAL_JOB_KIND: _process_mission_proposal_job},
+                         concurrency=PROPOSAL_WORKER_CONCURRENCY, name="proposal-worker")
+    if PROPOSAL_WORKERS_IN_PROCESS:
+        pool.start()
+    return pool
+
+proposal_workers = LazySingleton(_start_proposal_workers, name="proposal-workers")
+
+
+# --- 중복 요청 제거 ---
+# 같은 (사용자, 여행, 위치 셀) 의 동시 요청은 AI 호출 / 미션 저장을 한 번만 수행 (geohash 7자리 ~ 150m 셀)
+SINGLEFLIGHT_CELL_PRECISION = int(os.environ.get("SINGLEFLIGHT_CELL_PRECISION", 7))
+mission_generation_flights = SingleFlight(name="direct-mission")
+
+# --- 미션 사전 생성 (pregenerate_missions 진입점) ---
+PREGEN_CELL_PRECISION = int(os.environ.get("PREGEN_CELL_PRECISION", 5)) # geohash 5자리 ~ 4.9km 셀
+PREGEN_CELLS_PER_TRAVEL = int(os.environ.get("PREGEN_CELLS_PER_TRAVEL", 2))
+PREGEN_HISTORY_HOURS = int(os.environ.get("PREGEN_HISTORY_HOURS", 72)) # 최근 방문 셀 계산 구간
+PREGEN_LOOKAHEAD_DAYS = int(os.environ.get("PREGEN_LOOKAHEAD_DAYS", 1)) # 시작 전 여행도 포함
+PREGEN_HORIZON_HOURS = int(os.environ.get("PREGEN_HORIZON_HOURS", 24))
+PREGEN_DAY_START_HOUR = int(os.environ.get("PREGEN_DAY_START_HOUR", 9)) # 현지 시각
+PREGEN_DAY_END_HOUR = int(os.environ.get("PREGEN_DAY_END_HOUR", 21))
+PREGEN_SLOT_HOURS = int(os.environ.get("PREGEN_SLOT_HOURS", 4))
+PREGEN_MAX_PER_SLOT = int(os.environ.get("PREGEN_MAX_PER_SLOT", 2)) # mission_frequency 100 일 때 (셀, 시간대) 당 후보 수
+PREGEN_MAX_AI_CALLS_PER_RUN = int(os.environ.get("PREGEN_MAX_AI_CALLS_PER_RUN", 100)) # 전역 호출 예산
+PREGEN_AI_CALLS_PER_MINUTE = float(os.environ.get("PREGEN_AI_CALLS_PER_MINUTE", 20))
+PREGEN_DEADLINE_SECONDS = float(os.environ.get("PREGEN_DEADLINE_SECONDS", 480))
+
 
 # --- 함수 ---
 def _get_travel_and_user_info(cursor, user_id, travel_id):
@@ -101,9 +148,8 @@ def _get_travel_and_user_info(cursor, user_id, travel_id):
 def _get_time_for_ai(lat_f, lon_f):
     """주어진 위도/경도 기반으로 시간 정보 생성"""
     current_time_for_ai = ""
-    timezone_str = tf.timezone_at(lng=lon_f, lat=lat_f)
+    timezone_str, user_timezone = tz_cache.get().lookup(lat_f, lon_f)
     if timezone_str:
-        user_timezone = pytz.timezone(timezone_str)
         current_time_for_ai = datetime.datetime.now(user_timezone).isoformat()
         print(f"Timezone for location: {timezone_str}, Current time at location: {current_time_for_ai}")
     else:
@@ -130,26 +176,138 @@ def _extract_mission_from_ai_response(ai_mission_data):
         print(f"AI Mission Service가 성공 응답을 반환하지 않음: {msg}")
         raise ValueError(f"AI 서비스 처리 실패: {msg}")
     mission_details = ai_mission_data['mission']
+    if not isinstance(mission_details, dict):
+        raise ValueError("AI 서비스 응답 형식 오류: mission 객체가 아님")
     mission_title = mission_details.get('name')
     mission_content = mission_details.get('how_to_play')
+    if isinstance(mission_content, list): # 구조화 출력: 단계 목록 -> 줄 단위 텍스트
+        mission_content = "\n".join(f"- {step}" for step in mission_content)
     if not mission_title or not mission_content:
         raise ValueError("AI 서비스로부터 유효한 미션 제목/내용을 받지 못함")
     return mission_title, mission_content, mission_details
 
 def _upsert_location_log(cursor, user_id, lat_f, lon_f, acc_f):
-    """location_logs 테이블에 위치 정보 UPSERT"""
-    upsert_sql = """
-        INSERT INTO location_logs (user_id, latitude, longitude, accuracy, updated_at)
-        VALUES (%s, %s, %s, %s, NOW())
-        ON DUPLICATE KEY UPDATE
-            latitude = VALUES(latitude),
-            longitude = VALUES(longitude),
-            accuracy = VALUES(accuracy),
-            updated_at = NOW()
-    """
-    cursor.execute(upsert_sql, (user_id, lat_f, lon_f, acc_f))
+    """location_history 에 위치 추가 및 location_logs (최신 위치) 갱신"""
+    location_history.append_user_fixes(cursor, user_id, [(lat_f, lon_f, acc_f, datetime.datetime.now(datetime.timezone.utc))])
     print(f"Location log for user_id {user_id} saved/updated.")
 
+def _send_proposal_fcm(user_fcm_token, proposal_id, travel_id, mission_title):
+    """제안 알림을 FCM 배치 발송 대기열에 추가 (실패해도 제안은 유지, 로그만 남김)"""
+    try:
+        fcm_dispatcher.get().enqueue({
+            'token': user_fcm_token,
+            'data': {'proposal_id': proposal_id, 'travel_id': str(travel_id), 'mission_title': mission_title, 'type': 'MISSION_PROPOSAL'},
+        })
+    except Exception as fcm_err: print(f"Error sending FCM message: {fcm_err}")
+
+def _begin_idempotent_request(user_id, idem_key, endpoint, request_fingerprint):
+    """Idempotency-Key 선점. 처음이면 None, 아니면 재전송할 응답 (저장된 응답 / 409 / 422) 반환"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                state = idempotency.begin(cursor, user_id, idem_key, endpoint, request_fingerprint)
+                conn.commit()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [Idempotency-Key 확인]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    if state is None:
+        return None
+    if state['endpoint'] != endpoint or state['fingerprint'] != request_fingerprint:
+        return json_response({"code": 422, "success": False, "msg": "다른 요청에 이미 사용된 Idempotency-Key"}), 422
+    if state['status'] != idempotency.COMPLETED:
+        return json_response({"code": 409, "success": False, "msg": "같은 Idempotency-Key 요청이 처리 중"}), 409
+    response = json_response(state['response_body'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, state['response_code']
+
+def _finish_idempotent_request(user_id, idem_key, status_code, payload):
+    """응답 저장 (5xx 는 재시도할 수 있도록 키 해제)"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if status_code >= 500:
+                    idempotency.abandon(cursor, user_id, idem_key)
+                else:
+                    idempotency.complete(cursor, user_id, idem_key, status_code, payload)
+                conn.commit()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [Idempotency-Key 저장]: {db_err}")
+
+def _store_proposal(cursor, proposal_id, user_id, travel_id, mission_title, mission_content, raw_ai_response):
+    """mission_proposals 저장 후 사용자 FCM 토큰 반환 (커밋은 호출자)"""
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(hours=PROPOSAL_EXPIRES_HOURS)
+    sql_insert_proposal = "INSERT INTO mission_proposals (id, user_id, travel_id, title, content, raw_ai_response, expires_at, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())"
+    cursor.execute(sql_insert_proposal, (proposal_id, user_id, travel_id, mission_title, mission_content, raw_ai_response, expires_at))
+    cursor.execute("SELECT fcm_token FROM users WHERE id = %s", (user_id,))
+    user_record = cursor.fetchone()
+    return user_record.get('fcm_token') if user_record else None
+
+def _process_mission_proposal_job(payload):
+    """작업 큐 핸들러: (사전 생성 후보 또는) AI 미션 생성 -> mission_proposals 저장 -> FCM 발송
+
+    예외가 발생하면 작업 큐가 백오프 후 재시도. 리스가 만료되어 같은 작업이 다시 실행될 수 있으므로
+    이미 저장된 제안이면 AI 호출 없이 종료.
+    """
+    proposal_id = payload['proposal_id']; user_id = payload['user_id']; travel_id = payload['travel_id']
+    ai_payload = payload['ai_payload']
+    user_fcm_token = None
+    mission_title = None
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT 1 FROM mission_proposals WHERE id = %s", (proposal_id,))
+            if cursor.fetchone():
+                print(f"Proposal {proposal_id} already stored. Skipping.")
+                return
+            candidate = _take_pregenerated_mission(cursor, travel_id, float(ai_payload['latitude']), float(ai_payload['longitude']))
+            if candidate:
+                mission_title = candidate['title']
+                user_fcm_token = _store_proposal(cursor, proposal_id, user_id, travel_id, candidate['title'], candidate['content'], candidate['raw_ai_response'])
+            conn.commit()
+        finally:
+            cursor.close()
+
+    if mission_title is None:
+        # AI 호출 동안에는 DB 연결을 잡지 않음
+        ai_mission_data = _call_ai_mission_service(ai_payload)
+        mission_title, mission_content, _ = _extract_mission_from_ai_response(ai_mission_data)
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                user_fcm_token = _store_proposal(cursor, proposal_id, user_id, travel_id, mission_title, mission_content, json.dumps(ai_mission_data))
+                conn.commit()
+            finally:
+                cursor.close()
+
+    if user_fcm_token:
+        _send_proposal_fcm(user_fcm_token, proposal_id, travel_id, mission_title)
+    else: print(f"User {user_id} FCM token not found. Skipping FCM.")
+
+def _take_pregenerated_mission(cursor, travel_id, lat_f, lon_f):
+    """현재 위치 셀 / 시간대에 맞는 사전 생성 미션 후보를 하나 꺼내 소비 처리 (없으면 None, 커밋은 호출자)"""
+    cell = geohash(lat_f, lon_f, PREGEN_CELL_PRECISION)
+    cursor.execute(
+        """SELECT id, title, content, raw_ai_response FROM mission_candidates
+           WHERE travel_id = %s AND cell = %s AND consumed_at IS NULL
+             AND valid_from <= UTC_TIMESTAMP() AND valid_until > UTC_TIMESTAMP()
+           ORDER BY valid_from, id
+           LIMIT 1
+           FOR UPDATE SKIP LOCKED""",
+        (travel_id, cell)
+    )
+    candidate = cursor.fetchone()
+    if not candidate:
+        return None
+    cursor.execute("UPDATE mission_candidates SET consumed_at = UTC_TIMESTAMP() WHERE id = %s", (candidate['id'],))
+    print(f"Serving pre-generated mission candidate {candidate['id']} (travel {travel_id}, cell {cell}).")
+    return candidate
+
 
 # --- API 라우트 ---
 
@@ -161,14 +319,14 @@ def generate_direct_ai_mission(current_user_id, travel_id):
 
     # 클라이언트로부터 위치 정보 받기
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+        return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
     client_data = request.get_json()
     latitude_str = client_data.get('latitude')
     longitude_str = client_data.get('longitude')
     accuracy_str = client_data.get('accuracy')
 
     if latitude_str is None or longitude_str is None:
-        return jsonify({"code": 400, "success": False, "msg": "필수 파라미터 누락: latitude, longitude"}), 400
+        return json_response({"code": 400, "success": False, "msg": "필수 파라미터 누락: latitude, longitude"}), 400
     try:
         lat_f = float(latitude_str)
         lon_f = float(longitude_str)
@@ -177,13 +335,39 @@ def generate_direct_ai_mission(current_user_id, travel_id):
         if not (-180 <= lon_f <= 180): raise ValueError("longitude 범위 초과")
         if acc_f is not None and acc_f < 0: raise ValueError("accuracy는 음수일 수 없음")
     except (ValueError, TypeError) as ve:
-        return jsonify({"code": 400, "success": False, "msg": f"위치 정보 유효성 오류: {ve}"}), 400
-
+        return json_response({"code": 400, "success": False, "msg": f"위치 정보 유효성 오류: {ve}"}), 400
+
+    # 같은 Idempotency-Key 로 재시도하면 저장된 응답을 그대로 반환
+    idem_key = request.headers.get('Idempotency-Key')
+    if idem_key is not None:
+        if not idem_key or len(idem_key) > idempotency.MAX_KEY_LENGTH:
+            return json_response({"code": 400, "success": False, "msg": f"Idempotency-Key 는 1~{idempotency.MAX_KEY_LENGTH}자"}), 400
+        replay = _begin_idempotent_request(user_id, idem_key, 'generate-direct-ai-mission',
+                                           idempotency.fingerprint(travel_id, geohash(lat_f, lon_f, SINGLEFLIGHT_CELL_PRECISION)))
+        if replay is not None:
+            return replay
+
+    # 동시에 들어온 같은 (사용자, 여행, 위치 셀) 요청은 하나의 생성/저장을 공유
+    flight_key = (user_id, travel_id, geohash(lat_f, lon_f, SINGLEFLIGHT_CELL_PRECISION))
+    (payload, status_code), shared = mission_generation_flights.do(
+        flight_key, lambda: _generate_direct_mission(user_id, travel_id, lat_f, lon_f, acc_f))
+    if shared: print(f"generate-direct-ai-mission {flight_key}: shared in-flight result (missionId={payload.get('missionId')}).")
+
+    if idem_key is not None:
+        _finish_idempotent_request(user_id, idem_key, status_code, payload)
+    return json_response(payload), status_code
+
+def _generate_direct_mission(user_id, travel_id, lat_f, lon_f, acc_f):
+    """위치 기록 -> (사전 생성 후보 또는) AI 미션 생성 -> missions 저장. (응답 payload, 상태 코드) 반환
+
+    AI 호출 (최대 30초) 동안 풀 연결과 트랜잭션 (location_logs 행 잠금) 을 잡지 않도록
+    위치 기록 / 조회를 먼저 커밋하고 연결을 반환한 뒤, 생성된 미션은 새 연결로 저장.
+    """
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        if not conn: return {"code": 500, "success": False, "msg": "DB 연결 실패"}, 500
         cursor = conn.cursor(dictionary=True)
 
         # 받은 위치 정보를 location_logs 테이블에 저장/업데이트
@@ -192,52 +376,23 @@ def generate_direct_ai_mission(current_user_id, travel_id):
         # 여행 및 사용자 정보 조회
         common_data = _get_travel_and_user_info(cursor, user_id, travel_id)
         
-        # 시간 정보 생성 (클라이언트가 제공한 위치 기반)
-        current_time_for_ai = _get_time_for_ai(lat_f, lon_f)
-        
-        ai_payload = {
-            "latitude": str(lat_f),
-            "longitude": str(lon_f),
-            "traveler_information": common_data["traveler_information_str"],
-            "current_time": current_time_for_ai,
-            "trip_information": common_data["trip_information"],
-            "brave_scale": common_data["brave_scale"]
-        }
-        
-        ai_mission_data = _call_ai_mission_service(ai_payload)
-        mission_title, mission_content, mission_details_full = _extract_mission_from_ai_response(ai_mission_data)
-
-        sql_insert_mission = "INSERT INTO missions (travel_id, title, content, created_at, updated_at) VALUES (%s, %s, %s, NOW(), NOW())"
-        cursor.execute(sql_insert_mission, (travel_id, mission_title, mission_content))
-        new_mission_id = cursor.lastrowid
-        
-        conn.commit() # 모든 DB 작업 성공 후 커밋
-        
-        return jsonify({
-            "code": 201, 
-            "success": True, 
-            "msg": "AI 미션 직접 생성 및 저장 성공",
-            "missionId": new_mission_id, 
-            "title": mission_title,     # 수정: 미션 제목만 반환
-            "content": mission_content  # 수정: 미션 내용만 반환
-        }), 201
-
-    except ValueError as ve: # 헬퍼 함수에서 발생한 ValueError 처리
-        status_code = 500 # 기본값
-        if "Travel ID" in str(ve) or "사용자 정보" in str(ve): status_code = 404
-        elif "AI 서비스" in str(ve): status_code = 502
-        return jsonify({"code": status_code, "success": False, "msg": str(ve)}), status_code
-    except requests.exceptions.RequestException as req_err: # AI 서비스 호출 자체 오류
-        return jsonify({"code": 502, "success": False, "msg": f"미션 생성 서비스 호출 실패: {req_err}"}), 502
+        # 사전 생성된 후보가 있으면 AI 호출 없이 바로 저장
+        candidate = _take_pregenerated_mission(cursor, travel_id, lat_f, lon_f)
+        if candidate:
+            new_mission_id = mission_counters.insert_mission(cursor, travel_id, candidate['title'], candidate['content'])
+        conn.commit()
+    except ValueError as ve: # 헬퍼 함수에서 발생한 ValueError 처리 (여행 / 사용자 없음)
+        if conn: conn.rollback()
+        return {"code": 404, "success": False, "msg": str(ve)}, 404
     except mysql.connector.Error as db_err:
         if conn: conn.rollback()
         print(f"MySQL 오류 [POST /generate-direct-ai-mission]: {db_err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+        return {"code": 500, "success": False, "msg": "DB 처리 오류"}, 500
     except Exception as e:
         if conn: conn.rollback()
         print(f"Generate direct AI mission 오류: {type(e).__name__} - {e}")
         import traceback; traceback.print_exc()
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return {"code": 500, "success": False, "msg": "서버 내부 오류"}, 500
     finally:
         if cursor: 
             try: cursor.close()
@@ -246,18 +401,185 @@ def generate_direct_ai_mission(current_user_id, travel_id):
             try: conn.close(); print("DB connection (direct_ai_mission) closed.")
             except Exception as e: print(f"DB 연결 (direct_ai_mission) finally: {e}")
 
-# 2. AI 미션 제안 및 FCM 발송
+    if candidate:
+        mission_title, mission_content = candidate['title'], candidate['content']
+    else:
+        ai_payload = {
+            "latitude": str(lat_f),
+            "longitude": str(lon_f),
+            "traveler_information": common_data["traveler_information_str"],
+            "current_time": _get_time_for_ai(lat_f, lon_f), # 시간 정보 생성 (클라이언트가 제공한 위치 기반)
+            "trip_information": common_data["trip_information"],
+            "brave_scale": common_data["brave_scale"],
+            "user_id": str(user_id)
+        }
+        try:
+            ai_mission_data = _call_ai_mission_service(ai_payload)
+            mission_title, mission_content, _ = _extract_mission_from_ai_response(ai_mission_data)
+            with connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    new_mission_id = mission_counters.insert_mission(cursor, travel_id, mission_title, mission_content)
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except ValueError as ve:
+            status_code = 502 if "AI 서비스" in str(ve) else 500
+            return {"code": status_code, "success": False, "msg": str(ve)}, status_code
+        except requests.exceptions.RequestException as req_err: # AI 서비스 호출 자체 오류
+            return {"code": 502, "success": False, "msg": f"미션 생성 서비스 호출 실패: {req_err}"}, 502
+        except mysql.connector.Error as db_err:
+            print(f"MySQL 오류 [POST /generate-direct-ai-mission 저장]: {db_err}")
+            return {"code": 500, "success": False, "msg": "DB 처리 오류"}, 500
+        except Exception as e:
+            print(f"Generate direct AI mission 오류: {type(e).__name__} - {e}")
+            import traceback; traceback.print_exc()
+            return {"code": 500, "success": False, "msg": "서버 내부 오류"}, 500
+
+    invalidate_lists(user_id)
+    return {
+        "code": 201, 
+        "success": True, 
+        "msg": "AI 미션 직접 생성 및 저장 성공",
+        "missionId": new_mission_id, 
+        "title": mission_title,     # 수정: 미션 제목만 반환
+        "content": mission_content  # 수정: 미션 내용만 반환
+    }, 201
+
+# 1-1. AI 미션 직접 생성 (스트리밍 중계)
+# AI 서비스의 SSE (chunk ... done) 를 그대로 클라이언트에 전달하고, done 수신 시 미션을 저장한 뒤 saved 이벤트 추가
+@app.route('/api/travels/<int:travel_id>/generate-direct-ai-mission/stream', methods=['POST'])
+@token_required
+def stream_direct_ai_mission(current_user_id, travel_id):
+    user_id = current_user_id
+    if not request.is_json: return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+    if not AI_MISSION_STREAM_URL: return json_response({"code": 500, "success": False, "msg": "AI 서비스 URL 미설정"}), 500
+    client_data = request.get_json()
+    latitude_str = client_data.get('latitude')
+    longitude_str = client_data.get('longitude')
+    accuracy_str = client_data.get('accuracy')
+
+    if latitude_str is None or longitude_str is None: return json_response({"code": 400, "success": False, "msg": "필수 파라미터 누락: latitude, longitude"}), 400
+    try:
+        lat_f = float(latitude_str); lon_f = float(longitude_str)
+        acc_f = float(accuracy_str) if accuracy_str is not None else None
+        if not (-90 <= lat_f <= 90): raise ValueError("latitude 범위 초과")
+        if not (-180 <= lon_f <= 180): raise ValueError("longitude 범위 초과")
+        if acc_f is not None and acc_f < 0: raise ValueError("accuracy는 음수일 수 없음")
+    except (ValueError, TypeError) as ve:
+        return json_response({"code": 400, "success": False, "msg": f"위치 정보 유효성 오류: {ve}"}), 400
+
+    # 스트리밍 시작 전에 DB 작업을 마치고 연결 반환 (생성 중에는 연결을 잡지 않음)
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        cursor = conn.cursor(dictionary=True)
+        _upsert_location_log(cursor, user_id, lat_f, lon_f, acc_f)
+        common_data = _get_travel_and_user_info(cursor, user_id, travel_id)
+        candidate = _take_pregenerated_mission(cursor, travel_id, lat_f, lon_f)
+        if candidate: # 사전 생성 후보가 있으면 AI 스트림 없이 바로 저장
+            new_mission_id = mission_counters.insert_mission(cursor, travel_id, candidate['title'], candidate['content'])
+        conn.commit()
+        if candidate:
+            invalidate_lists(user_id)
+    except ValueError as ve:
+        if conn: conn.rollback()
+        return json_response({"code": 404, "success": False, "msg": str(ve)}), 404
+    except mysql.connector.Error as db_err:
+        if conn: conn.rollback()
+        print(f"MySQL 오류 [POST /generate-direct-ai-mission/stream]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    finally:
+        if cursor:
+            try: cursor.close()
+            except Exception as e: print(f"DB 커서 (stream_ai_mission) finally: {e}")
+        if conn and conn.is_connected():
+            try: conn.close()
+            except Exception as e: print(f"DB 연결 (stream_ai_mission) finally: {e}")
+
+    if candidate:
+        payload = {"code": 201, "success": True, "msg": "AI 미션 직접 생성 및 저장 성공", "missionId": new_mission_id,
+                   "title": candidate['title'], "content": candidate['content'], "ttfbMs": 0, "totalMs": 0}
+        response = Response(f"event: saved\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n", mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    ai_payload = {
+        "latitude": str(lat_f), "longitude": str(lon_f),
+        "traveler_information": common_data["traveler_information_str"],
+        "current_time": _get_time_for_ai(lat_f, lon_f),
+        "trip_information": common_data["trip_information"],
+        "brave_scale": common_data["brave_scale"],
+        "user_id": str(user_id)
+    }
+
+    def relay():
+        started = time.perf_counter()
+        ttfb_ms = None
+        event_name = None
+        done_data = None
+        try:
+            with requests.post(AI_MISSION_STREAM_URL, json=ai_payload, stream=True, timeout=AI_MISSION_STREAM_TIMEOUT) as ai_response:
+                ai_response.raise_for_status()
+                for line in ai_response.iter_lines(decode_unicode=True):
+                    if ttfb_ms is None and line:
+                        ttfb_ms = int((time.perf_counter() - started) * 1000)
+                        print(f"AI mission stream first byte after {ttfb_ms} ms (travel {travel_id})")
+                    yield line + "\n"
+                    if line.startswith("event:"):
+                        event_name = line[len("event:"):].strip()
+                    elif line.startswith("data:") and event_name == "done":
+                        done_data = json.loads(line[len("data:"):])
+                    elif not line and done_data is not None: # done 이벤트가 끝난 뒤 저장
+                        yield _save_streamed_mission(user_id, travel_id, done_data, ttfb_ms, started)
+                        done_data = None
+        except Exception as e:
+            print(f"AI mission stream 중계 오류: {type(e).__name__} - {e}")
+            yield f"event: error\ndata: {json.dumps({'code': 502, 'success': False, 'msg': f'미션 생성 서비스 호출 실패: {e}'}, ensure_ascii=False)}\n\n"
+
+    response = Response(stream_with_context(relay()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def _save_streamed_mission(user_id, travel_id, ai_mission_data, ttfb_ms, started):
+    """스트림 done 이벤트의 미션을 저장하고 클라이언트에 보낼 saved (또는 error) 이벤트 반환"""
+    try:
+        mission_title, mission_content, _ = _extract_mission_from_ai_response(ai_mission_data)
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                new_mission_id = mission_counters.insert_mission(cursor, travel_id, mission_title, mission_content)
+                conn.commit()
+            finally:
+                cursor.close()
+        invalidate_lists(user_id)
+        total_ms = int((time.perf_counter() - started) * 1000)
+        print(f"AI mission stream saved mission {new_mission_id}: ttfb={ttfb_ms} ms, total={total_ms} ms")
+        payload = {"code": 201, "success": True, "msg": "AI 미션 직접 생성 및 저장 성공", "missionId": new_mission_id,
+                   "title": mission_title, "content": mission_content, "ttfbMs": ttfb_ms, "totalMs": total_ms}
+        return f"event: saved\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    except ValueError as ve:
+        payload = {"code": 502, "success": False, "msg": str(ve)}
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [stream 미션 저장]: {db_err}")
+        payload = {"code": 500, "success": False, "msg": "DB 처리 오류"}
+    return f"event: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# 2. AI 미션 제안 요청 (비동기: 워커가 생성 후 제안 저장 및 FCM 발송)
 @app.route('/api/travels/<int:travel_id>/propose-ai-mission', methods=['POST'])
 @token_required
 def propose_ai_mission(current_user_id, travel_id):
     user_id = current_user_id
-    if not request.is_json: return jsonify({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+    if not request.is_json: return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
     client_data = request.get_json()
     latitude_str = client_data.get('latitude')
     longitude_str = client_data.get('longitude')
     accuracy_str = client_data.get('accuracy')
 
-    if latitude_str is None or longitude_str is None: return jsonify({"code": 400, "success": False, "msg": "필수 파라미터 누락: latitude, longitude"}), 400
+    if latitude_str is None or longitude_str is None: return json_response({"code": 400, "success": False, "msg": "필수 파라미터 누락: latitude, longitude"}), 400
     try:
         lat_f = float(latitude_str); lon_f = float(longitude_str)
         acc_f = float(accuracy_str) if accuracy_str is not None else None
@@ -265,18 +587,17 @@ def propose_ai_mission(current_user_id, travel_id):
         if not (-180 <= lon_f <= 180): raise ValueError("longitude 범위 초과")
         if acc_f is not None and acc_f < 0: raise ValueError("accuracy는 음수일 수 없음")
     except (ValueError, TypeError) as ve:
-        return jsonify({"code": 400, "success": False, "msg": f"위치 정보 유효성 오류: {ve}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"위치 정보 유효성 오류: {ve}"}), 400
     
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
         cursor = conn.cursor(dictionary=True)
 
         _upsert_location_log(cursor, user_id, lat_f, lon_f, acc_f)
         common_data = _get_travel_and_user_info(cursor, user_id, travel_id)
-        user_fcm_token = common_data.pop('user_fcm_token')
         current_time_for_ai = _get_time_for_ai(lat_f, lon_f)
         
         ai_payload = {
@@ -284,52 +605,33 @@ def propose_ai_mission(current_user_id, travel_id):
             "traveler_information": common_data["traveler_information_str"],
             "current_time": current_time_for_ai,
             "trip_information": common_data["trip_information"],
-            "brave_scale": common_data["brave_scale"]
+            "brave_scale": common_data["brave_scale"],
+            "user_id": str(user_id)
         }
-        
-        ai_mission_data = _call_ai_mission_service(ai_payload)
-        mission_title, mission_content, _ = _extract_mission_from_ai_response(ai_mission_data)
+        conn.commit() # 위치 로그 커밋
 
+        # AI 생성 / 제안 저장 / FCM 발송은 워커가 처리 (job id == proposal id)
         proposal_id = str(uuid.uuid4())
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        sql_insert_proposal = "INSERT INTO mission_proposals (id, user_id, travel_id, title, content, raw_ai_response, expires_at, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())"
-        cursor.execute(sql_insert_proposal, (proposal_id, user_id, travel_id, mission_title, mission_content, json.dumps(ai_mission_data), expires_at))
-        
-        conn.commit() # 위치 로그, 미션 제안 모두 커밋
+        job_queue.get().enqueue(PROPOSAL_JOB_KIND, {
+            "proposal_id": proposal_id, "user_id": user_id, "travel_id": travel_id, "ai_payload": ai_payload
+        }, job_id=proposal_id)
+        if PROPOSAL_WORKERS_IN_PROCESS:
+            proposal_workers.get().notify()
 
-        if user_fcm_token and firebase_admin._apps:
-            try:
-                message = messaging.Message(
-                    data={ 'proposal_id': proposal_id, 'travel_id': str(travel_id), 'mission_title': mission_title, 'type': 'MISSION_PROPOSAL'},
-                    token=user_fcm_token,
-                )
-                # --- Notification 페이로드만 보내기 ---
-                # print(f"FCM TEST (Notification-only): Sending to token: {user_fcm_token}") # 테스트 로그 추가
-                # message = messaging.Message(
-                #     notification=messaging.Notification(title="[백엔드 테스트] 알림 제목", body="이것은 백엔드에서 보낸 알림 전용 메시지입니다."),
-                #     token=user_fcm_token,
-                # )
-                fcm_response = messaging.send(message); print('Successfully sent FCM message:', fcm_response)
-            except Exception as fcm_err: print(f"Error sending FCM message: {fcm_err}")
-        else: print(f"User {user_id} FCM token not found or Firebase not init. Skipping FCM.")
-            
-        return jsonify({"code": 202, "success": True, "msg": "미션 제안 생성 및 알림 시도 완료", "proposalId": proposal_id}), 202
+        return json_response({"code": 202, "success": True, "msg": "미션 제안 생성 요청 접수", "proposalId": proposal_id}), 202
     except ValueError as ve:
         if conn: conn.rollback()
         status_code = 404 if "Travel ID" in str(ve) or "사용자 정보" in str(ve) else 502
-        return jsonify({"code": status_code, "success": False, "msg": str(ve)}), status_code
-    except requests.exceptions.RequestException as req_err:
-        if conn: conn.rollback()
-        return jsonify({"code": 502, "success": False, "msg": f"미션 제안 서비스 호출 실패: {req_err}"}), 502
+        return json_response({"code": status_code, "success": False, "msg": str(ve)}), status_code
     except mysql.connector.Error as db_err:
         if conn: conn.rollback()
         print(f"MySQL 오류 [POST /propose-ai-mission]: {db_err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
     except Exception as e:
         if conn: conn.rollback()
         print(f"Propose AI mission 오류: {type(e).__name__} - {e}")
         import traceback; traceback.print_exc()
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor: 
             try: cursor.close()
@@ -347,19 +649,18 @@ def accept_mission_proposal(current_user_id, proposal_id):
     cursor = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT travel_id, title, content FROM mission_proposals WHERE id = %s AND user_id = %s AND expires_at > NOW()", (proposal_id, user_id))
         proposal = cursor.fetchone()
-        if not proposal: return jsonify({"code": 404, "success": False, "msg": "유효한 미션 제안을 찾을 수 없거나 만료됨"}), 404
+        if not proposal: return json_response({"code": 404, "success": False, "msg": "유효한 미션 제안을 찾을 수 없거나 만료됨"}), 404
         
         travel_id = proposal['travel_id']; mission_title = proposal['title']; mission_content = proposal['content']
-        sql_insert_mission = "INSERT INTO missions (travel_id, title, content, created_at, updated_at) VALUES (%s, %s, %s, NOW(), NOW())"
-        cursor.execute(sql_insert_mission, (travel_id, mission_title, mission_content))
-        new_mission_id = cursor.lastrowid
+        new_mission_id = mission_counters.insert_mission(cursor, travel_id, mission_title, mission_content)
         cursor.execute("DELETE FROM mission_proposals WHERE id = %s", (proposal_id,))
         conn.commit()
-        return jsonify({
+        invalidate_lists(user_id)
+        return json_response({
             "code": 201,
             "success": True,
             "msg": "미션 수락 및 저장 성공",
@@ -370,12 +671,12 @@ def accept_mission_proposal(current_user_id, proposal_id):
     except mysql.connector.Error as db_err:
         if conn: conn.rollback()
         print(f"MySQL 오류 [POST /accept-proposal]: {db_err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
     except Exception as e:
         if conn: conn.rollback()
         print(f"Accept mission proposal 오류: {e}")
         import traceback; traceback.print_exc()
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor: 
             try: cursor.close()
@@ -384,6 +685,46 @@ def accept_mission_proposal(current_user_id, proposal_id):
             try: conn.close(); print("DB connection (accept_proposal) closed.")
             except Exception as e: print(f"DB 연결 (accept_proposal) finally 오류: {e}")
 
+# 4. 미션 제안 처리 상태 조회 (FCM 을 받지 못한 클라이언트의 폴링용)
+@app.route('/api/mission-proposals/<string:proposal_id>', methods=['GET'])
+@token_required
+def get_mission_proposal_status(current_user_id, proposal_id):
+    user_id = current_user_id
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT travel_id, title, content, expires_at FROM mission_proposals WHERE id = %s AND user_id = %s", (proposal_id, user_id))
+        proposal = cursor.fetchone()
+        if proposal:
+            return json_response({"code": 200, "success": True, "msg": "미션 제안 준비 완료", "status": "ready",
+                                  "proposalId": proposal_id, "travelId": proposal['travel_id'],
+                                  "title": proposal['title'], "content": proposal['content'],
+                                  "expiresAt": proposal['expires_at']}), 200
+
+        job = job_queue.get().get(proposal_id)
+        if not job or job['status'] == 'done': # done 인데 제안이 없으면 이미 수락되었거나 다른 사용자 소유
+            return json_response({"code": 404, "success": False, "msg": "미션 제안을 찾을 수 없음"}), 404
+        if job['status'] == 'failed':
+            return json_response({"code": 200, "success": True, "msg": "미션 제안 생성 실패", "status": "failed", "proposalId": proposal_id}), 200
+        return json_response({"code": 200, "success": True, "msg": "미션 제안 생성 중", "status": "pending",
+                              "proposalId": proposal_id, "attempts": job['attempts']}), 200
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [GET /mission-proposals]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e:
+        print(f"Get mission proposal status 오류: {type(e).__name__} - {e}")
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+    finally:
+        if cursor:
+            try: cursor.close()
+            except Exception as e: print(f"DB 커서 (proposal_status) finally 오류: {e}")
+        if conn and conn.is_connected():
+            try: conn.close()
+            except Exception as e: print(f"DB 연결 (proposal_status) finally 오류: {e}")
+
 # === 사용자 상태 업데이트 API (FCM 토큰 전용) ===
 @app.route('/api/user-status', methods=['POST'])
 @token_required
@@ -392,16 +733,16 @@ def update_user_status(current_user_id):
     user_id = current_user_id
 
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
+        return json_response({"code": 400, "success": False, "msg": "JSON 형식 필요"}), 400
     
     data = request.get_json()
     fcm_token_from_client = data.get('fcmToken')
 
     if fcm_token_from_client is None: 
-        return jsonify({"code": 400, "success": False, "msg": "필수 필드 누락: fcmToken"}), 400
+        return json_response({"code": 400, "success": False, "msg": "필수 필드 누락: fcmToken"}), 400
     
     if not isinstance(fcm_token_from_client, str) or len(fcm_token_from_client) > 255: # DB 스키마 길이 고려
-        return jsonify({"code": 400, "success": False, "msg": "fcmToken 형식이 잘못되었거나 너무 깁니다."}), 400
+        return json_response({"code": 400, "success": False, "msg": "fcmToken 형식이 잘못되었거나 너무 깁니다."}), 400
     
     fcm_token_to_save = fcm_token_from_client if fcm_token_from_client else None
 
@@ -410,7 +751,7 @@ def update_user_status(current_user_id):
     try:
         conn = get_db_connection()
         if not conn: 
-            return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+            return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
         cursor = conn.cursor()
 
         sql_update_fcm = "UPDATE users SET fcm_token = %s, updated_at = NOW() WHERE id = %s"
@@ -423,17 +764,17 @@ def update_user_status(current_user_id):
         else:
             msg = "FCM 토큰이 성공적으로 제거되었습니다."
             
-        return jsonify({"code": 200, "success": True, "msg": msg}), 200
+        return json_response({"code": 200, "success": True, "msg": msg}), 200
 
     except mysql.connector.Error as db_err:
         if conn: conn.rollback()
         print(f"MySQL 오류 [POST /user-status - FCM Update]: {db_err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
     except Exception as e:
         if conn: conn.rollback()
         print(f"Update user status (FCM only) 오류: {type(e).__name__} - {e}")
         import traceback; traceback.print_exc()
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor:
             try: cursor.close()
@@ -443,6 +784,123 @@ def update_user_status(current_user_id):
             except Exception as e: print(f"DB 연결 (user-status/FCM) finally 오류: {e}")
 
 # --- Cloud Functions Entry Point Function ---
-def main(request_obj):
-    with app.request_context(request_obj.environ):
-        return app.full_dispatch_request()
\ No newline at end of file
+main = make_entry_point(app)
+
+def pregenerate_missions(request_obj):
+    """Cloud Scheduler 트리거용 진입점 (비혼잡 시간대): 진행 중 / 곧 시작할 여행의 미션 후보를 미리 생성
+
+    최근 방문한 셀과 다가오는 현지 낮 시간대마다 mission_frequency 에 비례한 수의 후보를 채우고,
+    전체 AI 호출은 PREGEN_MAX_AI_CALLS_PER_RUN / PREGEN_AI_CALLS_PER_MINUTE 예산 안에서만 수행.
+    AI 호출 예산을 쓰므로 SCHEDULER_SERVICE_ACCOUNT 의 OIDC 토큰이 있는 호출만 실행 (braves_common/auth.py).
+    """
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    budget = RateBudget(PREGEN_MAX_AI_CALLS_PER_RUN, PREGEN_AI_CALLS_PER_MINUTE, deadline_seconds=PREGEN_DEADLINE_SECONDS)
+    result = {"travels": 0, "generated": 0, "failed": 0, "skipped_no_location": 0, "expired_deleted": 0}
+    try:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("DELETE FROM mission_candidates WHERE valid_until < %s", (now,))
+                result["expired_deleted"] = cursor.rowcount
+                # 날짜 경계는 현지 시각 기준이므로 하루 여유를 두고 조회, 슬롯 단위로 다시 확인
+                cursor.execute(
+                    """SELECT id, user_id, start_date, end_date, mission_frequency FROM travels
+                       WHERE mission_frequency > 0 AND start_date <= %s AND end_date >= %s
+                       ORDER BY start_date""",
+                    (now.date() + datetime.timedelta(days=PREGEN_LOOKAHEAD_DAYS + 1), now.date() - datetime.timedelta(days=1))
+                )
+                travels = cursor.fetchall()
+                conn.commit()
+                for travel in travels:
+                    if budget.exhausted:
+                        break
+                    result["travels"] += 1
+                    _pregenerate_for_travel(conn, cursor, travel, now, budget, result)
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [pregenerate_missions]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류", **result}), 500
+    result["ai_calls"] = budget.used
+    print(f"pregenerate_missions: {result}")
+    return json_response({"code": 200, "success": True, **result}), 200
+
+def _pregenerate_for_travel(conn, cursor, travel, now, budget, result):
+    travel_id = travel['id']; user_id = travel['user_id']
+    cursor.execute(
+        """SELECT latitude, longitude FROM location_history
+           WHERE user_id = %s AND recorded_at >= %s
+           ORDER BY recorded_at DESC LIMIT 2000""",
+        (user_id, now - datetime.timedelta(hours=PREGEN_HISTORY_HOURS))
+    )
+    cells = top_cells([(row['latitude'], row['longitude']) for row in cursor.fetchall()], PREGEN_CELL_PRECISION, PREGEN_CELLS_PER_TRAVEL)
+    if not cells:
+        # destination 은 자유 텍스트라 좌표를 알 수 없음 -> 위치 기록이 생긴 뒤부터 사전 생성
+        result["skipped_no_location"] += 1
+        return
+    try:
+        common_data = _get_travel_and_user_info(cursor, user_id, travel_id)
+    except ValueError as ve:
+        print(f"Pregeneration skipped for travel {travel_id}: {ve}")
+        return
+    cursor.execute(
+        """SELECT cell, valid_from, COUNT(*) AS remaining FROM mission_candidates
+           WHERE travel_id = %s AND consumed_at IS NULL AND valid_until > %s
+           GROUP BY cell, valid_from""",
+        (travel_id, now)
+    )
+    existing = {(row['cell'], row['valid_from']): row['remaining'] for row in cursor.fetchall()}
+    conn.commit()
+
+    target = slot_target(travel['mission_frequency'], PREGEN_MAX_PER_SLOT)
+    for cell in cells:
+        lat_f, lon_f = cell_center(cell)
+        _, cell_timezone = tz_cache.get().lookup(lat_f, lon_f)
+        slots = upcoming_slots(now, cell_timezone or datetime.timezone.utc, travel['start_date'], travel['end_date'],
+                               PREGEN_DAY_START_HOUR, PREGEN_DAY_END_HOUR, PREGEN_SLOT_HOURS, PREGEN_HORIZON_HOURS)
+        for local_start, valid_from, valid_until in slots:
+            for _ in range(target - existing.get((cell, valid_from), 0)):
+                if not budget.acquire():
+                    return
+                ai_payload = {
+                    "latitude": str(lat_f), "longitude": str(lon_f),
+                    "traveler_information": common_data["traveler_information_str"],
+                    "current_time": (local_start + (valid_until - valid_from) / 2).isoformat(), # 슬롯 중간 시각
+                    "trip_information": common_data["trip_information"],
+                    "brave_scale": common_data["brave_scale"],
+                    "user_id": str(user_id)
+                }
+                try:
+                    ai_mission_data = _call_ai_mission_service(ai_payload)
+                    mission_title, mission_content, _ = _extract_mission_from_ai_response(ai_mission_data)
+                except (ValueError, requests.exceptions.RequestException) as e:
+                    result["failed"] += 1
+                    print(f"Pregeneration failed for travel {travel_id}, cell {cell}: {e}")
+                    continue
+                cursor.execute(
+                    """INSERT INTO mission_candidates (travel_id, user_id, cell, title, content, raw_ai_response, valid_from, valid_until, created_at)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())""",
+                    (travel_id, user_id, cell, mission_title, mission_content, json.dumps(ai_mission_data), valid_from, valid_until)
+                )
+                conn.commit()
+                result["generated"] += 1
+
+def process_mission_jobs(request_obj):
+    """Cloud Scheduler / Pub/Sub 트리거용 진입점: 남은 미션 제안 작업을 모두 처리 (재시도 포함)"""
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    processed = proposal_workers.get().drain(deadline_seconds=PROPOSAL_DRAIN_DEADLINE_SECONDS)
+    if fcm_dispatcher.initialized:
+        fcm_dispatcher.get().flush() # 요청이 끝나기 전에 대기 중인 알림 발송
+    purged = job_queue.get().purge()
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            purged += idempotency.purge_expired(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+    print(f"process_mission_jobs: processed={processed}, purged={purged}")
+    return json_response({"code": 200, "success": True, "processed": processed, "purged": purged}), 200
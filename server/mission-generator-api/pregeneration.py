@@ -0,0 +1,88 @@
+"""Planning for speculative mission pre-generation (driven by main.pregenerate_missions).
+
+For each active or upcoming travel the planner picks the cells the traveller
+has recently been in and the upcoming daytime slots (local time, inside the
+travel dates), and works out how many candidates each (cell, slot) should hold
+given the travel's mission_frequency. RateBudget caps how many AI calls one
+run may make and how fast it makes them, so pre-generation never competes
+with on-demand traffic for the AI service quota.
+"""
+import math
+import time
+import datetime
+import collections
+
+from braves_common.geo import geohash
+
+
+class RateBudget:
+    """At most `max_calls` acquisitions per run, spaced to `calls_per_minute`, before `deadline_seconds`."""
+
+    def __init__(self, max_calls, calls_per_minute, deadline_seconds=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_calls = max_calls
+        self.min_interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline = clock() + deadline_seconds if deadline_seconds is not None else None
+        self._next_at = clock()
+        self.used = 0
+
+    def acquire(self):
+        """Wait for the next call slot; False once the budget or the deadline is exhausted."""
+        if self.used >= self.max_calls:
+            return False
+        now = self._clock()
+        if self._deadline is not None and max(now, self._next_at) >= self._deadline:
+            return False
+        if self._next_at > now:
+            self._sleep(self._next_at - now)
+        self._next_at = max(now, self._next_at) + self.min_interval
+        self.used += 1
+        return True
+
+    @property
+    def exhausted(self):
+        return self.used >= self.max_calls
+
+
+def top_cells(fixes, precision, limit):
+    """Most visited geohash cells among (latitude, longitude) fixes, most frequent first."""
+    counts = collections.Counter(geohash(lat, lng, precision) for lat, lng in fixes)
+    return [cell for cell, _ in counts.most_common(limit)]
+
+
+def upcoming_slots(now_utc, tzinfo, start_date, end_date, day_start_hour, day_end_hour, slot_hours, horizon_hours):
+    """Daytime slots starting within the horizon, inside the travel dates.
+
+    Returns [(local_start, utc_start, utc_end)] with naive UTC datetimes; the
+    slot already in progress counts, so a candidate can be served right away.
+    """
+    local_now = now_utc.replace(tzinfo=datetime.timezone.utc).astimezone(tzinfo)
+    horizon_end = local_now + datetime.timedelta(hours=horizon_hours)
+    slots = []
+    day = local_now.date()
+    while day <= horizon_end.date():
+        if start_date <= day <= end_date:
+            for hour in range(day_start_hour, day_end_hour, slot_hours):
+                local_start = _localize(tzinfo, datetime.datetime.combine(day, datetime.time(hour)))
+                local_end = local_start + datetime.timedelta(hours=min(slot_hours, day_end_hour - hour))
+                if local_end <= local_now or local_start >= horizon_end:
+                    continue
+                slots.append((local_start,
+                              local_start.astimezone(datetime.timezone.utc).replace(tzinfo=None),
+                              local_end.astimezone(datetime.timezone.utc).replace(tzinfo=None)))
+        day += datetime.timedelta(days=1)
+    return slots
+
+
+def slot_target(mission_frequency, max_per_slot):
+    """Candidates to keep per (cell, slot): mission_frequency (0-100) scales max_per_slot; 0 disables."""
+    if not mission_frequency or mission_frequency <= 0:
+        return 0
+    return max(1, math.ceil(max_per_slot * min(mission_frequency, 100) / 100))
+
+
+def _localize(tzinfo, naive):
+    # pytz zones need localize(); zoneinfo/timezone objects take tzinfo directly
+    localize = getattr(tzinfo, 'localize', None)
+    return localize(naive) if localize else naive.replace(tzinfo=tzinfo)
@@ -0,0 +1,91 @@
+"""Quantized lat/lon grid cache in front of TimezoneFinder.
+
+The map is divided into square cells of `cell_degrees`. The first lookup in a
+cell probes its four corners and centre; if they all agree the whole cell is
+cached as that timezone (name + pre-built pytz tzinfo). Cells whose probes
+disagree straddle a border and are remembered as such, so lookups there always
+fall back to an exact TimezoneFinder query for the point itself.
+
+A timezone enclave small enough to fit between the probes of one cell would
+be missed; keep `cell_degrees` well below the size of the smallest zone you
+care about (the default 0.05 deg is ~5.5 km).
+"""
+import math
+import threading
+import collections
+
+import pytz
+
+TZ_CELL_DEGREES = 0.05
+TZ_CACHE_MAX_CELLS = 4096
+
+_BORDER = object()
+
+
+class TimezoneGridCache:
+    """LRU of grid cell -> (timezone name, tzinfo) with exact fallback near borders."""
+
+    def __init__(self, finder, cell_degrees=TZ_CELL_DEGREES, max_cells=TZ_CACHE_MAX_CELLS):
+        if cell_degrees <= 0:
+            raise ValueError("cell_degrees must be positive")
+        self._finder = finder
+        self.cell_degrees = cell_degrees
+        self.max_cells = max_cells
+        self._cells = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = collections.Counter()
+
+    def lookup(self, lat, lng):
+        """Return (timezone name, tzinfo) for the point, or (None, None) if TimezoneFinder has no answer."""
+        cell = (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+        with self._lock:
+            entry = self._cells.get(cell)
+            if entry is not None:
+                self._cells.move_to_end(cell)
+                self._metrics['hits'] += 1
+            else:
+                self._metrics['misses'] += 1
+        if entry is None:
+            # resolved outside the lock; two threads may resolve the same cell once each, harmlessly
+            entry = self._resolve_cell(cell)
+            with self._lock:
+                self._cells[cell] = entry
+                while len(self._cells) > self.max_cells:
+                    self._cells.popitem(last=False)
+                    self._metrics['evictions'] += 1
+        if entry is _BORDER:
+            with self._lock:
+                self._metrics['border_fallbacks'] += 1
+            return self._exact(lat, lng)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot.update(cells=len(self._cells), max_cells=self.max_cells, cell_degrees=self.cell_degrees)
+        return snapshot
+
+    def _resolve_cell(self, cell):
+        size = self.cell_degrees
+        south, west = cell[0] * size, cell[1] * size
+        probes = [
+            (south, west), (south, west + size), (south + size, west), (south + size, west + size),
+            (south + size / 2, west + size / 2),
+        ]
+        names = {self._finder.timezone_at(lng=_wrap_lng(lng), lat=_clamp_lat(lat)) for lat, lng in probes}
+        if len(names) != 1:
+            return _BORDER
+        name = names.pop()
+        return (name, pytz.timezone(name)) if name else (None, None)
+
+    def _exact(self, lat, lng):
+        name = self._finder.timezone_at(lng=lng, lat=lat)
+        return (name, pytz.timezone(name)) if name else (None, None)
+
+
+def _clamp_lat(lat):
+    return max(-90.0, min(90.0, lat))
+
+
+def _wrap_lng(lng):
+    return ((lng + 180.0) % 360.0) - 180.0 if not -180.0 <= lng <= 180.0 else lng
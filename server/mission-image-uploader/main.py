@@ -1,23 +1,48 @@
 import os
+import sys
 import json
-import jwt
 import datetime
+import re
+import time
 import uuid
+import base64
+import hashlib
 import mysql.connector
-from flask import Flask, request, jsonify, abort
-from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, request
 from google.cloud import storage
+from google.api_core.exceptions import NotFound
+from PIL import Image, UnidentifiedImageError
+import google.auth.credentials
+import google.auth.transport.requests
+
+# 공용 라이브러리 (server/braves_common) - 배포 시 함수 디렉터리에 함께 복사
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, token_required, json_response, make_entry_point, connection, scheduler_caller_error
+from braves_common import image_objects, gcs_deletion
+from braves_common.cache import invalidate_lists
+from braves_common.lazy import LazySingleton
+from braves_common.job_queue import create_job_queue, JobWorkerPool
+from streaming_upload import stream_to_blob, UploadRejected, STREAMING_CONTENT_TYPES, EXTENSIONS, READ_SIZE
+from renditions import render_renditions, rendition_object_name, rendition_object_names, is_rendition_object_name, enabled_formats, RENDITION_WIDTHS, CONTENT_TYPES
 
 app = Flask(__name__)
 
 # --- 환경 변수 설정 ---
-db_host = os.environ.get("CLOUD_SQL_HOST")
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD")
-db_name = os.environ.get("CLOUD_SQL_DATABASE")
-JWT_SECRET = os.environ.get("JWT_SECRET", "change-this-in-prod") # 실제 키로 변경!
-JWT_ALGORITHM = "HS256"
 GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME")
+# 스트리밍 업로드 청크 크기 (256 KiB 배수로 맞춤) - 업로드 한 건의 메모리 상한
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# 헤더 없이 스트리밍한 본문은 해시를 알 때까지 여기 올렸다가 콘텐츠 이름으로 복사
+STAGING_PREFIX = "missions/staging/"
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+# 참조가 0 이 된 이미지 객체를 지우기 전 유예 시간 / sweep 한 번에 잠그는 행 수
+IMAGE_GC_GRACE_SECONDS = int(os.environ.get("IMAGE_GC_GRACE_SECONDS", 3600))
+IMAGE_GC_BATCH_SIZE = int(os.environ.get("IMAGE_GC_BATCH_SIZE", 100))
+IMAGE_GC_DEADLINE_SECONDS = float(os.environ.get("IMAGE_GC_DEADLINE_SECONDS", 240))
+# image_objects 이전 방식의 업로드 객체 (missions/user-<id>/...) - sweep_image_objects?adoptUntracked=true 로 추적 시작
+LEGACY_IMAGE_PREFIX = "missions/user-"
+# 직접 업로드용 서명 URL 유효 시간 (초)
+UPLOAD_URL_EXPIRATION_SECONDS = int(os.environ.get("UPLOAD_URL_EXPIRATION_SECONDS", 900))
 
 # --- GCS 클라이언트 초기화 ---
 try:
@@ -26,40 +51,30 @@ except Exception as e:
     print(f"Error initializing GCS client: {e}")
     storage_client = None
 
-# --- 데이터베이스 연결 ---
-def get_db_connection():
-    conn = None
-    try:
-        conn = mysql.connector.connect(
-            host=db_host, user=db_user, password=db_password,
-            database=db_name, port=3306
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL 연결 오류: {err}")
-        return None
-
-# --- JWT 인증 데코레이터 ---
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try: token = auth_header.split(" ")[1]
-            except IndexError: return jsonify({"code": 401, "success": False, "msg": "유효하지 않은 토큰 형식"}), 401
-        if not token: return jsonify({"code": 401, "success": False, "msg": "인증 토큰 필요"}), 401
-        if not JWT_SECRET or JWT_SECRET == "change-this-in-prod":
-             print("CRITICAL: JWT_SECRET 환경 변수가 설정되지 않았거나 기본값을 사용 중입니다.")
-             return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (JWT Secret)"}), 500
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            kwargs['current_user_id'] = payload['userId']
-        except jwt.ExpiredSignatureError: return jsonify({"code": 401, "success": False, "msg": "토큰 만료"}), 401
-        except jwt.InvalidTokenError as e: return jsonify({"code": 401, "success": False, "msg": f"유효하지 않은 토큰: {e}"}), 401
-        except Exception as e: return jsonify({"code": 401, "success": False, "msg": "토큰 처리 오류"}), 401
-        return f(*args, **kwargs)
-    return decorated
+# --- 렌디션 (썸네일) 생성 작업 큐 ---
+# 업로드 경로는 작업만 등록, 워커가 원본을 받아 프로세스 풀에서 WebP/AVIF 렌디션을 만들어
+# GCS 업로드 후 missions.completion_image_renditions 에 기록 (migrations/008)
+RENDITION_JOB_KIND = "image_renditions"
+RENDITION_WORKER_CONCURRENCY = int(os.environ.get("RENDITION_WORKER_CONCURRENCY", 2))
+# true(기본): 인스턴스 내부 워커가 즉시 처리 (CPU 상시 할당 권장), false: process_image_jobs 진입점만 처리
+RENDITION_WORKERS_IN_PROCESS = os.environ.get("RENDITION_WORKERS_IN_PROCESS", "true").lower() == "true"
+RENDITION_DRAIN_DEADLINE_SECONDS = float(os.environ.get("RENDITION_DRAIN_DEADLINE_SECONDS", 240))
+# 디코딩 / 인코딩은 CPU 작업이라 GIL 밖의 프로세스 풀에서 실행
+IMAGE_PROCESS_WORKERS = int(os.environ.get("IMAGE_PROCESS_WORKERS", os.cpu_count() or 1))
+# 렌디션 객체는 원본마다 새 이름이라 내용이 바뀌지 않음
+RENDITION_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+job_queue = LazySingleton(create_job_queue, name="job-queue")
+image_pool = LazySingleton(lambda: ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS), name="image-pool")
+
+def _start_rendition_workers():
+    pool = JobWorkerPool(job_queue.get(), {RENDITION_JOB_KIND: _process_rendition_job},
+                         concurrency=RENDITION_WORKER_CONCURRENCY, name="rendition-worker")
+    if RENDITION_WORKERS_IN_PROCESS:
+        pool.start()
+    return pool
+
+rendition_workers = LazySingleton(_start_rendition_workers, name="rendition-workers")
 
 # --- 파일 유효성 검사 설정 ---
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -73,93 +88,443 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
-    return jsonify({"code": 413, "success": False, "msg": f"이미지 파일 크기 제한 초과 ({MAX_CONTENT_LENGTH / 1024 / 1024:.0f}MB)"}), 413
+    return json_response({"code": 413, "success": False, "msg": f"이미지 파일 크기 제한 초과 ({MAX_CONTENT_LENGTH / 1024 / 1024:.0f}MB)"}), 413
 
 # --- API 라우트 ---
 
 # === 미션 이미지 업로드/수정 API ===
 # POST 또는 PUT 요청 모두 이 함수로 처리 
+# 이미지는 내용의 SHA-256 으로 이름을 정해 한 번만 저장 (braves_common/image_objects.py)
+# 이미 저장된 내용이면 업로드를 건너뛰고 참조만 추가, 기존 이미지는 참조만 해제 -> sweep_image_objects 가 삭제
 @app.route('/api/missions/<int:mission_id>/completion-image', methods=['POST', 'PUT'])
 @token_required
 def upload_or_update_mission_image(current_user_id, mission_id):
-    """미션 완료 이미지를 받아 GCS 업로드 및 DB에 공개 URL 저장/수정"""
+    """미션 완료 이미지를 받아 GCS 업로드 및 DB에 공개 URL 저장/수정
+
+    본문이 이미지 자체 (Content-Type: image/png, image/jpeg, image/gif) 이면 버퍼링 없이
+    GCS 로 스트리밍, multipart/form-data ('image_file' 파트) 는 기존 방식으로 처리.
+    """
     user_id = current_user_id
-    if 'image_file' not in request.files: return jsonify({"code": 400, "success": False, "msg": "'image_file' 파트 없음"}), 400
+    if request.mimetype in STREAMING_CONTENT_TYPES:
+        return _upload_streamed_image(user_id, mission_id)
+    if 'image_file' not in request.files: return json_response({"code": 400, "success": False, "msg": "'image_file' 파트 없음"}), 400
     file = request.files['image_file']
-    if file.filename == '': return jsonify({"code": 400, "success": False, "msg": "선택된 파일 없음"}), 400
-    if not file or not allowed_file(file.filename): return jsonify({"code": 400, "success": False, "msg": f"허용된 이미지 형식 아님 ({', '.join(ALLOWED_EXTENSIONS)})"}), 400
-    if not GCS_BUCKET_NAME: print("CRITICAL: GCS_BUCKET_NAME 환경 변수가 설정되지 않았습니다."); return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (Bucket name missing)"}), 500
-    if not storage_client: print("CRITICAL: GCS Client not initialized."); return jsonify({"code": 500, "success": False, "msg": "서버 설정 오류 (GCS Client)"}), 500
+    if file.filename == '': return json_response({"code": 400, "success": False, "msg": "선택된 파일 없음"}), 400
+    if not file or not allowed_file(file.filename): return json_response({"code": 400, "success": False, "msg": f"허용된 이미지 형식 아님 ({', '.join(ALLOWED_EXTENSIONS)})"}), 400
+    if not GCS_BUCKET_NAME: print("CRITICAL: GCS_BUCKET_NAME 환경 변수가 설정되지 않았습니다."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (Bucket name missing)"}), 500
+    if not storage_client: print("CRITICAL: GCS Client not initialized."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (GCS Client)"}), 500
 
-    conn = None; cursor_check = None; cursor_update = None; old_gcs_image_url = None; new_gcs_object_name = None; public_gcs_url = None
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        owner_error = _mission_owner_error(mission_id, user_id)
+        if owner_error: return owner_error
 
-        cursor_check = conn.cursor(dictionary=True)
-        sql_check = "SELECT t.user_id, m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s"
-        cursor_check.execute(sql_check, (mission_id,))
-        mission_data = cursor_check.fetchone()
-        old_gcs_image_url = mission_data.get('completion_image') if mission_data else None
+        # 폼 파싱으로 이미 받아 둔 파일을 해시 -> 콘텐츠 주소
+        sha256, size = _file_sha256(file.stream)
+        new_gcs_object_name = image_objects.content_object_name(sha256, os.path.splitext(file.filename)[1].lower())
+        stored = _acquire_image(new_gcs_object_name, sha256, size, file.content_type)
 
-        if cursor_check:
-            try: cursor_check.close()
-            except Exception as e: print(f"Check 커서(upload/update) 1차 닫기 오류: {e}")
-        cursor_check = None
+        # 새 이미지 GCS에 업로드 (같은 내용이 이미 있으면 생략)
+        if not stored:
+            try:
+                blob = storage_client.bucket(GCS_BUCKET_NAME).blob(new_gcs_object_name)
+                print(f"Uploading new file to gs://{GCS_BUCKET_NAME}/{new_gcs_object_name}")
+                file.seek(0); blob.upload_from_file(file.stream, content_type=file.content_type)
+                print("New file uploaded successfully.")
+            except Exception as gcs_err:
+                print(f"GCS Upload/MakePublic Error: {gcs_err}"); _release_image(new_gcs_object_name)
+                return json_response({"code": 500, "success": False, "msg": "이미지 업로드 또는 공개 처리 중 서버 오류 발생"}), 500
+        else:
+            print(f"Upload skipped: gs://{GCS_BUCKET_NAME}/{new_gcs_object_name} already stored")
+
+        public_gcs_url = _attach_image(mission_id, user_id, new_gcs_object_name, uploaded=not stored)
+        if public_gcs_url is None: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+
+        return json_response({
+            "code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 업로드/수정 및 저장 성공",
+            "filePath": new_gcs_object_name, 
+            "fileUrl": public_gcs_url,
+            "deduplicated": stored
+        }), 200
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [POST/PUT ...completion-image]: {db_err}"); return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e: print(f"Upload/Update mission image 오류: {type(e).__name__} - {e}"); return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+
+def _bucket_url_prefix():
+    return f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"
 
-        if not mission_data: return jsonify({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
-        if mission_data['user_id'] != user_id: return jsonify({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
+def _gcs_object_name(image_url):
+    prefix = _bucket_url_prefix()
+    return image_url[len(prefix):] if image_url.startswith(prefix) else image_url
 
-        # 기존 이미지 GCS에서 삭제 
-        if old_gcs_image_url:
+def _file_sha256(stream):
+    """파일 스트림의 (SHA-256 hex, 크기) - 고정 크기 버퍼로 읽고 처음 위치로 되돌림"""
+    digest = hashlib.sha256(); size = 0
+    stream.seek(0)
+    for block in iter(lambda: stream.read(READ_SIZE), b''):
+        digest.update(block); size += len(block)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+def _mission_owner_error(mission_id, user_id):
+    """소유권 확인 - 통과하면 None, 아니면 (응답, 상태 코드)"""
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT t.user_id FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s", (mission_id,))
+            mission_data = cursor.fetchone()
+        finally:
+            cursor.close()
+    if not mission_data: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+    if mission_data['user_id'] != user_id: return json_response({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
+    return None
+
+def _enqueue_gcs_deletions(object_names, reason):
+    """GCS 객체 삭제를 큐에만 등록 (braves_common/gcs_deletion.py) - 실제 삭제는 sweep_gcs_deletions 가 배치로 처리"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
             try:
-                object_name_to_delete = None
-                if old_gcs_image_url.startswith(f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"):
-                    object_name_to_delete = old_gcs_image_url.replace(f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/", "", 1)
-                else: 
-                    object_name_to_delete = old_gcs_image_url
-
-                if object_name_to_delete:
-                     old_blob_to_delete = storage_client.bucket(GCS_BUCKET_NAME).blob(object_name_to_delete)
-                     if old_blob_to_delete.exists():
-                         old_blob_to_delete.delete()
-                         print(f"Old GCS image {object_name_to_delete} deleted for replacement.")
-            except Exception as delete_err: print(f"Error deleting old GCS image {old_gcs_image_url}: {delete_err}")
-
-        # 새 이미지 GCS에 업로드
+                gcs_deletion.enqueue(cursor, object_names, reason)
+                conn.commit()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [enqueue deletion {', '.join(object_names)}]: {db_err}")
+
+def _acquire_image(object_name, sha256, size, content_type):
+    """이미지 객체 참조를 잡음 (업로드하는 동안 sweep 이 지우지 않도록 먼저 커밋) - 이미 저장돼 있으면 True"""
+    with connection() as conn:
+        cursor = conn.cursor()
         try:
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-            new_gcs_object_name = f"missions/user-{user_id}/mission-{mission_id}-{unique_filename}"
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(new_gcs_object_name)
-            print(f"Uploading new file to gs://{GCS_BUCKET_NAME}/{new_gcs_object_name}")
-            file.seek(0); blob.upload_from_file(file.stream, content_type=file.content_type)
-            print("New file uploaded successfully.")
-            public_gcs_url = blob.public_url 
-
-        except Exception as gcs_err: print(f"GCS Upload/MakePublic Error: {gcs_err}"); return jsonify({"code": 500, "success": False, "msg": "이미지 업로드 또는 공개 처리 중 서버 오류 발생"}), 500
-
-        sql_update = "UPDATE missions SET completion_image = %s, updated_at = NOW() WHERE id = %s"
-        cursor_update = conn.cursor(); cursor_update.execute(sql_update, (public_gcs_url, mission_id)); conn.commit()
-
-        return jsonify({
+            stored = image_objects.acquire(cursor, object_name, sha256, size, content_type)
+            conn.commit()
+        finally:
+            cursor.close()
+    return stored
+
+def _release_image(object_name):
+    """잡아 둔 참조 반환 (업로드 실패 등)"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                image_objects.release(cursor, object_name)
+                conn.commit()
+            finally:
+                cursor.close()
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [release {object_name}]: {db_err}")
+
+def _attach_image(mission_id, user_id, object_name, uploaded):
+    """미션이 object_name 을 가리키도록 기록하고 기존 이미지 참조를 해제 (한 트랜잭션) - 공개 URL 반환, 미션이 없으면 None
+
+    _acquire_image() 로 잡은 참조가 곧 이 미션의 참조. 같은 이미지를 다시 올린 경우에는 그 참조를 돌려줌.
+    """
+    public_gcs_url = storage_client.bucket(GCS_BUCKET_NAME).blob(object_name).public_url
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if uploaded: image_objects.mark_stored(cursor, object_name)
+            cursor.execute(
+                """SELECT m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id
+                   WHERE m.id = %s AND t.user_id = %s FOR UPDATE""",
+                (mission_id, user_id)
+            )
+            mission_data = cursor.fetchone()
+            if not mission_data or mission_data['completion_image'] == public_gcs_url:
+                image_objects.release(cursor, object_name)
+                conn.commit()
+                return public_gcs_url if mission_data else None
+            old_gcs_image_url = mission_data['completion_image']
+            cursor.execute(
+                "UPDATE missions SET completion_image = %s, completion_image_renditions = NULL, updated_at = NOW() WHERE id = %s",
+                (public_gcs_url, mission_id)
+            )
+            if old_gcs_image_url and old_gcs_image_url.startswith(_bucket_url_prefix()):
+                image_objects.release(cursor, _gcs_object_name(old_gcs_image_url)) # 객체 삭제는 sweep_image_objects 가 처리
+            conn.commit()
+        finally:
+            cursor.close()
+    invalidate_lists(user_id) # 미션 목록 캐시 무효화
+    _enqueue_renditions(mission_id, user_id, public_gcs_url)
+    return public_gcs_url
+
+def _enqueue_renditions(mission_id, user_id, image_url):
+    """렌디션 생성 작업 등록 - 실패해도 업로드는 성공으로 둠 (목록은 렌디션이 없으면 원본 URL 사용)"""
+    try:
+        job_queue.get().enqueue(RENDITION_JOB_KIND, {"mission_id": mission_id, "user_id": user_id, "image_url": image_url})
+        if RENDITION_WORKERS_IN_PROCESS:
+            rendition_workers.get().notify()
+    except Exception as e: print(f"Rendition job enqueue 오류 (mission {mission_id}): {type(e).__name__} - {e}")
+
+def _process_rendition_job(payload):
+    """원본 다운로드 -> 프로세스 풀에서 렌디션 생성 -> GCS 업로드 -> 원본이 그대로일 때만 DB 기록 (재시도해도 같은 객체 이름)
+
+    렌디션 이름은 원본 이름에서 정해지므로, 같은 내용의 원본에 이미 렌디션이 있으면 다시 만들지 않음.
+    """
+    mission_id = payload['mission_id']; image_url = payload['image_url']
+    bucket = storage_client.bucket(GCS_BUCKET_NAME)
+    original_name = _gcs_object_name(image_url)
+    formats = enabled_formats()
+    expected = {(name, fmt): rendition_object_name(original_name, name, fmt) for name in RENDITION_WIDTHS for fmt in formats}
+    existing = {blob.name: blob for blob in bucket.list_blobs(prefix=os.path.splitext(original_name)[0] + "-")}
+
+    urls = {}
+    if all(object_name in existing for object_name in expected.values()):
+        for (name, fmt), object_name in expected.items():
+            urls.setdefault(name, {})[fmt] = existing[object_name].public_url
+    else:
+        try:
+            data = bucket.blob(original_name).download_as_bytes()
+        except NotFound:
+            print(f"Rendition skipped: {original_name} already replaced/deleted"); return
+        try:
+            rendered = image_pool.get().submit(render_renditions, data, None, formats).result()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as decode_err:
+            # 디코딩할 수 없는 원본은 재시도해도 같음 -> 렌디션 없이 원본 URL 유지
+            print(f"Rendition skipped: {original_name} 디코딩 실패 - {type(decode_err).__name__}: {decode_err}"); return
+        for name, by_format in rendered.items():
+            for fmt, body in by_format.items():
+                blob = bucket.blob(rendition_object_name(original_name, name, fmt))
+                blob.cache_control = RENDITION_CACHE_CONTROL
+                blob.upload_from_string(body, content_type=CONTENT_TYPES[fmt])
+                urls.setdefault(name, {})[fmt] = blob.public_url
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE missions SET completion_image_renditions = %s, updated_at = NOW() WHERE id = %s AND completion_image = %s",
+                (json.dumps(urls), mission_id, image_url)
+            )
+            updated = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+    if not updated:
+        # 작업 중 이미지가 교체/삭제됨 - 렌디션은 원본과 함께 sweep_image_objects 가 정리
+        print(f"Renditions for mission {mission_id} not recorded: image changed"); return
+    invalidate_lists(payload['user_id']) # 미션 목록 캐시 무효화
+    print(f"Renditions for mission {mission_id}: {', '.join(f'{n}/{f}' for n in urls for f in urls[n])}")
+
+def _upload_streamed_image(user_id, mission_id):
+    """요청 본문을 고정 크기 버퍼로 GCS 에 스트리밍 업로드 (DB 연결은 업로드 동안 잡지 않음)
+
+    X-Content-SHA256 헤더로 본문 해시를 알려 주면 이미 저장된 내용일 때 본문을 읽지 않고 끝냄.
+    본문은 항상 missions/staging/ 에 올리면서 해시를 계산하고, 해시를 확인한 뒤에만 GCS 내부 복사로
+    콘텐츠 이름에 옮김 (같은 내용이 있으면 복사도 생략) - 콘텐츠 이름에는 검증된 내용만 기록됨.
+    """
+    if not GCS_BUCKET_NAME: print("CRITICAL: GCS_BUCKET_NAME 환경 변수가 설정되지 않았습니다."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (Bucket name missing)"}), 500
+    if not storage_client: print("CRITICAL: GCS Client not initialized."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (GCS Client)"}), 500
+    claimed_sha256 = request.headers.get('X-Content-SHA256', '').lower()
+    if claimed_sha256 and not SHA256_RE.match(claimed_sha256): return json_response({"code": 400, "success": False, "msg": "잘못된 X-Content-SHA256"}), 400
+    extension = EXTENSIONS[request.mimetype]
+    bucket = storage_client.bucket(GCS_BUCKET_NAME)
+
+    try:
+        # 1. 소유권 확인
+        owner_error = _mission_owner_error(mission_id, user_id)
+        if owner_error: return owner_error
+
+        # 2. 헤더로 알려 준 내용이 이미 저장돼 있으면 본문 없이 참조만 추가
+        new_gcs_object_name = None
+        if claimed_sha256:
+            new_gcs_object_name = image_objects.content_object_name(claimed_sha256, extension)
+            if _acquire_image(new_gcs_object_name, claimed_sha256, request.content_length, request.mimetype):
+                print(f"Upload skipped: gs://{GCS_BUCKET_NAME}/{new_gcs_object_name} already stored")
+                public_gcs_url = _attach_image(mission_id, user_id, new_gcs_object_name, uploaded=False)
+                if public_gcs_url is None: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+                return json_response({
+                    "code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 업로드/수정 및 저장 성공",
+                    "filePath": new_gcs_object_name, "fileUrl": public_gcs_url, "deduplicated": True
+                }), 200
+
+        # 3. 본문 -> staging 객체 (GCS resumable upload, 해시 동시 계산)
+        blob = bucket.blob(f"{STAGING_PREFIX}{uuid.uuid4().hex}{extension}")
+        digest = hashlib.sha256()
+        try:
+            size, _ = stream_to_blob(blob, request.stream, request.mimetype, UPLOAD_CHUNK_SIZE, MAX_CONTENT_LENGTH, digest)
+        except UploadRejected as ur:
+            if new_gcs_object_name: _release_image(new_gcs_object_name)
+            return json_response({"code": ur.status, "success": False, "msg": str(ur)}), ur.status
+        except Exception as gcs_err:
+            print(f"GCS streaming upload error: {type(gcs_err).__name__} - {gcs_err}")
+            if new_gcs_object_name: _release_image(new_gcs_object_name)
+            return json_response({"code": 500, "success": False, "msg": "이미지 업로드 또는 공개 처리 중 서버 오류 발생"}), 500
+        sha256 = digest.hexdigest()
+        print(f"Streamed {size} bytes to gs://{GCS_BUCKET_NAME}/{blob.name} (sha256 {sha256})")
+
+        try:
+            if claimed_sha256 and sha256 != claimed_sha256:
+                # 헤더와 내용이 다름 -> 잡아 둔 참조만 반환 (콘텐츠 이름에는 아무것도 쓰지 않음)
+                _release_image(new_gcs_object_name)
+                return json_response({"code": 400, "success": False, "msg": "X-Content-SHA256 이 본문과 다름"}), 400
+            # 4. staging -> 콘텐츠 이름 (GCS 내부 복사, 이미 있으면 생략)
+            deduplicated = False
+            if not claimed_sha256:
+                new_gcs_object_name = image_objects.content_object_name(sha256, extension)
+                deduplicated = _acquire_image(new_gcs_object_name, sha256, size, request.mimetype)
+            try:
+                if not deduplicated: bucket.copy_blob(blob, bucket, new_gcs_object_name)
+            except Exception as gcs_err:
+                print(f"GCS copy error: {type(gcs_err).__name__} - {gcs_err}"); _release_image(new_gcs_object_name)
+                return json_response({"code": 500, "success": False, "msg": "이미지 업로드 또는 공개 처리 중 서버 오류 발생"}), 500
+        finally:
+            _enqueue_gcs_deletions([blob.name], "staging") # 실패해도 버킷 수명 주기 규칙이 정리
+
+        # 5. DB 저장 (소유권 조건 포함) + 기존 이미지 참조 해제
+        public_gcs_url = _attach_image(mission_id, user_id, new_gcs_object_name, uploaded=not deduplicated)
+        if public_gcs_url is None: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+
+        return json_response({
             "code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 업로드/수정 및 저장 성공",
-            "filePath": new_gcs_object_name, 
-            "fileUrl": public_gcs_url 
+            "filePath": new_gcs_object_name,
+            "fileUrl": public_gcs_url,
+            "deduplicated": deduplicated
         }), 200
-    except mysql.connector.Error as db_err: print(f"MySQL 오류 [POST/PUT ...completion-image]: {db_err}"); return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
-    except Exception as e: print(f"Upload/Update mission image 오류: {type(e).__name__} - {e}"); return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
-    finally:
-        if cursor_check:
-            try: cursor_check.close()
-            except Exception as e: print(f"Check 커서(upload/update) finally 오류: {e}")
-        if cursor_update:
-            try: cursor_update.close()
-            except Exception as e: print(f"Update 커서(upload/update) finally 오류: {e}")
-        if conn and conn.is_connected():
-            try: conn.close(); print("DB connection (upload/update) closed.")
-            except Exception as e: print(f"DB 연결(upload/update) finally 오류: {e}")
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [POST/PUT ...completion-image (stream)]: {db_err}"); return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e: print(f"Upload/Update mission image (stream) 오류: {type(e).__name__} - {e}"); return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+
+# === 서명 URL 직접 업로드 API ===
+# 1) upload-url: 소유권 확인 후 짧은 유효 시간의 서명 PUT URL 발급 -> 클라이언트가 GCS 로 직접 PUT
+# 2) finalize (또는 버킷 OBJECT_FINALIZE 알림): 업로드된 객체를 missions.completion_image 에 기록
+# 이미지 바이트는 이 함수를 거치지 않음. 발급 내역은 mission_image_uploads 테이블 (migrations/007)
+
+# 업로드 객체 이름: missions/user-<user_id>/mission-<mission_id>-<uuid hex>.<ext>
+UPLOAD_OBJECT_NAME_RE = re.compile(r'^missions/user-(\d+)/mission-(\d+)-[0-9a-f]{32}\.(png|jpg|gif)$')
+
+def _signing_kwargs():
+    """서명에 쓸 자격 증명 인자 - Cloud Functions 기본 자격 증명은 개인 키가 없으므로 IAM signBlob 으로 서명
+
+    (실행 서비스 계정에 자기 자신에 대한 roles/iam.serviceAccountTokenCreator 필요)
+    """
+    credentials = storage_client._credentials
+    if isinstance(credentials, google.auth.credentials.Signing): return {}
+    if not credentials.valid: credentials.refresh(google.auth.transport.requests.Request())
+    return {"service_account_email": credentials.service_account_email, "access_token": credentials.token}
+
+@app.route('/api/missions/<int:mission_id>/completion-image:upload-url', methods=['POST'])
+@token_required
+def create_completion_image_upload_url(current_user_id, mission_id):
+    """미션 완료 이미지 직접 업로드용 서명 PUT URL 발급 (JSON 본문: {"contentType": "image/jpeg"})"""
+    user_id = current_user_id
+    data = request.get_json(silent=True) or {}
+    content_type = data.get('contentType')
+    if content_type not in EXTENSIONS: return json_response({"code": 400, "success": False, "msg": f"허용된 이미지 형식 아님 ({', '.join(sorted(EXTENSIONS))})"}), 400
+    if not GCS_BUCKET_NAME: print("CRITICAL: GCS_BUCKET_NAME 환경 변수가 설정되지 않았습니다."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (Bucket name missing)"}), 500
+    if not storage_client: print("CRITICAL: GCS Client not initialized."); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (GCS Client)"}), 500
+
+    object_name = f"missions/user-{user_id}/mission-{mission_id}-{uuid.uuid4().hex}{EXTENSIONS[content_type]}"
+    expires_at = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(seconds=UPLOAD_URL_EXPIRATION_SECONDS)
+    # 서명에 포함되는 헤더 - 클라이언트는 PUT 할 때 같은 값을 보내야 하고, GCS 가 크기 범위를 강제함
+    upload_headers = {"Content-Type": content_type, "x-goog-content-length-range": f"1,{MAX_CONTENT_LENGTH}"}
+    try:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT t.user_id FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s", (mission_id,))
+                mission_data = cursor.fetchone()
+                if not mission_data: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+                if mission_data['user_id'] != user_id: return json_response({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
+                cursor.execute(
+                    """INSERT INTO mission_image_uploads (object_name, mission_id, user_id, content_type, expires_at, created_at)
+                       VALUES (%s, %s, %s, %s, %s, NOW())""",
+                    (object_name, mission_id, user_id, content_type, expires_at)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+        blob = storage_client.bucket(GCS_BUCKET_NAME).blob(object_name)
+        upload_url = blob.generate_signed_url(
+            version="v4", method="PUT", expiration=datetime.timedelta(seconds=UPLOAD_URL_EXPIRATION_SECONDS),
+            content_type=content_type, headers={"x-goog-content-length-range": upload_headers["x-goog-content-length-range"]},
+            **_signing_kwargs()
+        )
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [POST ...completion-image:upload-url]: {db_err}"); return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e: print(f"Signed upload URL 오류: {type(e).__name__} - {e}"); return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+
+    return json_response({
+        "code": 200, "success": True, "msg": "업로드 URL 발급 성공",
+        "uploadUrl": upload_url, "method": "PUT", "headers": upload_headers,
+        "objectName": object_name, "expiresAt": expires_at.isoformat() + "Z"
+    }), 200
+
+def _record_signed_upload(object_name, size, content_type):
+    """발급된 업로드 객체를 미션 완료 이미지로 기록 (finalize API / 버킷 알림 공용) - (status, msg, file_url) 반환
+
+    mission_image_uploads.finalized_at 을 조건부 UPDATE 로 먼저 잡은 쪽만 기록하므로 두 경로가 겹쳐도 한 번만 반영됨.
+    """
+    upload_blob = storage_client.bucket(GCS_BUCKET_NAME).blob(object_name)
+    file_url = upload_blob.public_url
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("UPDATE mission_image_uploads SET finalized_at = NOW() WHERE object_name = %s AND finalized_at IS NULL", (object_name,))
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT finalized_at FROM mission_image_uploads WHERE object_name = %s", (object_name,))
+                upload = cursor.fetchone()
+                if not upload: return 404, "발급되지 않은 업로드", None
+                return 200, "이미 반영된 업로드", file_url
+            cursor.execute("SELECT mission_id, user_id FROM mission_image_uploads WHERE object_name = %s", (object_name,))
+            upload = cursor.fetchone()
+
+            if content_type not in EXTENSIONS or not 0 < size <= MAX_CONTENT_LENGTH:
+                gcs_deletion.enqueue(cursor, [object_name], "rejected_upload")
+                conn.commit()
+                return 400, "허용되지 않은 이미지 (형식 또는 크기)", None
+
+            cursor.execute(
+                """SELECT m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id
+                   WHERE m.id = %s AND t.user_id = %s FOR UPDATE""",
+                (upload['mission_id'], upload['user_id'])
+            )
+            mission_data = cursor.fetchone()
+            if not mission_data:
+                # 업로드 사이에 미션이 삭제됨 -> 객체 정리
+                gcs_deletion.enqueue(cursor, [object_name], "mission_deleted")
+                conn.commit()
+                return 404, f"Mission ID {upload['mission_id']} 없음", None
+            old_gcs_image_url = mission_data['completion_image']
+            image_objects.acquire(cursor, object_name, None, size, content_type, stored=True)
+            cursor.execute("UPDATE missions SET completion_image = %s, completion_image_renditions = NULL, updated_at = NOW() WHERE id = %s", (file_url, upload['mission_id']))
+            if old_gcs_image_url and old_gcs_image_url.startswith(_bucket_url_prefix()):
+                image_objects.release(cursor, _gcs_object_name(old_gcs_image_url)) # 객체 삭제는 sweep_image_objects 가 처리
+            conn.commit()
+        finally:
+            cursor.close()
+    invalidate_lists(upload['user_id']) # 미션 목록 캐시 무효화
+    _enqueue_renditions(upload['mission_id'], upload['user_id'], file_url)
+    return 200, f"미션(ID: {upload['mission_id']}) 이미지 업로드/수정 및 저장 성공", file_url
+
+@app.route('/api/missions/<int:mission_id>/completion-image:finalize', methods=['POST'])
+@token_required
+def finalize_completion_image_upload(current_user_id, mission_id):
+    """서명 URL 로 올린 객체를 완료 이미지로 기록 (JSON 본문: {"objectName": "..."})"""
+    user_id = current_user_id
+    data = request.get_json(silent=True) or {}
+    object_name = data.get('objectName')
+    if not isinstance(object_name, str) or not UPLOAD_OBJECT_NAME_RE.match(object_name): return json_response({"code": 400, "success": False, "msg": "잘못된 objectName"}), 400
+    if not GCS_BUCKET_NAME or not storage_client: print("CRITICAL: GCS 설정 누락 (bucket / client)"); return json_response({"code": 500, "success": False, "msg": "서버 설정 오류 (GCS)"}), 500
+
+    try:
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT mission_id, user_id FROM mission_image_uploads WHERE object_name = %s", (object_name,))
+                upload = cursor.fetchone()
+            finally:
+                cursor.close()
+        if not upload or upload['mission_id'] != mission_id: return json_response({"code": 404, "success": False, "msg": "발급되지 않은 업로드"}), 404
+        if upload['user_id'] != user_id: return json_response({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
+
+        # 객체 메타데이터만 조회 (본문은 읽지 않음)
+        blob = storage_client.bucket(GCS_BUCKET_NAME).get_blob(object_name)
+        if blob is None: return json_response({"code": 409, "success": False, "msg": "업로드가 아직 완료되지 않음"}), 409
+
+        status, msg, file_url = _record_signed_upload(object_name, blob.size or 0, blob.content_type)
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [POST ...completion-image:finalize]: {db_err}"); return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e: print(f"Finalize completion image 오류: {type(e).__name__} - {e}"); return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+
+    if status != 200: return json_response({"code": status, "success": False, "msg": msg}), status
+    return json_response({"code": 200, "success": True, "msg": msg, "filePath": object_name, "fileUrl": file_url}), 200
 
 # === 미션 완료 이미지 삭제 API ===
 @app.route('/api/missions/<int:mission_id>/completion-image', methods=['DELETE'])
@@ -167,50 +532,33 @@ def upload_or_update_mission_image(current_user_id, mission_id):
 def delete_completion_image(current_user_id, mission_id):
     """특정 미션의 완료 이미지를 GCS에서 삭제하고 DB에서 경로 제거"""
     user_id = current_user_id
-    conn = None; cursor_check = None; cursor_update = None; gcs_object_name_to_delete = None
+    conn = None; cursor_check = None; cursor_update = None
     try:
         conn = get_db_connection()
-        if not conn: return jsonify({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
+        if not conn: return json_response({"code": 500, "success": False, "msg": "DB 연결 실패"}), 500
         cursor_check = conn.cursor(dictionary=True)
-        sql_check = "SELECT t.user_id, m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s"
+        sql_check = "SELECT t.user_id, m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id WHERE m.id = %s FOR UPDATE"
         cursor_check.execute(sql_check, (mission_id,))
         mission_data = cursor_check.fetchone()
         try: cursor_check.close()
         except Exception as e: print(f"Check 커서(삭제) 닫기 오류: {e}"); cursor_check = None
 
-        if not mission_data: return jsonify({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
-        if mission_data['user_id'] != user_id: return jsonify({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
+        if not mission_data: return json_response({"code": 404, "success": False, "msg": f"Mission ID {mission_id} 없음"}), 404
+        if mission_data['user_id'] != user_id: return json_response({"code": 403, "success": False, "msg": "해당 미션에 접근 권한 없음"}), 403
         
         gcs_image_url_to_delete = mission_data.get('completion_image')
-        if not gcs_image_url_to_delete: return jsonify({"code": 404, "success": False, "msg": f"미션(ID: {mission_id})에 삭제할 이미지 없음"}), 404
+        if not gcs_image_url_to_delete: return json_response({"code": 404, "success": False, "msg": f"미션(ID: {mission_id})에 삭제할 이미지 없음"}), 404
         
-        try:
-            object_name_to_delete = None
-            if gcs_image_url_to_delete.startswith(f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"):
-                object_name_to_delete = gcs_image_url_to_delete.replace(f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/", "", 1)
-            else: 
-                object_name_to_delete = gcs_image_url_to_delete
-            
-            if object_name_to_delete:
-                bucket = storage_client.bucket(GCS_BUCKET_NAME)
-                blob = bucket.blob(object_name_to_delete)
-                if blob.exists():
-                    blob.delete()
-                    print(f"GCS image {object_name_to_delete} deleted.")
-                else:
-                    print(f"GCS image {object_name_to_delete} not found for deletion.")
-            else:
-                print(f"Invalid GCS path derived for deletion: {gcs_image_url_to_delete}")
-        except Exception as gcs_err:
-            print(f"GCS Delete Error for {gcs_object_name_to_delete or gcs_image_url_to_delete}: {gcs_err}")
-
-        sql_update = "UPDATE missions SET completion_image = NULL, updated_at = NOW() WHERE id = %s"
+        sql_update = "UPDATE missions SET completion_image = NULL, completion_image_renditions = NULL, updated_at = NOW() WHERE id = %s"
         cursor_update = conn.cursor()
         cursor_update.execute(sql_update, (mission_id,))
+        if gcs_image_url_to_delete.startswith(_bucket_url_prefix()):
+            image_objects.release(cursor_update, _gcs_object_name(gcs_image_url_to_delete)) # 객체 삭제는 sweep_image_objects 가 처리
         conn.commit()
-        return jsonify({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 삭제 성공"}), 200
-    except mysql.connector.Error as db_err: print(f"MySQL 오류 [DELETE ...completion-image]: {db_err}"); return jsonify({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
-    except Exception as e: print(f"Delete completion image 오류: {e}"); return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        invalidate_lists(user_id) # 미션 목록 캐시 무효화
+        return json_response({"code": 200, "success": True, "msg": f"미션(ID: {mission_id}) 이미지 삭제 성공"}), 200
+    except mysql.connector.Error as db_err: print(f"MySQL 오류 [DELETE ...completion-image]: {db_err}"); return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500
+    except Exception as e: print(f"Delete completion image 오류: {e}"); return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor_check:
           try: cursor_check.close()
@@ -223,7 +571,115 @@ def delete_completion_image(current_user_id, mission_id):
           except Exception as e: print(f"DB 연결(삭제) finally 오류: {e}")
 
 # --- Cloud Functions Entry Point Function ---
-def main(request_obj):
-    """Cloud Functions HTTP 트리거를 위한 진입점 함수."""
-    with app.request_context(request_obj.environ):
-        return app.full_dispatch_request()
\ No newline at end of file
+main = make_entry_point(app)
+
+def completion_image_finalized(request_obj):
+    """GCS OBJECT_FINALIZE 알림 엔트리 포인트 - 서명 URL 업로드를 finalize 호출 없이도 기록
+
+    Pub/Sub push 구독 본문 ({"message": {"data": base64(객체 리소스), "attributes": {...}}}) 과
+    Eventarc (CloudEvent binary mode, 본문이 객체 리소스) 둘 다 받음.
+    재시도가 의미 없는 알림 (다른 객체, 발급되지 않은 업로드) 은 200 으로 응답해 재전송을 막음.
+    push 구독 / 트리거의 OIDC 토큰을 확인하고 (SCHEDULER_SERVICE_ACCOUNT), 크기와 형식은 본문이 아니라 버킷의 객체에서 다시 읽음.
+    """
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    envelope = request_obj.get_json(silent=True) or {}
+    if 'message' in envelope:
+        message = envelope['message']
+        if message.get('attributes', {}).get('eventType', 'OBJECT_FINALIZE') != 'OBJECT_FINALIZE':
+            return json_response({"code": 200, "success": True, "msg": "무시 (finalize 이벤트 아님)"}), 200
+        try: gcs_object = json.loads(base64.b64decode(message.get('data', '')) or b'{}')
+        except ValueError: return json_response({"code": 200, "success": True, "msg": "무시 (잘못된 메시지)"}), 200
+    else:
+        gcs_object = envelope
+
+    object_name = gcs_object.get('name') or ''
+    if gcs_object.get('bucket') != GCS_BUCKET_NAME or not UPLOAD_OBJECT_NAME_RE.match(object_name):
+        return json_response({"code": 200, "success": True, "msg": "무시 (업로드 객체 아님)"}), 200
+    try:
+        # 객체 메타데이터만 조회 (본문은 읽지 않음)
+        blob = storage_client.bucket(GCS_BUCKET_NAME).get_blob(object_name)
+        if blob is None: return json_response({"code": 200, "success": True, "msg": "무시 (객체 없음)"}), 200
+        status, msg, _ = _record_signed_upload(object_name, blob.size or 0, blob.content_type)
+    except mysql.connector.Error as db_err:
+        print(f"MySQL 오류 [completion_image_finalized]: {db_err}")
+        return json_response({"code": 500, "success": False, "msg": "DB 처리 오류"}), 500 # 알림 재전송으로 재시도
+    except Exception as e:
+        print(f"completion_image_finalized 오류: {type(e).__name__} - {e}")
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500 # 알림 재전송으로 재시도
+    print(f"completion_image_finalized: {object_name} -> {status} {msg}")
+    return json_response({"code": 200, "success": True, "msg": msg}), 200
+
+def process_image_jobs(request_obj):
+    """Cloud Scheduler / Pub/Sub 트리거용 진입점: 남은 렌디션 작업을 모두 처리 (재시도 포함)"""
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    processed = rendition_workers.get().drain(deadline_seconds=RENDITION_DRAIN_DEADLINE_SECONDS)
+    purged = job_queue.get().purge()
+    print(f"process_image_jobs: processed={processed}, purged={purged}")
+    return json_response({"code": 200, "success": True, "processed": processed, "purged": purged}), 200
+
+def sweep_image_objects(request_obj):
+    """Cloud Scheduler 진입점: 참조 수를 missions 기준으로 다시 센 뒤, 유예 시간 넘게 참조가 0 인 이미지 (원본 + 렌디션) 를
+    삭제 큐에 넣고 남은 시간 동안 큐를 배치 삭제
+
+    ?adoptUntracked=true 이면 먼저 image_objects 에 없는 이전 방식 업로드 객체를 참조 0 으로 추적 시작
+    (여행 삭제 등으로 고아가 된 객체도 다음 reconcile 에서 참조가 없으면 삭제 대상이 됨).
+    객체를 삭제하므로 SCHEDULER_SERVICE_ACCOUNT 의 OIDC 토큰이 있는 호출만 실행.
+    """
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    started = time.monotonic()
+    adopted = _adopt_untracked_objects() if request_obj.args.get('adoptUntracked') == 'true' else 0
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            repaired = image_objects.reconcile(cursor, _bucket_url_prefix(), IMAGE_GC_GRACE_SECONDS)
+            conn.commit()
+        finally:
+            cursor.close()
+
+    queued = 0
+    while time.monotonic() - started < IMAGE_GC_DEADLINE_SECONDS:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                object_names = image_objects.lock_garbage(cursor, IMAGE_GC_GRACE_SECONDS, IMAGE_GC_BATCH_SIZE)
+                for object_name in object_names:
+                    gcs_deletion.enqueue(cursor, [object_name] + rendition_object_names(object_name), "unreferenced", guard_object_name=object_name)
+                queued += image_objects.mark_deleting(cursor, object_names)
+                conn.commit()
+            finally:
+                cursor.close()
+        if len(object_names) < IMAGE_GC_BATCH_SIZE:
+            break
+
+    swept = gcs_deletion.sweep(connection, storage_client.bucket(GCS_BUCKET_NAME), max(0, IMAGE_GC_DEADLINE_SECONDS - (time.monotonic() - started)))
+    print(f"sweep_image_objects: adopted={adopted}, repaired={repaired}, queued={queued}, {swept}")
+    return json_response({"code": 200, "success": True, "adopted": adopted, "repaired": repaired, "queued": queued, **swept}), 200
+
+def _adopt_untracked_objects():
+    """버킷의 이전 방식 업로드 원본 중 유예 시간보다 오래된 것을 image_objects 에 참조 0 으로 등록 (이미 있으면 그대로)"""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=IMAGE_GC_GRACE_SECONDS)
+    blobs = storage_client.bucket(GCS_BUCKET_NAME).list_blobs(prefix=LEGACY_IMAGE_PREFIX, fields="items(name,timeCreated),nextPageToken")
+    object_names = [blob.name for blob in blobs
+                    if not is_rendition_object_name(blob.name) and blob.time_created and blob.time_created < cutoff]
+    adopted = 0
+    for start in range(0, len(object_names), IMAGE_GC_BATCH_SIZE):
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                image_objects.adopt(cursor, object_names[start:start + IMAGE_GC_BATCH_SIZE])
+                adopted += cursor.rowcount
+                conn.commit()
+            finally:
+                cursor.close()
+    return adopted
+
+def sweep_gcs_deletions(request_obj):
+    """Cloud Scheduler 진입점: 삭제 큐 (gcs_deletions) 를 GCS 배치 요청으로 비움 - 업로드 경로가 등록한 staging / 거부된 업로드 객체 등"""
+    caller_error = scheduler_caller_error(request_obj)
+    if caller_error: return caller_error
+    swept = gcs_deletion.sweep(connection, storage_client.bucket(GCS_BUCKET_NAME), IMAGE_GC_DEADLINE_SECONDS)
+    print(f"sweep_gcs_deletions: {swept}")
+    return json_response({"code": 200, "success": True, **swept}), 200
@@ -0,0 +1,69 @@
+"""완료 이미지 렌디션 (썸네일) 생성 - 원본을 한 번만 디코딩해 고정 폭 WebP / AVIF 로 인코딩
+
+클라이언트 미션 카드가 최대 10 MB 원본을 받아 작은 썸네일로 그리지 않도록,
+업로드된 원본마다 RENDITION_WIDTHS 의 폭으로 줄인 이미지를 만든다.
+  - EXIF 방향은 픽셀에 반영한 뒤 EXIF 자체는 저장하지 않음 (위치 정보 제거)
+  - JPEG 는 draft() 로 필요한 크기까지만 DCT 디코딩, 큰 폭부터 차례로 줄여 다음 폭의 입력으로 사용
+  - 원본보다 큰 폭으로는 확대하지 않음
+render_renditions() 는 순수 함수 (bytes -> bytes) 라 ProcessPoolExecutor 워커에서 실행된다.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps, features
+
+# 렌디션 이름 -> 최대 폭 (px)
+RENDITION_WIDTHS = {"small": 320, "large": 1280}
+# 인코딩 형식 (쉼표 구분) - AVIF 는 인코딩이 WebP 보다 몇 배 느려 기본값에서는 제외
+RENDITION_FORMATS = [fmt.strip() for fmt in os.environ.get("IMAGE_RENDITION_FORMATS", "webp").split(",") if fmt.strip()]
+ENCODE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 55, "speed": 8},
+}
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def rendition_object_name(original_name, name, fmt):
+    """원본 객체 이름에서 정해지는 렌디션 객체 이름 (같은 원본은 항상 같은 이름)"""
+    return f"{os.path.splitext(original_name)[0]}-{name}.{fmt}"
+
+
+def rendition_object_names(original_name):
+    """원본에 대해 만들어질 수 있는 모든 렌디션 객체 이름 (삭제용)"""
+    return [rendition_object_name(original_name, name, fmt) for name in RENDITION_WIDTHS for fmt in ENCODE_OPTIONS]
+
+
+def is_rendition_object_name(object_name):
+    """rendition_object_name() 으로 만든 이름인지 (원본 이미지 목록에서 제외용)"""
+    stem, fmt = os.path.splitext(object_name)
+    return fmt[1:] in ENCODE_OPTIONS and stem.rsplit("-", 1)[-1] in RENDITION_WIDTHS
+
+
+def enabled_formats():
+    """설정된 형식 중 이 Pillow 빌드가 인코딩할 수 있는 것만"""
+    return [fmt for fmt in RENDITION_FORMATS if fmt in ENCODE_OPTIONS and features.check(fmt)]
+
+
+def render_renditions(data, widths=None, formats=None):
+    """원본 이미지 bytes -> {렌디션 이름: {형식: bytes}} (디코딩할 수 없으면 PIL.UnidentifiedImageError / OSError)"""
+    widths = widths or RENDITION_WIDTHS
+    formats = formats or enabled_formats()
+    with Image.open(io.BytesIO(data)) as original:
+        if original.format == "JPEG":
+            # 가장 큰 렌디션 이상이 되는 최소 배율 (1/2, 1/4, 1/8) 로만 디코딩
+            largest = max(widths.values())
+            original.draft("RGB", (largest, largest * original.height // max(1, original.width)))
+        image = ImageOps.exif_transpose(original)  # GIF 는 첫 프레임
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info else "RGB")
+
+    renditions = {}
+    for name, width in sorted(widths.items(), key=lambda item: -item[1]):
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+        encoded = {}
+        for fmt in formats:
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt.upper(), **ENCODE_OPTIONS[fmt])
+            encoded[fmt] = buffer.getvalue()
+        renditions[name] = encoded
+    return renditions
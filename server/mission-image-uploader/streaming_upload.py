@@ -0,0 +1,68 @@
+"""요청 본문을 GCS resumable upload 로 바로 흘려보내는 스트리밍 업로드
+
+multipart 업로드는 Werkzeug 가 파일 전체를 메모리 / 임시 파일에 받아 둔 뒤
+다시 읽어 GCS 로 보내므로 모든 바이트가 두 번 이상 복사된다. 여기서는 원본
+이미지를 요청 본문 (Content-Type: image/png 등) 으로 받아 READ_SIZE 씩 읽고,
+BlobWriter 가 chunk_size 가 찰 때마다 한 청크씩 업로드한다. 업로드 한 건이
+잡는 메모리는 파일 크기와 관계없이 chunk_size + READ_SIZE 정도로 고정.
+
+중간에 실패하거나 크기 제한을 넘으면 BlobWriter 의 with 블록이 세션을
+종료 (terminate) 하므로 불완전한 객체는 남지 않는다.
+"""
+
+# GCS resumable upload 청크는 256 KiB 의 배수여야 함
+CHUNK_ALIGNMENT = 256 * 1024
+READ_SIZE = 64 * 1024
+
+# 파일 시그니처 -> Content-Type (확장자 대신 본문 앞부분으로 확인)
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+STREAMING_CONTENT_TYPES = {'image/png', 'image/jpeg', 'image/gif'}
+EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif'}
+
+
+class UploadRejected(ValueError):
+    """본문이 허용된 이미지가 아니거나 크기 제한을 넘음 (status 는 응답 코드)"""
+
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+def sniff_image_type(head):
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def aligned_chunk_size(chunk_size):
+    return max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+
+
+def stream_to_blob(blob, stream, declared_type, chunk_size, max_bytes, digest=None):
+    """stream 을 끝까지 읽어 blob 에 resumable upload - (업로드한 바이트 수, Content-Type) 반환
+
+    digest (hashlib 객체) 를 주면 같은 버퍼로 본문 해시도 계산 (콘텐츠 주소 저장용).
+    """
+    head = stream.read(READ_SIZE)
+    content_type = sniff_image_type(head)
+    if content_type is None or content_type != declared_type:
+        raise UploadRejected(f"본문이 {declared_type} 이미지가 아님")
+
+    size = 0
+    with blob.open("wb", chunk_size=aligned_chunk_size(chunk_size), content_type=content_type, ignore_flush=True) as writer:
+        block = head
+        while block:
+            size += len(block)
+            if size > max_bytes:
+                raise UploadRejected(f"이미지 파일 크기 제한 초과 ({max_bytes / 1024 / 1024:.0f}MB)", status=413)
+            writer.write(block)
+            if digest is not None:
+                digest.update(block)
+            block = stream.read(READ_SIZE)
+    return size, content_type
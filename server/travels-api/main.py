@@ -1,138 +1,148 @@
 import os
+import sys
 import json
-import jwt
+import base64
 import datetime
 import mysql.connector
-from flask import Flask, request, jsonify
-from functools import wraps
+from flask import Flask, request
+
+# Shared library (server/braves_common) - copied next to main.py on deploy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from braves_common import get_db_connection, token_required, json_response, make_entry_point
+from braves_common.etag import compute_etag, not_modified, tag
+from braves_common.cache import list_cache, user_scope, invalidate_lists
+from braves_common import image_objects
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 
-# --- Environment Variable Configuration ---
-db_host = os.environ.get("CLOUD_SQL_HOST")
-db_user = os.environ.get("CLOUD_SQL_USER")
-db_password = os.environ.get("CLOUD_SQL_PASSWORD")
-db_name = os.environ.get("CLOUD_SQL_DATABASE")
+# Bucket of the mission completion images (mission-image-uploader); a deleted
+# travel's images lose their references so that uploader's sweep deletes them
+GCS_BUCKET_NAME = os.environ.get("GCS_BUCKET_NAME")
 
-# JWT Validation Configuration
-JWT_SECRET = os.environ.get("JWT_SECRET")
-JWT_ALGORITHM = "HS256"
+# --- API Routes (Registered with Flask app) ---
 
-# --- Database Connection ---
-def get_db_connection():
-    """Function to connect to Cloud SQL"""
-    conn = None
+# --- 여행 리스트 필드 / 페이지네이션 ---
+# API 필드 -> (SELECT 컬럼, 응답 값 변환). 미션 개수는 travels 의 카운터 컬럼 (braves_common/mission_counters.py)
+TRAVEL_FIELDS = {
+    "id": ("t.id", lambda t: t['id']),
+    "title": ("t.title", lambda t: t['title']),
+    "destination": ("t.destination", lambda t: t['destination']),
+    "startDate": ("t.start_date", lambda t: t['start_date'].strftime('%Y-%m-%d') if t['start_date'] else None),
+    "endDate": ("t.end_date", lambda t: t['end_date'].strftime('%Y-%m-%d') if t['end_date'] else None),
+    "personCount": ("t.person_count", lambda t: t['person_count']),
+    "braveLevel": ("t.brave_level", lambda t: t['brave_level']),
+    "missionFrequency": ("t.mission_frequency", lambda t: t['mission_frequency']),
+    "totalMissions": ("t.total_missions", lambda t: int(t['total_missions'])),
+    "completedMissions": ("t.completed_missions", lambda t: int(t['completed_missions'])),
+    "createdAt": ("t.created_at", lambda t: t['created_at'].isoformat() if t['created_at'] else None),
+    "updatedAt": ("t.updated_at", lambda t: t['updated_at'].isoformat() if t['updated_at'] else None),
+}
+TRAVEL_PAGE_MAX_LIMIT = 100
+
+def _encode_travel_cursor(travel):
+    """다음 페이지 커서: 마지막 행의 (start_date, id) 를 불투명 문자열로"""
+    raw = json.dumps([travel['start_date'].isoformat(), travel['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_travel_cursor(cursor_str):
     try:
-        conn = mysql.connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-            port=3306
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"MySQL connection error: {err}")
-        return None
-
-# --- JWT Authentication Decorator ---
-def token_required(f):
-    """Decorator to validate access tokens (issued by other services)"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({"code": 401, "success": False, "msg": "Invalid token format. Use 'Bearer <token>' format."}), 401
-
-        if not token:
-            return jsonify({"code": 401, "success": False, "msg": "Authentication token is required in the header. ('Authorization: Bearer <token>')"}), 401
-
-        if not JWT_SECRET:
-            print("CRITICAL: JWT_SECRET environment variable is not set.")
-            return jsonify({"code": 500, "success": False, "msg": "Server configuration error (JWT Secret missing)"}), 500
-
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            current_user_id = payload['userId']
-        except jwt.ExpiredSignatureError:
-            return jsonify({"code": 401, "success": False, "msg": "Token has expired."}), 401
-        except jwt.InvalidTokenError as e:
-            print(f"Invalid Token Error during decode: {e}")
-            return jsonify({"code": 401, "success": False, "msg": f"Invalid token: {e}"}), 401
-        except Exception as e:
-            print(f"Token decoding error: {type(e).__name__} - {e}")
-            return jsonify({"code": 401, "success": False, "msg": "An error occurred while processing the token."}), 401
-
-        return f(*args, current_user_id=current_user_id, **kwargs)
-    return decorated
-
-# --- API Routes (Registered with Flask app) ---
+        start_date_str, travel_id = json.loads(base64.urlsafe_b64decode(cursor_str + '=' * (-len(cursor_str) % 4)))
+        return datetime.date.fromisoformat(start_date_str), int(travel_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def _parse_travel_list_args(args):
+    """(fields, limit, after) - 파라미터가 없으면 전체 필드 / 전체 목록 (기존 클라이언트 호환)"""
+    fields = list(TRAVEL_FIELDS)
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in TRAVEL_FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else "fields is empty")
+    limit = None
+    if 'limit' in args or 'cursor' in args:
+        limit = int(args.get('limit', 20))
+        if not (1 <= limit <= TRAVEL_PAGE_MAX_LIMIT): raise ValueError(f"limit must be between 1 and {TRAVEL_PAGE_MAX_LIMIT}")
+    after = _decode_travel_cursor(args['cursor']) if args.get('cursor') else None
+    return fields, limit, after
 
 # 로그인한 사용자의 여행 리스트 조회 (미션 요약 정보 포함)
 @app.route('/api/travels', methods=['GET'])
 @token_required
 def get_travels(current_user_id):
-    """로그인한 사용자의 여행 리스트를 조회 (각 여행별 미션 총 개수 및 완료 개수 포함)"""
+    """로그인한 사용자의 여행 리스트를 조회 (각 여행별 미션 총 개수 및 완료 개수 포함)
+
+    선택 파라미터: limit (1~100), cursor (이전 응답의 nextCursor), fields (쉼표 구분 필드 목록).
+    (start_date, id) 내림차순 키셋 페이지네이션 - 페이지 위치와 관계없이 인덱스 범위 스캔 한 번.
+    ETag / If-None-Match 지원 (변경이 없으면 304), 사용자별 읽기 캐시 (braves_common/cache.py).
+    """
     user_id = current_user_id
+    try:
+        fields, limit, after = _parse_travel_list_args(request.args)
+    except ValueError as ve:
+        return json_response({"code": 400, "success": False, "msg": f"잘못된 파라미터: {ve}"}), 400
+
     conn = None
     cursor = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "데이터베이스 연결 실패"}), 500
-        cursor = conn.cursor(dictionary=True)
 
-        # travels 테이블과 missions 테이블을 LEFT JOIN하여 미션 관련 집계 데이터 가져오기
-        sql_query = """
-            SELECT
-                t.id, t.title, t.start_date, t.end_date, t.destination, t.person_count,
-                t.brave_level, t.mission_frequency, t.created_at, t.updated_at,
-                COUNT(m.id) AS total_missions,
-                COALESCE(SUM(CASE WHEN m.is_completed = TRUE THEN 1 ELSE 0 END), 0) AS completed_missions
-            FROM travels t
-            LEFT JOIN missions m ON t.id = m.travel_id
-            WHERE t.user_id = %s
-            GROUP BY t.id, t.title, t.start_date, t.end_date, t.destination, t.person_count,
-                     t.brave_level, t.mission_frequency, t.created_at, t.updated_at
-            ORDER BY t.start_date DESC
-        """
-        cursor.execute(sql_query, (user_id,))
+    def load_travel_list():
+        """캐시 미스 시 MySQL 에서 목록 (한 페이지) 조회, ETag 는 응답 내용의 해시"""
+        nonlocal conn, cursor
+        if conn is None:
+            conn = get_db_connection()
+            if not conn:
+                raise mysql.connector.errors.InterfaceError("데이터베이스 연결 실패")
+            cursor = conn.cursor(dictionary=True)
+
+        # 커서 계산용 id, start_date 는 항상 조회
+        columns = ["t.id", "t.start_date"] + [TRAVEL_FIELDS[field][0] for field in fields
+                                               if TRAVEL_FIELDS[field][0] not in ("t.id", "t.start_date")]
+        sql_query = f"SELECT {', '.join(columns)} FROM travels t WHERE t.user_id = %s"
+        params = [user_id]
+        if after:
+            sql_query += " AND (t.start_date < %s OR (t.start_date = %s AND t.id < %s))"
+            params += [after[0], after[0], after[1]]
+        sql_query += " ORDER BY t.start_date DESC, t.id DESC"
+        if limit is not None:
+            sql_query += " LIMIT %s"
+            params.append(limit + 1) # 다음 페이지 존재 여부 확인용 1행 추가
+        cursor.execute(sql_query, tuple(params))
         travels_raw = cursor.fetchall()
 
-        travel_list = []
-        for travel in travels_raw:
-            travel_list.append({
-                "id": travel['id'],
-                "title": travel['title'],
-                "destination": travel['destination'],
-                "startDate": travel['start_date'].strftime('%Y-%m-%d') if travel['start_date'] else None,
-                "endDate": travel['end_date'].strftime('%Y-%m-%d') if travel['end_date'] else None,
-                "personCount": travel['person_count'],
-                "braveLevel": travel['brave_level'],
-                "missionFrequency": travel['mission_frequency'],
-                "totalMissions": int(travel['total_missions']),  
-                "completedMissions": int(travel['completed_missions']),  
-                "createdAt": travel['created_at'].isoformat() if travel['created_at'] else None,
-                "updatedAt": travel['updated_at'].isoformat() if travel['updated_at'] else None
-            })
-
-        return jsonify({
-            "code": 200, "success": True, "msg": "여행 리스트 및 미션 요약 정보 조회 성공", 
+        has_more = limit is not None and len(travels_raw) > limit
+        if has_more:
+            travels_raw = travels_raw[:limit]
+
+        formatters = [(field, TRAVEL_FIELDS[field][1]) for field in fields]
+        travel_list = [{field: formatter(travel) for field, formatter in formatters} for travel in travels_raw]
+
+        payload = {
+            "code": 200, "success": True, "msg": "여행 리스트 및 미션 요약 정보 조회 성공",
             "travelList": travel_list
-        }), 200
+        }
+        if limit is not None:
+            payload["hasMore"] = has_more
+            payload["nextCursor"] = _encode_travel_cursor(travels_raw[-1]) if has_more else None
+        # 반환하는 행만으로 계산 - 사용자의 전체 여행을 훑는 버전 쿼리 없이 키셋 페이지 비용 그대로
+        return {"etag": compute_etag("travels", user_id, payload), "payload": payload}
+
+    try:
+        # 사용자별 목록 캐시 (여행 / 미션 쓰기 경로에서 무효화) - 히트 시 DB 연결 없이 응답
+        variant = compute_etag(fields, limit, after)
+        listing, _ = list_cache.get().get_or_load(user_scope(user_id), variant, load_travel_list)
+        cached = not_modified(listing['etag'])
+        if cached:
+            return cached
+        return tag(json_response(listing['payload']), listing['etag']), 200
     except mysql.connector.Error as err:
         print(f"MySQL 쿼리 오류 [GET /travels with mission summary]: {err}") 
-        return jsonify({"code": 500, "success": False, "msg": "DB 쿼리 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB 쿼리 오류"}), 500
     except Exception as e: 
         print(f"여행 리스트 조회 중 일반 오류 발생 [GET /travels with mission summary]: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
+        return json_response({"code": 500, "success": False, "msg": "서버 내부 오류"}), 500
     finally:
         if cursor: 
             cursor.close()
@@ -145,14 +155,14 @@ def get_travels(current_user_id):
 def create_travel(current_user_id):
     """Adds new travel information for the logged-in user"""
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON format required"}), 400
+        return json_response({"code": 400, "success": False, "msg": "JSON format required"}), 400
     data = request.get_json()
     user_id = current_user_id
 
     required_fields = ['title', 'startDate', 'endDate', 'destination', 'personCount', 'braveLevel', 'missionFrequency']
     if not all(field in data for field in required_fields):
         missing = [field for field in required_fields if field not in data]
-        return jsonify({"code": 400, "success": False, "msg": f"Missing required fields: {', '.join(missing)}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"Missing required fields: {', '.join(missing)}"}), 400
 
     try:
         title = data['title']
@@ -168,14 +178,14 @@ def create_travel(current_user_id):
         if not (1 <= brave_level <= 5): raise ValueError("braveLevel must be between 1 and 5")
         if not (0 <= mission_frequency <= 100): raise ValueError("missionFrequency must be between 0 and 100")
     except (ValueError, TypeError) as ve:
-        return jsonify({"code": 400, "success": False, "msg": f"Input value error: {ve}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"Input value error: {ve}"}), 400
 
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Database connection failed"}), 500
+            return json_response({"code": 500, "success": False, "msg": "Database connection failed"}), 500
         cursor = conn.cursor()
         sql = """
             INSERT INTO travels (user_id, title, start_date, end_date, destination,
@@ -186,28 +196,39 @@ def create_travel(current_user_id):
                              person_count, brave_level, mission_frequency))
         conn.commit()
         travel_id = cursor.lastrowid
-        return jsonify({"code": 201, "success": True, "msg": "Travel information added successfully", "travelId": travel_id}), 201
+        invalidate_lists(user_id)
+        return json_response({"code": 201, "success": True, "msg": "Travel information added successfully", "travelId": travel_id}), 201
     except mysql.connector.Error as err:
         print(f"MySQL INSERT error [POST /travels]: {err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB processing error"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB processing error"}), 500
     finally:
         if cursor: cursor.close()
         if conn and conn.is_connected(): conn.close()
 
+def _travel_write_error(cursor, travel_id, user_id, forbidden_msg):
+    """After a conditional UPDATE/DELETE changed no row: 404 / 403 response, or None if the travel is the user's"""
+    cursor.execute("SELECT user_id FROM travels WHERE id = %s", (travel_id,))
+    travel = cursor.fetchone()
+    if not travel:
+        return json_response({"code": 404, "success": False, "msg": "Travel information not found"}), 404
+    if travel['user_id'] != user_id:
+        return json_response({"code": 403, "success": False, "msg": forbidden_msg}), 403
+    return None
+
 # Update specific travel information for the logged-in user
 @app.route('/api/travels/<int:travel_id>', methods=['PUT'])
 @token_required
 def update_travel(current_user_id, travel_id):
     """Modifies specific travel information for the logged-in user"""
     if not request.is_json:
-        return jsonify({"code": 400, "success": False, "msg": "JSON format required"}), 400
+        return json_response({"code": 400, "success": False, "msg": "JSON format required"}), 400
     data = request.get_json()
     user_id = current_user_id
 
     required_fields = ['title', 'startDate', 'endDate', 'destination', 'personCount', 'braveLevel', 'missionFrequency']
     if not all(field in data for field in required_fields):
         missing = [field for field in required_fields if field not in data]
-        return jsonify({"code": 400, "success": False, "msg": f"Missing required fields: {', '.join(missing)}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"Missing required fields: {', '.join(missing)}"}), 400
 
     try:
         title = data['title']
@@ -223,43 +244,38 @@ def update_travel(current_user_id, travel_id):
         if not (1 <= brave_level <= 5): raise ValueError("braveLevel must be between 1 and 5")
         if not (0 <= mission_frequency <= 100): raise ValueError("missionFrequency must be between 0 and 100")
     except (ValueError, TypeError) as ve:
-        return jsonify({"code": 400, "success": False, "msg": f"Input value error: {ve}"}), 400
+        return json_response({"code": 400, "success": False, "msg": f"Input value error: {ve}"}), 400
 
     conn = None
     cursor = None
-    cursor_update = None
     try:
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Database connection failed"}), 500
-        cursor = conn.cursor(dictionary=True) 
-
-        cursor.execute("SELECT user_id FROM travels WHERE id = %s", (travel_id,))
-        travel = cursor.fetchone()
-
-        if not travel:
-            return jsonify({"code": 404, "success": False, "msg": "Travel information not found"}), 404
-        if travel['user_id'] != user_id:
-             return jsonify({"code": 403, "success": False, "msg": "No permission to modify"}), 403
+            return json_response({"code": 500, "success": False, "msg": "Database connection failed"}), 500
+        cursor = conn.cursor(dictionary=True)
 
+        # Ownership is part of the WHERE clause; the probe below only runs when no row changed
         sql = """
             UPDATE travels SET title = %s, start_date = %s, end_date = %s, destination = %s,
             person_count = %s, brave_level = %s, mission_frequency = %s, updated_at = NOW()
             WHERE id = %s AND user_id = %s
         """
-        cursor_update = conn.cursor()
-        cursor_update.execute(sql, (title, start_date_str, end_date_str, destination,
-                                     person_count, brave_level, mission_frequency,
-                                     travel_id, user_id))
+        cursor.execute(sql, (title, start_date_str, end_date_str, destination,
+                             person_count, brave_level, mission_frequency,
+                             travel_id, user_id))
+        if cursor.rowcount == 0:
+            error = _travel_write_error(cursor, travel_id, user_id, "No permission to modify")
+            if error:
+                return error
         conn.commit()
+        invalidate_lists(user_id)
 
-        return jsonify({"code": 200, "success": True, "msg": f"Travel (ID: {travel_id}) updated successfully"}), 200
+        return json_response({"code": 200, "success": True, "msg": f"Travel (ID: {travel_id}) updated successfully"}), 200
     except mysql.connector.Error as err:
         print(f"MySQL UPDATE error [PUT /travels/{travel_id}]: {err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB processing error"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB processing error"}), 500
     finally:
         if cursor: cursor.close()
-        if cursor_update: cursor_update.close()
         if conn and conn.is_connected(): conn.close()
 
 # Delete specific travel information for the logged-in user
@@ -270,41 +286,47 @@ def delete_travel(current_user_id, travel_id):
     user_id = current_user_id
     conn = None
     cursor = None
-    cursor_delete = None
     try:
         conn = get_db_connection()
         if not conn:
-            return jsonify({"code": 500, "success": False, "msg": "Database connection failed"}), 500
-        cursor = conn.cursor(dictionary=True) 
-
-        cursor.execute("SELECT user_id FROM travels WHERE id = %s", (travel_id,))
-        travel = cursor.fetchone()
-
-        if not travel:
-            return jsonify({"code": 404, "success": False, "msg": "Travel information not found"}), 404
-        if travel['user_id'] != user_id:
-             return jsonify({"code": 403, "success": False, "msg": "No permission to delete"}), 403
-
-        cursor_delete = conn.cursor()
-        cursor_delete.execute("DELETE FROM travels WHERE id = %s AND user_id = %s", (travel_id, user_id))
-        conn.commit()
-        deleted_count = cursor_delete.rowcount
+            return json_response({"code": 500, "success": False, "msg": "Database connection failed"}), 500
+        cursor = conn.cursor(dictionary=True)
 
+        # Completion images of the missions that go with the travel (locked until the delete commits)
+        image_prefix = f"https://storage.googleapis.com/{GCS_BUCKET_NAME}/"
+        image_urls = []
+        if GCS_BUCKET_NAME:
+            cursor.execute(
+                """SELECT m.completion_image FROM missions m JOIN travels t ON m.travel_id = t.id
+                   WHERE t.id = %s AND t.user_id = %s AND m.completion_image LIKE CONCAT(%s, '%%') FOR UPDATE""",
+                (travel_id, user_id, image_prefix)
+            )
+            image_urls = [row['completion_image'] for row in cursor.fetchall()]
+
+        cursor.execute("DELETE FROM travels WHERE id = %s AND user_id = %s", (travel_id, user_id))
+        deleted_count = cursor.rowcount
         if deleted_count == 0:
-             print(f"Warning: Delete for ID {travel_id} affected 0 rows after ownership check.")
-             return jsonify({"code": 404, "success": False, "msg": "Travel information to delete not found or already deleted"}), 404
+            error = _travel_write_error(cursor, travel_id, user_id, "No permission to delete")
+            return error or (json_response({"code": 404, "success": False, "msg": "Travel information to delete not found or already deleted"}), 404)
+        # Drop the references in the same transaction; the objects are deleted by the uploader's sweep_image_objects
+        for image_url in image_urls:
+            image_objects.release(cursor, image_url[len(image_prefix):])
+        conn.commit()
+        invalidate_lists(user_id)
 
-        return jsonify({"code": 200, "success": True, "msg": f"Travel (ID: {travel_id}) deleted successfully"}), 200
+        return json_response({"code": 200, "success": True, "msg": f"Travel (ID: {travel_id}) deleted successfully"}), 200
     except mysql.connector.Error as err:
         print(f"MySQL DELETE error [DELETE /travels/{travel_id}]: {err}")
-        return jsonify({"code": 500, "success": False, "msg": "DB processing error"}), 500
+        return json_response({"code": 500, "success": False, "msg": "DB processing error"}), 500
     finally:
         if cursor: cursor.close()
-        if cursor_delete: cursor_delete.close()
         if conn and conn.is_connected(): conn.close()
 
+# Read-through cache statistics (hit ratio, age of served entries, sampled staleness)
+@app.route('/api/cache-stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user_id):
+    return json_response({"code": 200, "success": True, "listCache": list_cache.get().stats()}), 200
+
 # --- Cloud Functions Entry Point Function ---
-def main(request):
-    """Entry point function for Cloud Functions HTTP trigger. Forwards request to the Flask app."""
-    with app.request_context(request.environ):
-        return app.full_dispatch_request()
\ No newline at end of file
+main = make_entry_point(app)